@@ -1,8 +1,10 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory, make_response
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory, make_response, Response, stream_with_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from dateutil.relativedelta import relativedelta
 import os
 import json
@@ -10,14 +12,44 @@ import logging
 import traceback
 from logging.handlers import RotatingFileHandler
 from enum import Enum
-from sqlalchemy import inspect
+from sqlalchemy import inspect, insert, event, exc, Table
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.util import find_tables
 import yfinance as yf
 import re
+import click
+import csv
+import io
+import zipfile
+import zlib
+import hashlib
+import threading
+import time
+import uuid
+import base64
+import sqlite3
+import tempfile
+import mimetypes
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+from itertools import islice
+from functools import wraps
+from werkzeug.security import safe_join
+try:
+    import brotli
+except ImportError:  # 未インストールならgzipのみで圧縮する
+    brotli = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///lifeplan.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('LIFEPLAN_DATABASE_URI', 'sqlite:///lifeplan.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 設定するとユーザーのデータをユーザー毎のSQLiteファイルに保存する（相対パスはinstanceフォルダ基準）
+app.config['TENANT_DATABASE_DIR'] = os.environ.get('LIFEPLAN_TENANT_DATABASE_DIR')
 
 # セッション設定（アプリ対応）
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)  # 30日間有効
@@ -38,6 +70,144 @@ file_handler.setLevel(logging.ERROR)
 app.logger.addHandler(file_handler)
 app.logger.setLevel(logging.INFO)
 
+# レスポンス圧縮
+# 許可したContent-Typeで一定サイズ以上のレスポンスを、Accept-Encodingに応じてbrotliかgzipで圧縮する
+# ストリーミングのレスポンスはチャンク毎にフラッシュして逐次送信を保つ
+# 静的ファイルは起動時に .gz / .br を作っておき、リクエスト毎には圧縮しない
+COMPRESS_MIN_SIZE = 1024  # バイト
+COMPRESS_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+COMPRESS_MIMETYPES = frozenset([
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson',
+    'application/xml', 'image/svg+xml',
+])
+COMPRESS_ENCODINGS = (('br', '.br'), ('gzip', '.gz')) if brotli else (('gzip', '.gz'),)
+PRECOMPRESS_STATIC_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html')
+
+def accepted_encodings():
+    """クライアントが受け付ける圧縮形式を優先順に返す"""
+    accept = request.accept_encodings
+    return [(encoding, suffix) for encoding, suffix in COMPRESS_ENCODINGS if accept.quality(encoding) > 0]
+
+def compress_bytes(data, encoding, best=False):
+    """best=Trueは事前圧縮用（時間をかけて最大圧縮する）"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else COMPRESS_BROTLI_QUALITY)
+    compressor = zlib.compressobj(9 if best else COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits=31でgzip形式
+    return compressor.compress(data) + compressor.flush()
+
+def compress_stream(chunks, encoding):
+    """チャンク毎に圧縮してフラッシュする（受け取った分はすぐクライアントに届く）"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        compress = lambda chunk: compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        compress = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            compressed = compress(chunk)
+            if compressed:
+                yield compressed
+        yield finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+@app.after_request
+def compress_response(response):
+    # send_fileのレスポンス（静的ファイル等）は圧縮済みファイルの配信に任せる
+    if (response.direct_passthrough or request.method == 'HEAD'
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encodings = accepted_encodings()
+    if not encodings:
+        return response
+    encoding = encodings[0][0]
+    
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    
+    # 圧縮後は元のバイト列と一致しないため、強いETagは弱いETagにする
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def precompress_static_files(force=False):
+    """静的ファイルの .gz / .br を作る（元ファイルより古いものだけ作り直す）。作ったファイル数を返す"""
+    created = 0
+    for root, _, filenames in os.walk(app.static_folder):
+        for filename in filenames:
+            if not filename.endswith(PRECOMPRESS_STATIC_EXTENSIONS):
+                continue
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            if stat.st_size < COMPRESS_MIN_SIZE:
+                continue
+            data = None
+            for encoding, suffix in COMPRESS_ENCODINGS:
+                target = path + suffix
+                if not force and os.path.exists(target) and os.stat(target).st_mtime >= stat.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress_bytes(data, encoding, best=True)
+                # 複数ワーカーが同時に起動しても壊れたファイルを配信しないよう、一時ファイルから置き換える
+                fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.precompress-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(compressed)
+                os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+                os.replace(tmp_path, target)
+                created += 1
+    return created
+
+def send_static_file_compressed(filename):
+    """圧縮済みファイルがあればそれを返す静的ファイル配信（Flask標準のstaticエンドポイントを置き換える）"""
+    path = safe_join(app.static_folder, filename)
+    if path is not None and os.path.isfile(path):
+        source_mtime = os.stat(path).st_mtime
+        for encoding, suffix in accepted_encodings():
+            compressed_path = path + suffix
+            if not os.path.isfile(compressed_path) or os.stat(compressed_path).st_mtime < source_mtime:
+                continue
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype,
+                                           max_age=app.get_send_file_max_age(filename))
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+    response = app.send_static_file(filename)
+    if path is not None and os.path.exists(path + COMPRESS_ENCODINGS[-1][1]):
+        response.vary.add('Accept-Encoding')
+    return response
+
+app.view_functions['static'] = send_static_file_compressed
+
+@app.cli.command('precompress-static')
+@click.option('--force', is_flag=True, help='既存の圧縮済みファイルも作り直す')
+def precompress_static_command(force):
+    """静的ファイルの圧縮済みファイル（.gz / .br）を作る"""
+    created = precompress_static_files(force=force)
+    click.echo(f'{created}件の圧縮済みファイルを作成しました')
+
 # 404エラーハンドラー（Not Found専用）
 @app.errorhandler(404)
 def handle_not_found(e):
@@ -113,11 +283,58 @@ URL: {request.url}
     # 通常のWebページの場合
     return render_template('error.html', error=str(e) if app.debug else 'Internal Server Error'), 500
 
-db = SQLAlchemy(app)
+class TenantSession(FlaskSQLAlchemySession):
+    """テナントモードではユーザーデータのテーブルをログイン中のユーザーのファイルに振り分けるセッション"""
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and tenant_mode_enabled() and _uses_tenant_tables(mapper, clause):
+            user_id = current_tenant_id()
+            if user_id is not None:
+                # ファイルは書き込み時にだけ作る。ファイルのないユーザーの読み取りは共有ファイル（行がなく空）を読む
+                writing = self._flushing or (clause is not None and clause.is_dml)
+                engine = tenant_engine(user_id, create=writing)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+    
+    def commit(self):
+        # 冪等性キー付きのリクエストでは、ビューのコミットをフラッシュに留めて保存するレスポンスと一緒にコミットする
+        if self.info.get('defer_commit'):
+            self.flush()
+            return
+        super().commit()
+
+db = SQLAlchemy(app, session_options={'class_': TenantSession})
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# 金額は円単位の整数で保存する（浮動小数点の誤差で合計や残高比較がずれないようにする）
+def to_yen(value):
+    """金額を円単位の整数にする（小数は四捨五入、変換できない値はValueError）"""
+    if isinstance(value, bool):
+        raise ValueError(f'金額が不正です: {value!r}')
+    if isinstance(value, int):
+        return value
+    try:
+        amount = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError(f'金額が不正です: {value!r}')
+    if not amount.is_finite():
+        raise ValueError(f'金額が不正です: {value!r}')
+    return int(amount.quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+class Yen(db.TypeDecorator):
+    """円単位の金額型（INTEGERで保存し、int で読み書きする）"""
+    impl = db.Integer
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_yen(value)
+    
+    def process_result_value(self, value, dialect):
+        # 移行前のREAL値も整数で返す
+        return None if value is None else to_yen(value)
+
 # Enums for choices
 class ResidenceType(Enum):
     RENTAL = '賃貸'
@@ -185,40 +402,40 @@ class LivingExpenses(db.Model):
     inflation_rate = db.Column(db.Float, default=2.0)  # デフォルト2%
     
     # 食費
-    food_home = db.Column(db.Float, default=0)
-    food_outside = db.Column(db.Float, default=0)
+    food_home = db.Column(Yen, default=0)
+    food_outside = db.Column(Yen, default=0)
     
     # 光熱費
-    utility_electricity = db.Column(db.Float, default=0)
-    utility_gas = db.Column(db.Float, default=0)
-    utility_water = db.Column(db.Float, default=0)
+    utility_electricity = db.Column(Yen, default=0)
+    utility_gas = db.Column(Yen, default=0)
+    utility_water = db.Column(Yen, default=0)
     
     # 通信費
-    subscription_services = db.Column(db.Float, default=0)
-    internet = db.Column(db.Float, default=0)
-    phone = db.Column(db.Float, default=0)
+    subscription_services = db.Column(Yen, default=0)
+    internet = db.Column(Yen, default=0)
+    phone = db.Column(Yen, default=0)
     
     # 日用品
-    household_goods = db.Column(db.Float, default=0)
-    hygiene = db.Column(db.Float, default=0)
+    household_goods = db.Column(Yen, default=0)
+    hygiene = db.Column(Yen, default=0)
     
     # 被服・美容
-    clothing = db.Column(db.Float, default=0)
-    beauty = db.Column(db.Float, default=0)
+    clothing = db.Column(Yen, default=0)
+    beauty = db.Column(Yen, default=0)
     
     # 子供費用
-    child_food = db.Column(db.Float, default=0)      # 子供の食費
-    child_clothing = db.Column(db.Float, default=0)  # 子供の衣服費
-    child_medical = db.Column(db.Float, default=0)   # 子供の医療費
-    child_other = db.Column(db.Float, default=0)     # 子供のその他費用
+    child_food = db.Column(Yen, default=0)      # 子供の食費
+    child_clothing = db.Column(Yen, default=0)  # 子供の衣服費
+    child_medical = db.Column(Yen, default=0)   # 子供の医療費
+    child_other = db.Column(Yen, default=0)     # 子供のその他費用
     
     # その他
-    transport = db.Column(db.Float, default=0)
-    entertainment = db.Column(db.Float, default=0)
-    pet_costs = db.Column(db.Float, default=0)
-    other_expenses = db.Column(db.Float, default=0)
+    transport = db.Column(Yen, default=0)
+    entertainment = db.Column(Yen, default=0)
+    pet_costs = db.Column(Yen, default=0)
+    other_expenses = db.Column(Yen, default=0)
     
-    monthly_total_amount = db.Column(db.Float, default=0)
+    monthly_total_amount = db.Column(Yen, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 # 教育費統合管理用の新しいモデル
@@ -243,6 +460,10 @@ class EducationPlans(db.Model):
 
 class EducationExpenses(db.Model):
     __tablename__ = 'education_expenses'
+    __table_args__ = (
+        # 教育プラン毎の段階の取得・集計用
+        db.Index('ix_education_expenses_plan_id', 'education_plan_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     education_plan_id = db.Column(db.Integer, db.ForeignKey('education_plans.id'), nullable=False)  # 統合IDへの参照
@@ -259,7 +480,7 @@ class EducationExpenses(db.Model):
     stage = db.Column(db.String(20), nullable=False)  # 'kindergarten', 'elementary', 'junior', 'high', 'college'
     stage_type = db.Column(db.String(50), nullable=False)  # 具体的なタイプ
     
-    monthly_amount = db.Column(db.Float, default=0)
+    monthly_amount = db.Column(Yen, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # 統合計画への関係
@@ -277,23 +498,23 @@ class HousingExpenses(db.Model):
     residence_type = db.Column(db.Enum(ResidenceType), nullable=False)
     
     # 賃貸用
-    rent_monthly = db.Column(db.Float, default=0)
+    rent_monthly = db.Column(Yen, default=0)
     
     # 持家用
-    mortgage_monthly = db.Column(db.Float, default=0)
-    property_tax_monthly = db.Column(db.Float, default=0)
-    management_fee_monthly = db.Column(db.Float, default=0)
-    repair_reserve_monthly = db.Column(db.Float, default=0)
-    fire_insurance_monthly = db.Column(db.Float, default=0)
+    mortgage_monthly = db.Column(Yen, default=0)
+    property_tax_monthly = db.Column(Yen, default=0)
+    management_fee_monthly = db.Column(Yen, default=0)
+    repair_reserve_monthly = db.Column(Yen, default=0)
+    fire_insurance_monthly = db.Column(Yen, default=0)
     
     # ローン計算用
-    purchase_price = db.Column(db.Float, default=0)
-    down_payment = db.Column(db.Float, default=0)
+    purchase_price = db.Column(Yen, default=0)
+    down_payment = db.Column(Yen, default=0)
     loan_interest_rate = db.Column(db.Float, default=0)
     loan_term_years = db.Column(db.Integer, default=0)
     repayment_method = db.Column(db.Enum(RepaymentMethod), default=RepaymentMethod.EQUAL_PAYMENT)
     
-    monthly_total_amount = db.Column(db.Float, default=0)
+    monthly_total_amount = db.Column(Yen, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class InsuranceExpenses(db.Model):
@@ -305,22 +526,22 @@ class InsuranceExpenses(db.Model):
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     
-    medical_insurance = db.Column(db.Float, default=0)
-    cancer_insurance = db.Column(db.Float, default=0)
-    life_insurance = db.Column(db.Float, default=0)
-    income_protection = db.Column(db.Float, default=0)
-    accident_insurance = db.Column(db.Float, default=0)
-    liability_insurance = db.Column(db.Float, default=0)
-    fire_insurance = db.Column(db.Float, default=0)
-    long_term_care_insurance = db.Column(db.Float, default=0)
-    other_insurance = db.Column(db.Float, default=0)
+    medical_insurance = db.Column(Yen, default=0)
+    cancer_insurance = db.Column(Yen, default=0)
+    life_insurance = db.Column(Yen, default=0)
+    income_protection = db.Column(Yen, default=0)
+    accident_insurance = db.Column(Yen, default=0)
+    liability_insurance = db.Column(Yen, default=0)
+    fire_insurance = db.Column(Yen, default=0)
+    long_term_care_insurance = db.Column(Yen, default=0)
+    other_insurance = db.Column(Yen, default=0)
     
     insured_person = db.Column(db.String(100))
     insurance_company = db.Column(db.String(100))
     insurance_term_years = db.Column(db.Integer, default=0)
     renew_type = db.Column(db.String(50))
     
-    monthly_total_amount = db.Column(db.Float, default=0)
+    monthly_total_amount = db.Column(Yen, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class EventExpenses(db.Model):
@@ -333,7 +554,7 @@ class EventExpenses(db.Model):
     end_year = db.Column(db.Integer, nullable=False)
     
     category = db.Column(db.Enum(EventCategory), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Yen, nullable=False)
     
     # 繰り返し設定
     is_recurring = db.Column(db.Boolean, default=False)  # 繰り返しかどうか
@@ -349,9 +570,9 @@ class SalaryIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_bonus = db.Column(db.Float, default=0)  # 年間ボーナス額
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_bonus = db.Column(Yen, default=0)  # 年間ボーナス額
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     
@@ -360,7 +581,7 @@ class SalaryIncomes(db.Model):
     
     # 年間収入上限設定
     has_cap = db.Column(db.Boolean, default=False)  # 上限設定の有無
-    annual_income_cap = db.Column(db.Float, default=0)  # 年間収入上限金額
+    annual_income_cap = db.Column(Yen, default=0)  # 年間収入上限金額
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -370,8 +591,8 @@ class SidejobIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     
@@ -380,7 +601,7 @@ class SidejobIncomes(db.Model):
     
     # 年間収入上限設定
     has_cap = db.Column(db.Boolean, default=False)  # 上限設定の有無
-    annual_income_cap = db.Column(db.Float, default=0)  # 年間収入上限金額
+    annual_income_cap = db.Column(Yen, default=0)  # 年間収入上限金額
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -390,8 +611,8 @@ class BusinessIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     
@@ -400,7 +621,7 @@ class BusinessIncomes(db.Model):
     
     # 年間収入上限設定
     has_cap = db.Column(db.Boolean, default=False)  # 上限設定の有無
-    annual_income_cap = db.Column(db.Float, default=0)  # 年間収入上限金額
+    annual_income_cap = db.Column(Yen, default=0)  # 年間収入上限金額
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -410,8 +631,8 @@ class InvestmentIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     
@@ -426,8 +647,8 @@ class PensionIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -438,8 +659,8 @@ class OtherIncomes(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    monthly_amount = db.Column(db.Float, nullable=False)
-    annual_amount = db.Column(db.Float, nullable=False)
+    monthly_amount = db.Column(Yen, nullable=False)
+    annual_amount = db.Column(Yen, nullable=False)
     start_year = db.Column(db.Integer, nullable=False)
     end_year = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -458,6 +679,10 @@ class LifeplanSimulations(db.Model):
 
 class LifeplanExpenseLinks(db.Model):
     __tablename__ = 'lifeplan_expense_links'
+    __table_args__ = (
+        # プラン毎のリンクの取得・件数集計用
+        db.Index('ix_lifeplan_expense_links_lifeplan_id', 'lifeplan_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     lifeplan_id = db.Column(db.Integer, db.ForeignKey('lifeplan_simulations.id'), nullable=False)
     expense_type = db.Column(db.String(20), nullable=False)  # 'living', 'education', 'housing', 'insurance', 'event'
@@ -465,14 +690,198 @@ class LifeplanExpenseLinks(db.Model):
 
 class LifeplanIncomeLinks(db.Model):
     __tablename__ = 'lifeplan_income_links'
+    __table_args__ = (
+        # プラン毎のリンクの取得・件数集計用
+        db.Index('ix_lifeplan_income_links_lifeplan_id', 'lifeplan_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     lifeplan_id = db.Column(db.Integer, db.ForeignKey('lifeplan_simulations.id'), nullable=False)
     income_type = db.Column(db.String(20), nullable=False)  # 'salary', 'sidejob', 'business', 'investment', 'pension', 'other'
     income_id = db.Column(db.Integer, nullable=False)
 
+# 書き込みAPIの冪等性キー（Idempotency-Keyヘッダー）
+# 同じキーでの再送には保存しておいたレスポンスをそのまま返し、二重登録・二重送金を防ぐ
+IDEMPOTENCY_TTL = timedelta(hours=24)
+IDEMPOTENCY_LOCK_TIMEOUT = timedelta(seconds=60)  # 処理中のまま放置された予約を引き継ぐまでの時間
+IDEMPOTENCY_CLEANUP_EVERY = 500  # この件数の予約ごとに期限切れのキーを削除
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+        db.Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_path = db.Column(db.String(255), nullable=False)  # メソッドとパス（別のリクエストへの使い回しを検出）
+    status_code = db.Column(db.Integer)  # Nullは処理中
+    response_body = db.Column(db.Text)
+    content_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+def _reserve_idempotency_key(key, request_path):
+    """
+    キーを予約する（1回のINSERTで確認と予約を行う）。予約できればIDを、既にあればNoneを返す
+    コミットはしない（予約はビューの書き込み・レスポンスと同じトランザクションでコミットする）
+    """
+    now = datetime.utcnow()
+    statement = sqlite_insert(IdempotencyKey).values(
+        user_id=current_user.id, key=key, request_path=request_path,
+        created_at=now, expires_at=now + IDEMPOTENCY_TTL
+    ).on_conflict_do_nothing(index_elements=['user_id', 'key']).returning(IdempotencyKey.id)
+    return db.session.execute(statement).scalar()
+
+def _take_over_idempotency_key(record, request_path):
+    """期限切れ・放置された予約を引き継ぐ（他のリクエストが先に引き継いだ場合はNone、コミットはしない）"""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        db.update(IdempotencyKey)
+        .where(IdempotencyKey.id == record.id, IdempotencyKey.created_at == record.created_at)
+        .values(request_path=request_path, status_code=None, response_body=None, content_type=None,
+                created_at=now, expires_at=now + IDEMPOTENCY_TTL)
+        .execution_options(synchronize_session=False)
+    )
+    return record.id if result.rowcount else None
+
+def purge_expired_idempotency_keys():
+    db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def idempotent(view):
+    """
+    POSTにIdempotency-Keyヘッダーがあれば、同じキーでの再送に最初のレスポンスを再生する
+    処理中の再送は409、同じキーを別のリクエストに使った場合は422を返す
+    キーの予約・ビューの書き込み・保存するレスポンスは1回のコミットにまとめる
+    （途中で落ちても書き込みだけが残ることはなく、再送で二重に書き込まない）
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if request.method != 'POST' or not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'success': False, 'error': 'Idempotency-Keyが長すぎます'}), 400
+        
+        request_path = f'{request.method} {request.path}'
+        reserved_id = _reserve_idempotency_key(key, request_path)
+        if reserved_id is None:
+            record = IdempotencyKey.query.filter_by(user_id=current_user.id, key=key).first()
+            now = datetime.utcnow()
+            if record.expires_at < now or (record.status_code is None and record.created_at < now - IDEMPOTENCY_LOCK_TIMEOUT):
+                reserved_id = _take_over_idempotency_key(record, request_path)
+            elif record.request_path != request_path:
+                db.session.rollback()
+                return jsonify({'success': False, 'error': 'このIdempotency-Keyは別のリクエストで使用されています'}), 422
+            elif record.status_code is not None:
+                db.session.rollback()
+                replay = Response(record.response_body, status=record.status_code, content_type=record.content_type)
+                replay.headers['Idempotent-Replayed'] = 'true'
+                return replay
+            if reserved_id is None:
+                db.session.rollback()
+                return jsonify({'success': False, 'error': '同じリクエストを処理中です'}), 409
+        
+        db.session.info['defer_commit'] = True
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.info.pop('defer_commit', None)
+            db.session.rollback()
+            raise
+        db.session.info.pop('defer_commit', None)
+        
+        # サーバーエラーは予約ごと取り消し、再送で処理をやり直せるようにする
+        if response.status_code >= 500:
+            db.session.rollback()
+            return response
+        
+        values = dict(status_code=response.status_code,
+                      response_body=response.get_data(as_text=True),
+                      content_type=response.content_type)
+        result = db.session.execute(
+            db.update(IdempotencyKey).where(IdempotencyKey.id == reserved_id).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            # ビューがロールバックして予約が消えた場合は取り直す（他のリクエストが取っていれば書き込みを取り消す）
+            now = datetime.utcnow()
+            stored = db.session.execute(
+                sqlite_insert(IdempotencyKey).values(
+                    user_id=current_user.id, key=key, request_path=request_path,
+                    created_at=now, expires_at=now + IDEMPOTENCY_TTL, **values
+                ).on_conflict_do_nothing(index_elements=['user_id', 'key']).returning(IdempotencyKey.id)
+            ).scalar()
+            if stored is None:
+                db.session.rollback()
+                return jsonify({'success': False, 'error': '同じリクエストを処理中です'}), 409
+        db.session.commit()
+        
+        if reserved_id % IDEMPOTENCY_CLEANUP_EVERY == 0:
+            purge_expired_idempotency_keys()
+        return response
+    return wrapper
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """期限切れの冪等性キーを削除する"""
+    purge_expired_idempotency_keys()
+    click.echo('期限切れの冪等性キーを削除しました')
+
+# ログインユーザーのプロセス内キャッシュ
+# 認証済みの全リクエストでユーザーを読み直さないよう、軽量なユーザー情報を短時間だけ保持する
+# プロフィール・パスワードの変更とアカウント削除で無効化する（他プロセスでの変更はTTLで反映される）
+# versionは無効化の毎に進み、読み込み中に無効化があった結果は保存しない
+USER_CACHE_TTL = 30  # 秒
+USER_CACHE_MAX_SIZE = 10000
+_user_cache = {}
+_user_cache_state = {'version': 0}
+_user_cache_lock = threading.Lock()
+
+class CachedUser(UserMixin):
+    """Flask-Loginに渡す軽量なユーザー（パスワード等の行の内容が必要な処理は find_user で読み直す）"""
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+
+def invalidate_user_cache(user_id=None):
+    """ユーザーのキャッシュを捨てる（Noneなら全ユーザー）"""
+    with _user_cache_lock:
+        _user_cache_state['version'] += 1
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(user_id, None)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _user_cache_lock:
+        version = _user_cache_state['version']
+        cached = _user_cache.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    
+    user = find_user(user_id)
+    # 削除待ちのユーザーは既存のセッションからもログアウトさせる
+    if user is None or user.password_hash == PURGED_PASSWORD_HASH:
+        return None
+    cached_user = CachedUser(user)
+    
+    with _user_cache_lock:
+        if _user_cache_state['version'] == version:
+            if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+                for expired_id in [key for key, (expires_at, _) in _user_cache.items() if expires_at <= now]:
+                    del _user_cache[expired_id]
+            if len(_user_cache) < USER_CACHE_MAX_SIZE:
+                _user_cache[user_id] = (now + USER_CACHE_TTL, cached_user)
+    return cached_user
 
 # グローバルコンテキストプロセッサー
 @app.context_processor
@@ -652,6 +1061,93 @@ def calculate_education_costs(child_birth_date, kindergarten_type, elementary_ty
     
     return costs
 
+# 教育段階の行で、再計算のたびに更新する列
+EDUCATION_STAGE_COLUMNS = ('name', 'description', 'start_year', 'end_year', 'child_name', 'child_birth_date', 'monthly_amount')
+
+def education_stage_rows(education_plan):
+    """教育プランの選択から、作成すべき教育段階の行（列名 → 値）を (stage, stage_type) 順に返す"""
+    costs = calculate_education_costs(
+        education_plan.child_birth_date,
+        education_plan.kindergarten_type,
+        education_plan.elementary_type,
+        education_plan.junior_type,
+        education_plan.high_type,
+        education_plan.college_type
+    )
+    
+    rows = []
+    for stage, stage_type in (
+        ('kindergarten', education_plan.kindergarten_type.value),
+        ('elementary', education_plan.elementary_type.value),
+        ('junior', education_plan.junior_type.value),
+        ('high', education_plan.high_type.value),
+        ('college', education_plan.college_type.value),
+    ):
+        monthly_amount = costs[f'{stage}_monthly']
+        start_year = costs[f'{stage}_start_year']
+        end_year = costs[f'{stage}_end_year']
+        # 費用が0または期間が無効な場合、"進学しない"や"未就園"の場合はスキップ
+        if monthly_amount <= 0 or start_year <= 0 or end_year <= 0:
+            continue
+        if stage_type in ['進学しない', '未就園']:
+            continue
+        
+        rows.append({
+            'stage': stage,
+            'stage_type': stage_type,
+            'name': f"{education_plan.child_name}の{stage_type}",
+            'description': f"{education_plan.child_name}の{stage_type}にかかる費用",
+            'start_year': start_year,
+            'end_year': end_year,
+            'child_name': education_plan.child_name,
+            'child_birth_date': education_plan.child_birth_date,
+            'monthly_amount': monthly_amount,
+        })
+    return rows
+
+def reconcile_education_stages(education_plan):
+    """
+    教育プランの教育段階の行を選択内容に合わせ、反映後の段階数を返す
+    (stage, stage_type) が変わらない行はIDを保ったまま値だけ更新し、増えた段階・なくなった段階だけを一括で追加・削除する
+    """
+    wanted = {(row['stage'], row['stage_type']): row for row in education_stage_rows(education_plan)}
+    
+    updates = []
+    removed = []
+    kept = set()
+    existing = db.session.execute(
+        db.select(EducationExpenses.id, EducationExpenses.stage, EducationExpenses.stage_type,
+                  *(EducationExpenses.__table__.c[name] for name in EDUCATION_STAGE_COLUMNS))
+        .where(EducationExpenses.education_plan_id == education_plan.id)
+        .order_by(EducationExpenses.id)
+    ).mappings()
+    for current in existing:
+        key = (current['stage'], current['stage_type'])
+        row = wanted.get(key)
+        if row is None or key in kept:
+            removed.append(current['id'])
+            continue
+        kept.add(key)
+        changed = {name: row[name] for name in EDUCATION_STAGE_COLUMNS if current[name] != row[name]}
+        if changed:
+            updates.append({'id': current['id'], **changed})
+    
+    # 変更列が行ごとに異なるため、列の組み合わせごとにまとめて一括更新する
+    updates_by_columns = {}
+    for values in updates:
+        updates_by_columns.setdefault(tuple(sorted(values)), []).append(values)
+    for values in updates_by_columns.values():
+        db.session.execute(db.update(EducationExpenses), values)
+    if removed:
+        db.session.execute(db.delete(EducationExpenses).where(EducationExpenses.id.in_(removed)))
+    added = [
+        {'user_id': education_plan.user_id, 'education_plan_id': education_plan.id, **row}
+        for key, row in wanted.items() if key not in kept
+    ]
+    if added:
+        db.session.execute(insert(EducationExpenses), added)
+    return len(wanted)
+
 # Mortgage Calculator
 def calculate_mortgage_payment(loan_amount, interest_rate, term_years, repayment_method):
     """
@@ -699,6 +1195,8 @@ def register():
         )
         db.session.add(user)
         db.session.commit()
+        if tenant_mode_enabled():
+            tenant_engine(user.id, create=True)
         
         return jsonify({'success': True, 'message': '登録が完了しました'})
     
@@ -965,7 +1463,7 @@ def mypage():
 @app.route('/account-management')
 @login_required
 def account_management():
-    expense_categories = ExpenseCategory.query.order_by(ExpenseCategory.id).all()
+    expense_categories = get_categories('expense')[0]
     return render_template('account_management.html', expense_categories=expense_categories)
 
 @app.route('/household-books')
@@ -988,36 +1486,9 @@ def household_calendar(year=None, month=None):
             year = current_date.year
             month = current_date.month
         
-        # カテゴリを取得（なければデフォルトを作成）
-        expense_categories = ExpenseCategory.query.all()
-        income_categories = IncomeCategory.query.all()
-        
-        # デフォルトカテゴリが存在しない場合は作成
-        if not expense_categories:
-            default_expense_categories = [
-                {'name': '食費', 'icon': 'restaurant', 'color': '#FF5722'},
-                {'name': '交通費', 'icon': 'directions_car', 'color': '#2196F3'},
-                {'name': '娯楽', 'icon': 'movie', 'color': '#9C27B0'},
-                {'name': '光熱費', 'icon': 'bolt', 'color': '#FF9800'},
-                {'name': 'その他', 'icon': 'category', 'color': '#666666'}
-            ]
-            for cat_data in default_expense_categories:
-                category = ExpenseCategory(**cat_data)
-                db.session.add(category)
-            db.session.commit()
-            expense_categories = ExpenseCategory.query.all()
-        
-        if not income_categories:
-            default_income_categories = [
-                {'name': '給与', 'icon': 'work', 'color': '#4CAF50'},
-                {'name': '副業', 'icon': 'business_center', 'color': '#8BC34A'},
-                {'name': 'その他', 'icon': 'attach_money', 'color': '#4CAF50'}
-            ]
-            for cat_data in default_income_categories:
-                category = IncomeCategory(**cat_data)
-                db.session.add(category)
-            db.session.commit()
-            income_categories = IncomeCategory.query.all()
+        # カテゴリを取得（デフォルトカテゴリは起動時に投入済み）
+        expense_categories = get_categories('expense')[0]
+        income_categories = get_categories('income')[0]
         
         return render_template('household_calendar.html',
                              expense_categories=expense_categories,
@@ -1033,21 +1504,8 @@ def household_calendar(year=None, month=None):
 def api_calendar_entries(year, month):
     """カレンダー用の月次エントリー取得API"""
     try:
-        # 指定年月の家計簿を取得または作成
-        household_book = HouseholdBook.query.filter_by(
-            user_id=current_user.id, year=year, month=month
-        ).first()
-        
-        if not household_book:
-            # 家計簿が存在しない場合は作成
-            household_book = HouseholdBook(
-                user_id=current_user.id,
-                name=f"{year}年{month}月の家計簿",
-                year=year,
-                month=month
-            )
-            db.session.add(household_book)
-            db.session.commit()
+        # 指定年月の家計簿を取得（未作成なら保存しない空の家計簿）
+        household_book = household_book_for_view(current_user.id, year, month)
         
         # 指定年月の範囲を設定
         from calendar import monthrange
@@ -1056,15 +1514,15 @@ def api_calendar_entries(year, month):
         month_end = date(year, month, last_day)
         
         # エントリーを取得（指定年月の範囲内のみ）
-        entries = HouseholdEntry.query.filter_by(household_book_id=household_book.id)\
-            .filter(HouseholdEntry.entry_date >= month_start)\
-            .filter(HouseholdEntry.entry_date <= month_end)\
-            .order_by(HouseholdEntry.entry_date.desc()).all()
+        entries = []
+        if household_book.id is not None:
+            entries = HouseholdEntry.query.filter_by(household_book_id=household_book.id)\
+                .filter(HouseholdEntry.entry_date >= month_start)\
+                .filter(HouseholdEntry.entry_date <= month_end)\
+                .order_by(HouseholdEntry.entry_date.desc()).all()
         
         # 日付別にグループ化
         entries_by_date = {}
-        total_income = 0
-        total_expense = 0
         
         for entry in entries:
             date_str = entry.entry_date.strftime('%Y-%m-%d')
@@ -1083,11 +1541,9 @@ def api_calendar_entries(year, month):
                 'expense_category_id': entry.expense_category_id
             }
             entries_by_date[date_str].append(entry_data)
-            
-            if entry.entry_type == 'income':
-                total_income += entry.amount
-            else:
-                total_expense += entry.amount
+        
+        # 月の合計は月次集計から取得
+        total_income, total_expense = get_monthly_totals(current_user.id, year, month)
         
         return jsonify({
             'success': True,
@@ -1104,15 +1560,88 @@ def api_calendar_entries(year, month):
         app.logger.error(f"カレンダーエントリー取得エラー: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def new_household_book(user_id, year, month):
+    """指定年月の空の家計簿（セッションには追加しない）"""
+    return HouseholdBook(
+        user_id=user_id,
+        name=f"{year}年{month}月の家計簿",
+        year=year,
+        month=month
+    )
+
+def household_book_for_view(user_id, year, month):
+    """
+    表示用に指定年月の家計簿を取得（GETで書き込まないよう、なければ保存しない空の家計簿を返す）
+    空の家計簿のidはNoneで、最初のエントリー登録時に get_or_create_household_book で作成される
+    """
+    return find_household_book(user_id, year, month) or new_household_book(user_id, year, month)
+
+def get_or_create_household_book(user_id, year, month):
+    """指定年月の家計簿を取得（なければ作成してコミット）。書き込みの処理からだけ呼ぶ"""
+    household_book = find_household_book(user_id, year, month)
+    if not household_book:
+        household_book = new_household_book(user_id, year, month)
+        db.session.add(household_book)
+        db.session.commit()
+    return household_book
+
+@app.route('/api/calendar-daily-totals/<int:year>/<int:month>')
+@login_required
+def api_calendar_daily_totals(year, month):
+    """
+    カレンダー用の日別収支合計API
+    エントリー本体は返さず、日付をタップした時に /api/daily-entries で取得する
+    """
+    try:
+        household_book = household_book_for_view(current_user.id, year, month)
+        
+        from calendar import monthrange
+        month_start = date(year, month, 1)
+        _, last_day = monthrange(year, month)
+        month_end = date(year, month, last_day)
+        
+        # ユーザー×日付のインデックスで月の範囲を日付・種別毎に集計
+        rows = db.session.query(
+            HouseholdEntry.entry_date,
+            HouseholdEntry.entry_type,
+            db.func.sum(HouseholdEntry.amount),
+            db.func.count(HouseholdEntry.id)
+        ).filter(
+            HouseholdEntry.user_id == current_user.id,
+            HouseholdEntry.entry_date >= month_start,
+            HouseholdEntry.entry_date <= month_end
+        ).group_by(HouseholdEntry.entry_date, HouseholdEntry.entry_type).all()
+        
+        days = {}
+        for entry_date, entry_type, total, count in rows:
+            day = days.setdefault(entry_date.strftime('%Y-%m-%d'), {'income': 0, 'expense': 0, 'count': 0})
+            day['income' if entry_type == 'income' else 'expense'] += total
+            day['count'] += count
+        
+        total_income, total_expense = get_monthly_totals(current_user.id, year, month)
+        
+        return jsonify({
+            'success': True,
+            'days': days,
+            'summary': {
+                'total_income': total_income,
+                'total_expense': total_expense,
+                'balance': total_income - total_expense
+            },
+            'household_book_id': household_book.id
+        })
+        
+    except Exception as e:
+        app.logger.error(f"カレンダー日別合計取得エラー: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/daily-entries/<int:year>/<int:month>/<int:day>')
 @login_required
 def api_daily_entries(year, month, day):
     """指定日のエントリー詳細取得API"""
     try:
         # 指定年月の家計簿を取得
-        household_book = HouseholdBook.query.filter_by(
-            user_id=current_user.id, year=year, month=month
-        ).first()
+        household_book = find_household_book(current_user.id, year, month)
         
         if not household_book:
             return jsonify({
@@ -1185,45 +1714,29 @@ def household_menu():
             .order_by(HouseholdEntry.entry_date.desc(), HouseholdEntry.created_at.desc())\
             .limit(10).all()
         
-        # 今月の統計を計算
-        month_start = date(current_year, current_month, 1)
-        if current_month == 12:
-            month_end = date(current_year + 1, 1, 1) - timedelta(days=1)
-        else:
-            month_end = date(current_year, current_month + 1, 1) - timedelta(days=1)
-        
-        # 今月の収入・支出を集計
-        monthly_entries = HouseholdEntry.query.filter_by(user_id=current_user.id)\
-            .filter(HouseholdEntry.entry_date >= month_start)\
-            .filter(HouseholdEntry.entry_date <= month_end).all()
-        
-        monthly_income = sum(entry.amount for entry in monthly_entries if entry.entry_type == 'income')
-        monthly_expense = sum(entry.amount for entry in monthly_entries if entry.entry_type == 'expense')
-        monthly_balance = monthly_income - monthly_expense
-        
-        # カテゴリ別の支出統計
+        # 今月の収入・支出とカテゴリ別の統計を月次集計から計算
+        monthly_income = 0
+        monthly_expense = 0
         expense_categories = {}
         income_categories = {}
         
-        for entry in monthly_entries:
-            if entry.entry_type == 'expense' and entry.expense_category:
-                cat_name = entry.expense_category.name
-                if cat_name not in expense_categories:
-                    expense_categories[cat_name] = {
-                        'total': 0,
-                        'icon': entry.expense_category.icon,
-                        'color': entry.expense_category.color
-                    }
-                expense_categories[cat_name]['total'] += entry.amount
-            elif entry.entry_type == 'income' and entry.income_category:
-                cat_name = entry.income_category.name
-                if cat_name not in income_categories:
-                    income_categories[cat_name] = {
+        for row in get_monthly_rollup(current_user.id, current_year, current_month):
+            if row.entry_type == 'income':
+                monthly_income += row.total
+                summary, category = income_categories, get_category('income', row.category_id)
+            else:
+                monthly_expense += row.total
+                summary, category = expense_categories, get_category('expense', row.category_id)
+            if category:
+                cat_name = category['name']
+                if cat_name not in summary:
+                    summary[cat_name] = {
                         'total': 0,
-                        'icon': entry.income_category.icon,
-                        'color': entry.income_category.color
+                        'icon': category['icon'],
+                        'color': category['color']
                     }
-                income_categories[cat_name]['total'] += entry.amount
+                summary[cat_name]['total'] += row.total
+        monthly_balance = monthly_income - monthly_expense
         
         # テンプレートに渡すデータ
         template_data = {
@@ -1248,38 +1761,21 @@ def household_menu():
 @login_required
 def household_book_monthly(year, month):
     """月次家計簿ページ"""
-    # 指定年月の家計簿を取得または作成
-    household_book = HouseholdBook.query.filter_by(
-        user_id=current_user.id, year=year, month=month
-    ).first()
-    
-    if not household_book:
-        # 家計簿が存在しない場合は作成
-        household_book = HouseholdBook(
-            user_id=current_user.id,
-            name=f"{year}年{month}月の家計簿",
-            year=year,
-            month=month
-        )
-        db.session.add(household_book)
-        db.session.commit()
+    # 指定年月の家計簿を取得（未作成なら保存しない空の家計簿。最初のエントリー登録時に作成される）
+    household_book = household_book_for_view(current_user.id, year, month)
     
-    # エントリーを取得
-    entries = HouseholdEntry.query.filter_by(household_book_id=household_book.id)\
-        .order_by(HouseholdEntry.entry_date.desc()).all()
+    # エントリーは画面側でスクロールに合わせてページ単位で取得する
     
     # カテゴリを取得
-    expense_categories = ExpenseCategory.query.all()
-    income_categories = IncomeCategory.query.all()
+    expense_categories = get_categories('expense')[0]
+    income_categories = get_categories('income')[0]
     
-    # 月次統計を計算
-    total_income = sum(entry.amount for entry in entries if entry.entry_type == 'income')
-    total_expense = sum(entry.amount for entry in entries if entry.entry_type == 'expense')
+    # 月次統計を月次集計から取得
+    total_income, total_expense = get_monthly_totals(current_user.id, year, month)
     balance = total_income - total_expense
     
     return render_template('household_book_monthly.html', 
                          household_book=household_book,
-                         entries=entries,
                          expense_categories=expense_categories,
                          income_categories=income_categories,
                          total_income=total_income,
@@ -1288,6 +1784,85 @@ def household_book_monthly(year, month):
                          year=year,
                          month=month)
 
+# 一覧APIの列射影（?fields=id,name,... で返す項目を絞る）
+# 一覧は項目名 → SQL式の対応表から必要な列だけをCoreのSELECTで読み、ORMオブジェクトを作らない
+def item_fields(model, *names, **expressions):
+    """一覧の出力項目の対応表（namesはモデルの同名の列、expressionsは項目名 → SQL式）"""
+    fields = {name: model.__table__.c[name] for name in ('id',) + names}
+    fields.update(expressions)
+    return fields
+
+def requested_fields(*field_maps):
+    """?fields= で指定された項目名のリスト（未指定ならNone）。どの対応表にもない項目があればValueError"""
+    names = list(dict.fromkeys(name.strip() for name in request.args.get('fields', '').split(',') if name.strip()))
+    if not names:
+        return None
+    unknown = [name for name in names if not any(name in fields for fields in field_maps)]
+    if unknown:
+        raise ValueError(f'不明な項目です: {", ".join(unknown)}')
+    return names
+
+def _selected_fields(fields, names):
+    """対応表のうちnamesの項目名（Noneなら全項目、idは常に含む）"""
+    return list(fields) if names is None else ['id'] + [name for name in names if name in fields and name != 'id']
+
+def _projection(model, columns, user_id, outerjoin=None):
+    stmt = db.select(*columns).select_from(model)
+    if outerjoin is not None:
+        stmt = stmt.outerjoin(*outerjoin).group_by(model.id)
+    return stmt.where(model.user_id == user_id)
+
+def _plain_value(value):
+    return value.value if isinstance(value, Enum) else value
+
+def project_rows(model, fields, names, user_id, outerjoin=None):
+    """
+    ユーザーの行を、対応表のうちnamesの項目だけ読んでdictのリストで返す
+    outerjoinを渡すとその表を外部結合してモデルのID毎に集計する。Enumは値に変換する
+    """
+    selected = _selected_fields(fields, names)
+    stmt = _projection(model, [fields[name].label(name) for name in selected], user_id, outerjoin).order_by(model.id)
+    return [
+        {name: _plain_value(value) for name, value in row.items()}
+        for row in db.session.execute(stmt).mappings()
+    ]
+
+def project_rows_by_type(sources, names, user_id):
+    """
+    種別毎の射影を1回のUNION ALLで読み、{種別: dictのリスト} で返す（sourcesは 種別 → (モデル, 対応表, outerjoin)）
+    種別毎に列が違うため項目はjson_objectにまとめて受け取り、列の型の変換（Enum・円）はPython側で行う
+    """
+    dialect = db.session.get_bind().dialect
+    branches, processors = [], []
+    for position, (model, fields, outerjoin) in enumerate(sources.values()):
+        selected = _selected_fields(fields, names)
+        pairs = [part for name in selected for part in (db.literal(name), fields[name])]
+        branches.append(_projection(model, [
+            db.literal(position).label('position'),
+            model.id.label('item_id'),
+            db.func.json_object(*pairs).label('data')
+        ], user_id, outerjoin))
+        processors.append({name: fields[name].type.result_processor(dialect, None) for name in selected})
+    union = db.union_all(*branches)
+    stmt = union.order_by(union.selected_columns.position, union.selected_columns.item_id)
+    
+    results = [[] for _ in sources]
+    # ORMのモデルを含むUNIONはget_bindに文が渡らないため、テナントの振り分け用に明示する
+    for position, _, data in db.session.execute(stmt, bind_arguments={'clause': stmt}):
+        row = {}
+        for name, value in json.loads(data).items():
+            process = processors[position][name]
+            row[name] = _plain_value(process(value) if process else value)
+        results[position].append(row)
+    return dict(zip(sources, results))
+
+LIVING_EXPENSE_FIELDS = item_fields(
+    LivingExpenses, 'name', 'description', 'start_year', 'end_year', 'inflation_rate', 'monthly_total_amount',
+    'food_home', 'food_outside', 'utility_electricity', 'utility_gas', 'utility_water', 'subscription_services',
+    'internet', 'phone', 'household_goods', 'hygiene', 'clothing', 'beauty', 'child_food', 'child_clothing',
+    'child_medical', 'child_other', 'transport', 'entertainment', 'pet_costs', 'other_expenses'
+)
+
 # API Routes for Expenses
 @app.route('/api/living-expenses', methods=['GET', 'POST', 'PUT'])
 @login_required
@@ -1297,26 +1872,26 @@ def api_living_expenses():
         
         # Calculate monthly total with proper type conversion
         monthly_total = sum([
-            float(data.get('food_home', 0) or 0),
-            float(data.get('food_outside', 0) or 0),
-            float(data.get('utility_electricity', 0) or 0),
-            float(data.get('utility_gas', 0) or 0),
-            float(data.get('utility_water', 0) or 0),
-            float(data.get('subscription_services', 0) or 0),
-            float(data.get('internet', 0) or 0),
-            float(data.get('phone', 0) or 0),
-            float(data.get('household_goods', 0) or 0),
-            float(data.get('hygiene', 0) or 0),
-            float(data.get('clothing', 0) or 0),
-            float(data.get('beauty', 0) or 0),
-            float(data.get('child_food', 0) or 0),
-            float(data.get('child_clothing', 0) or 0),
-            float(data.get('child_medical', 0) or 0),
-            float(data.get('child_other', 0) or 0),
-            float(data.get('transport', 0) or 0),
-            float(data.get('entertainment', 0) or 0),
-            float(data.get('pet_costs', 0) or 0),
-            float(data.get('other_expenses', 0) or 0)
+            to_yen(data.get('food_home', 0) or 0),
+            to_yen(data.get('food_outside', 0) or 0),
+            to_yen(data.get('utility_electricity', 0) or 0),
+            to_yen(data.get('utility_gas', 0) or 0),
+            to_yen(data.get('utility_water', 0) or 0),
+            to_yen(data.get('subscription_services', 0) or 0),
+            to_yen(data.get('internet', 0) or 0),
+            to_yen(data.get('phone', 0) or 0),
+            to_yen(data.get('household_goods', 0) or 0),
+            to_yen(data.get('hygiene', 0) or 0),
+            to_yen(data.get('clothing', 0) or 0),
+            to_yen(data.get('beauty', 0) or 0),
+            to_yen(data.get('child_food', 0) or 0),
+            to_yen(data.get('child_clothing', 0) or 0),
+            to_yen(data.get('child_medical', 0) or 0),
+            to_yen(data.get('child_other', 0) or 0),
+            to_yen(data.get('transport', 0) or 0),
+            to_yen(data.get('entertainment', 0) or 0),
+            to_yen(data.get('pet_costs', 0) or 0),
+            to_yen(data.get('other_expenses', 0) or 0)
         ])
         
         expense = LivingExpenses(
@@ -1326,26 +1901,26 @@ def api_living_expenses():
             start_year=int(data.get('start_year', 0)),
             end_year=int(data.get('end_year', 0)),
             inflation_rate=float(data.get('inflation_rate', 2.0)),
-            food_home=float(data.get('food_home', 0) or 0),
-            food_outside=float(data.get('food_outside', 0) or 0),
-            utility_electricity=float(data.get('utility_electricity', 0) or 0),
-            utility_gas=float(data.get('utility_gas', 0) or 0),
-            utility_water=float(data.get('utility_water', 0) or 0),
-            subscription_services=float(data.get('subscription_services', 0) or 0),
-            internet=float(data.get('internet', 0) or 0),
-            phone=float(data.get('phone', 0) or 0),
-            household_goods=float(data.get('household_goods', 0) or 0),
-            hygiene=float(data.get('hygiene', 0) or 0),
-            clothing=float(data.get('clothing', 0) or 0),
-            beauty=float(data.get('beauty', 0) or 0),
-            child_food=float(data.get('child_food', 0) or 0),
-            child_clothing=float(data.get('child_clothing', 0) or 0),
-            child_medical=float(data.get('child_medical', 0) or 0),
-            child_other=float(data.get('child_other', 0) or 0),
-            transport=float(data.get('transport', 0) or 0),
-            entertainment=float(data.get('entertainment', 0) or 0),
-            pet_costs=float(data.get('pet_costs', 0) or 0),
-            other_expenses=float(data.get('other_expenses', 0) or 0),
+            food_home=to_yen(data.get('food_home', 0) or 0),
+            food_outside=to_yen(data.get('food_outside', 0) or 0),
+            utility_electricity=to_yen(data.get('utility_electricity', 0) or 0),
+            utility_gas=to_yen(data.get('utility_gas', 0) or 0),
+            utility_water=to_yen(data.get('utility_water', 0) or 0),
+            subscription_services=to_yen(data.get('subscription_services', 0) or 0),
+            internet=to_yen(data.get('internet', 0) or 0),
+            phone=to_yen(data.get('phone', 0) or 0),
+            household_goods=to_yen(data.get('household_goods', 0) or 0),
+            hygiene=to_yen(data.get('hygiene', 0) or 0),
+            clothing=to_yen(data.get('clothing', 0) or 0),
+            beauty=to_yen(data.get('beauty', 0) or 0),
+            child_food=to_yen(data.get('child_food', 0) or 0),
+            child_clothing=to_yen(data.get('child_clothing', 0) or 0),
+            child_medical=to_yen(data.get('child_medical', 0) or 0),
+            child_other=to_yen(data.get('child_other', 0) or 0),
+            transport=to_yen(data.get('transport', 0) or 0),
+            entertainment=to_yen(data.get('entertainment', 0) or 0),
+            pet_costs=to_yen(data.get('pet_costs', 0) or 0),
+            other_expenses=to_yen(data.get('other_expenses', 0) or 0),
             monthly_total_amount=monthly_total
         )
         
@@ -1367,26 +1942,26 @@ def api_living_expenses():
         
         # Calculate monthly total with proper type conversion
         monthly_total = sum([
-            float(data.get('food_home', 0) or 0),
-            float(data.get('food_outside', 0) or 0),
-            float(data.get('utility_electricity', 0) or 0),
-            float(data.get('utility_gas', 0) or 0),
-            float(data.get('utility_water', 0) or 0),
-            float(data.get('subscription_services', 0) or 0),
-            float(data.get('internet', 0) or 0),
-            float(data.get('phone', 0) or 0),
-            float(data.get('household_goods', 0) or 0),
-            float(data.get('hygiene', 0) or 0),
-            float(data.get('clothing', 0) or 0),
-            float(data.get('beauty', 0) or 0),
-            float(data.get('child_food', 0) or 0),
-            float(data.get('child_clothing', 0) or 0),
-            float(data.get('child_medical', 0) or 0),
-            float(data.get('child_other', 0) or 0),
-            float(data.get('transport', 0) or 0),
-            float(data.get('entertainment', 0) or 0),
-            float(data.get('pet_costs', 0) or 0),
-            float(data.get('other_expenses', 0) or 0)
+            to_yen(data.get('food_home', 0) or 0),
+            to_yen(data.get('food_outside', 0) or 0),
+            to_yen(data.get('utility_electricity', 0) or 0),
+            to_yen(data.get('utility_gas', 0) or 0),
+            to_yen(data.get('utility_water', 0) or 0),
+            to_yen(data.get('subscription_services', 0) or 0),
+            to_yen(data.get('internet', 0) or 0),
+            to_yen(data.get('phone', 0) or 0),
+            to_yen(data.get('household_goods', 0) or 0),
+            to_yen(data.get('hygiene', 0) or 0),
+            to_yen(data.get('clothing', 0) or 0),
+            to_yen(data.get('beauty', 0) or 0),
+            to_yen(data.get('child_food', 0) or 0),
+            to_yen(data.get('child_clothing', 0) or 0),
+            to_yen(data.get('child_medical', 0) or 0),
+            to_yen(data.get('child_other', 0) or 0),
+            to_yen(data.get('transport', 0) or 0),
+            to_yen(data.get('entertainment', 0) or 0),
+            to_yen(data.get('pet_costs', 0) or 0),
+            to_yen(data.get('other_expenses', 0) or 0)
         ])
         
         # Update expense data
@@ -1395,26 +1970,26 @@ def api_living_expenses():
         expense.start_year = int(data.get('start_year', 0))
         expense.end_year = int(data.get('end_year', 0))
         expense.inflation_rate = float(data.get('inflation_rate', 2.0))
-        expense.food_home = float(data.get('food_home', 0) or 0)
-        expense.food_outside = float(data.get('food_outside', 0) or 0)
-        expense.utility_electricity = float(data.get('utility_electricity', 0) or 0)
-        expense.utility_gas = float(data.get('utility_gas', 0) or 0)
-        expense.utility_water = float(data.get('utility_water', 0) or 0)
-        expense.subscription_services = float(data.get('subscription_services', 0) or 0)
-        expense.internet = float(data.get('internet', 0) or 0)
-        expense.phone = float(data.get('phone', 0) or 0)
-        expense.household_goods = float(data.get('household_goods', 0) or 0)
-        expense.hygiene = float(data.get('hygiene', 0) or 0)
-        expense.clothing = float(data.get('clothing', 0) or 0)
-        expense.beauty = float(data.get('beauty', 0) or 0)
-        expense.child_food = float(data.get('child_food', 0) or 0)
-        expense.child_clothing = float(data.get('child_clothing', 0) or 0)
-        expense.child_medical = float(data.get('child_medical', 0) or 0)
-        expense.child_other = float(data.get('child_other', 0) or 0)
-        expense.transport = float(data.get('transport', 0) or 0)
-        expense.entertainment = float(data.get('entertainment', 0) or 0)
-        expense.pet_costs = float(data.get('pet_costs', 0) or 0)
-        expense.other_expenses = float(data.get('other_expenses', 0) or 0)
+        expense.food_home = to_yen(data.get('food_home', 0) or 0)
+        expense.food_outside = to_yen(data.get('food_outside', 0) or 0)
+        expense.utility_electricity = to_yen(data.get('utility_electricity', 0) or 0)
+        expense.utility_gas = to_yen(data.get('utility_gas', 0) or 0)
+        expense.utility_water = to_yen(data.get('utility_water', 0) or 0)
+        expense.subscription_services = to_yen(data.get('subscription_services', 0) or 0)
+        expense.internet = to_yen(data.get('internet', 0) or 0)
+        expense.phone = to_yen(data.get('phone', 0) or 0)
+        expense.household_goods = to_yen(data.get('household_goods', 0) or 0)
+        expense.hygiene = to_yen(data.get('hygiene', 0) or 0)
+        expense.clothing = to_yen(data.get('clothing', 0) or 0)
+        expense.beauty = to_yen(data.get('beauty', 0) or 0)
+        expense.child_food = to_yen(data.get('child_food', 0) or 0)
+        expense.child_clothing = to_yen(data.get('child_clothing', 0) or 0)
+        expense.child_medical = to_yen(data.get('child_medical', 0) or 0)
+        expense.child_other = to_yen(data.get('child_other', 0) or 0)
+        expense.transport = to_yen(data.get('transport', 0) or 0)
+        expense.entertainment = to_yen(data.get('entertainment', 0) or 0)
+        expense.pet_costs = to_yen(data.get('pet_costs', 0) or 0)
+        expense.other_expenses = to_yen(data.get('other_expenses', 0) or 0)
         expense.monthly_total_amount = monthly_total
         
         db.session.commit()
@@ -1422,36 +1997,11 @@ def api_living_expenses():
         return jsonify({'success': True, 'message': '生活費を更新しました'})
     
     else:
-        expenses = LivingExpenses.query.filter_by(user_id=current_user.id).all()
-        return jsonify([{
-            'id': e.id,
-            'name': e.name,
-            'description': e.description,
-            'start_year': e.start_year,
-            'end_year': e.end_year,
-            'inflation_rate': e.inflation_rate,
-            'monthly_total_amount': e.monthly_total_amount,
-            'food_home': e.food_home,
-            'food_outside': e.food_outside,
-            'utility_electricity': e.utility_electricity,
-            'utility_gas': e.utility_gas,
-            'utility_water': e.utility_water,
-            'subscription_services': e.subscription_services,
-            'internet': e.internet,
-            'phone': e.phone,
-            'household_goods': e.household_goods,
-            'hygiene': e.hygiene,
-            'clothing': e.clothing,
-            'beauty': e.beauty,
-            'child_food': e.child_food,
-            'child_clothing': e.child_clothing,
-            'child_medical': e.child_medical,
-            'child_other': e.child_other,
-            'transport': e.transport,
-            'entertainment': e.entertainment,
-            'pet_costs': e.pet_costs,
-            'other_expenses': e.other_expenses
-        } for e in expenses])
+        try:
+            names = requested_fields(LIVING_EXPENSE_FIELDS)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        return jsonify(project_rows(LivingExpenses, LIVING_EXPENSE_FIELDS, names, current_user.id))
 
 @app.route('/api/education-expenses', methods=['GET', 'POST', 'PUT'])
 @login_required
@@ -1476,57 +2026,15 @@ def api_education_expenses():
         db.session.add(education_plan)
         db.session.flush()  # IDを取得するため
         
-        # 教育費を自動計算
-        costs = calculate_education_costs(
-            education_plan.child_birth_date,
-            education_plan.kindergarten_type,
-            education_plan.elementary_type,
-            education_plan.junior_type,
-            education_plan.high_type,
-            education_plan.college_type
-        )
-        
         # 各教育段階のレコードを作成
-        stages = [
-            ('kindergarten', education_plan.kindergarten_type.value, costs['kindergarten_monthly'], costs['kindergarten_start_year'], costs['kindergarten_end_year']),
-            ('elementary', education_plan.elementary_type.value, costs['elementary_monthly'], costs['elementary_start_year'], costs['elementary_end_year']),
-            ('junior', education_plan.junior_type.value, costs['junior_monthly'], costs['junior_start_year'], costs['junior_end_year']),
-            ('high', education_plan.high_type.value, costs['high_monthly'], costs['high_start_year'], costs['high_end_year']),
-            ('college', education_plan.college_type.value, costs['college_monthly'], costs['college_start_year'], costs['college_end_year'])
-        ]
-        
-        created_expenses = []
-        for stage, stage_type, monthly_amount, start_year, end_year in stages:
-            # 費用が0または期間が無効な場合はスキップ
-            if monthly_amount <= 0 or start_year <= 0 or end_year <= 0:
-                continue
-                
-            # "進学しない"や"未就園"の場合もスキップ
-            if stage_type in ['進学しない', '未就園']:
-                continue
-            
-            expense = EducationExpenses(
-                user_id=current_user.id,
-                education_plan_id=education_plan.id,
-                name=f"{education_plan.child_name}の{stage_type}",
-                description=f"{education_plan.child_name}の{stage_type}にかかる費用",
-                start_year=start_year,
-                end_year=end_year,
-                child_name=education_plan.child_name,
-                child_birth_date=education_plan.child_birth_date,
-                stage=stage,
-                stage_type=stage_type,
-                monthly_amount=monthly_amount
-            )
-            db.session.add(expense)
-            created_expenses.append(expense)
+        created_count = reconcile_education_stages(education_plan)
         
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': '教育費を登録しました',
-            'created_count': len(created_expenses)
+            'created_count': created_count
         })
     
     elif request.method == 'PUT':
@@ -1562,62 +2070,15 @@ def api_education_expenses():
             education_plan.high_type = HighType(data.get('high_type', education_plan.high_type.value))
             education_plan.college_type = CollegeType(data.get('college_type', education_plan.college_type.value))
             
-            # 既存の教育費レコードを削除
-            existing_expenses = EducationExpenses.query.filter_by(education_plan_id=education_plan.id).all()
-            for expense in existing_expenses:
-                db.session.delete(expense)
-            
-            # 新しい教育費を再計算・再作成
-            costs = calculate_education_costs(
-                education_plan.child_birth_date,
-                education_plan.kindergarten_type,
-                education_plan.elementary_type,
-                education_plan.junior_type,
-                education_plan.high_type,
-                education_plan.college_type
-            )
-            
-            # 各教育段階のレコードを再作成
-            stages = [
-                ('kindergarten', education_plan.kindergarten_type.value, costs['kindergarten_monthly'], costs['kindergarten_start_year'], costs['kindergarten_end_year']),
-                ('elementary', education_plan.elementary_type.value, costs['elementary_monthly'], costs['elementary_start_year'], costs['elementary_end_year']),
-                ('junior', education_plan.junior_type.value, costs['junior_monthly'], costs['junior_start_year'], costs['junior_end_year']),
-                ('high', education_plan.high_type.value, costs['high_monthly'], costs['high_start_year'], costs['high_end_year']),
-                ('college', education_plan.college_type.value, costs['college_monthly'], costs['college_start_year'], costs['college_end_year'])
-            ]
-            
-            updated_expenses = []
-            for stage, stage_type, monthly_amount, start_year, end_year in stages:
-                # 費用が0または期間が無効な場合はスキップ
-                if monthly_amount <= 0 or start_year <= 0 or end_year <= 0:
-                    continue
-                    
-                # "進学しない"や"未就園"の場合もスキップ
-                if stage_type in ['進学しない', '未就園']:
-                    continue
-                
-                expense = EducationExpenses(
-                    user_id=current_user.id,
-                    education_plan_id=education_plan.id,
-                    name=f"{education_plan.child_name}の{stage_type}",
-                    description=f"{education_plan.child_name}の{stage_type}にかかる費用",
-                    start_year=start_year,
-                    end_year=end_year,
-                    child_name=education_plan.child_name,
-                    child_birth_date=education_plan.child_birth_date,
-                    stage=stage,
-                    stage_type=stage_type,
-                    monthly_amount=monthly_amount
-                )
-                db.session.add(expense)
-                updated_expenses.append(expense)
+            # 教育段階の行は差分だけを反映（段階が変わらない行はIDを保つ）
+            updated_count = reconcile_education_stages(education_plan)
             
             db.session.commit()
             
             return jsonify({
                 'success': True,
                 'message': '教育費プランを更新しました',
-                'updated_count': len(updated_expenses)
+                'updated_count': updated_count
             })
             
         except Exception as e:
@@ -1629,10 +2090,16 @@ def api_education_expenses():
         # 新しい統合表示：教育プラン毎にグループ化して表示
         education_plans = EducationPlans.query.filter_by(user_id=current_user.id).all()
         
+        # 全プランの教育費を1クエリで取得してプラン毎に振り分ける
+        expenses_by_plan = {}
+        for expense in EducationExpenses.query.join(EducationPlans)\
+                .filter(EducationPlans.user_id == current_user.id).order_by(EducationExpenses.id):
+            expenses_by_plan.setdefault(expense.education_plan_id, []).append(expense)
+        
         result = []
         for plan in education_plans:
-            # 関連する教育費を取得
-            expenses = EducationExpenses.query.filter_by(education_plan_id=plan.id).all()
+            # 関連する教育費
+            expenses = expenses_by_plan.get(plan.id, [])
             
             total_monthly = sum(e.monthly_amount for e in expenses)
             start_year = min(e.start_year for e in expenses) if expenses else None
@@ -1732,7 +2199,7 @@ def api_housing_expenses():
         # Calculate mortgage if applicable
         mortgage_monthly = 0
         if residence_type == ResidenceType.OWNED_WITH_LOAN:
-            loan_amount = float(data.get('purchase_price', 0) or 0) - float(data.get('down_payment', 0) or 0)
+            loan_amount = to_yen(data.get('purchase_price', 0) or 0) - to_yen(data.get('down_payment', 0) or 0)
             mortgage_monthly = calculate_mortgage_payment(
                 loan_amount,
                 float(data.get('loan_interest_rate', 0) or 0),
@@ -1742,14 +2209,14 @@ def api_housing_expenses():
         
         # Calculate monthly total
         if residence_type == ResidenceType.RENTAL:
-            monthly_total = float(data.get('rent_monthly', 0) or 0)
+            monthly_total = to_yen(data.get('rent_monthly', 0) or 0)
         else:
             monthly_total = sum([
                 mortgage_monthly,
-                float(data.get('property_tax_monthly', 0) or 0),
-                float(data.get('management_fee_monthly', 0) or 0),
-                float(data.get('repair_reserve_monthly', 0) or 0),
-                float(data.get('fire_insurance_monthly', 0) or 0)
+                to_yen(data.get('property_tax_monthly', 0) or 0),
+                to_yen(data.get('management_fee_monthly', 0) or 0),
+                to_yen(data.get('repair_reserve_monthly', 0) or 0),
+                to_yen(data.get('fire_insurance_monthly', 0) or 0)
             ])
         
         expense = HousingExpenses(
@@ -1759,14 +2226,14 @@ def api_housing_expenses():
             start_year=int(data.get('start_year', 0)),
             end_year=int(data.get('end_year', 0)),
             residence_type=residence_type,
-            rent_monthly=float(data.get('rent_monthly', 0) or 0),
+            rent_monthly=to_yen(data.get('rent_monthly', 0) or 0),
             mortgage_monthly=mortgage_monthly,
-            property_tax_monthly=float(data.get('property_tax_monthly', 0) or 0),
-            management_fee_monthly=float(data.get('management_fee_monthly', 0) or 0),
-            repair_reserve_monthly=float(data.get('repair_reserve_monthly', 0) or 0),
-            fire_insurance_monthly=float(data.get('fire_insurance_monthly', 0) or 0),
-            purchase_price=float(data.get('purchase_price', 0) or 0),
-            down_payment=float(data.get('down_payment', 0) or 0),
+            property_tax_monthly=to_yen(data.get('property_tax_monthly', 0) or 0),
+            management_fee_monthly=to_yen(data.get('management_fee_monthly', 0) or 0),
+            repair_reserve_monthly=to_yen(data.get('repair_reserve_monthly', 0) or 0),
+            fire_insurance_monthly=to_yen(data.get('fire_insurance_monthly', 0) or 0),
+            purchase_price=to_yen(data.get('purchase_price', 0) or 0),
+            down_payment=to_yen(data.get('down_payment', 0) or 0),
             loan_interest_rate=float(data.get('loan_interest_rate', 0) or 0),
             loan_term_years=int(data.get('loan_term_years', 0) or 0),
             repayment_method=RepaymentMethod(data.get('repayment_method', 'EQUAL_PAYMENT')),
@@ -1798,7 +2265,7 @@ def api_housing_expenses():
         # Calculate mortgage if applicable
         mortgage_monthly = 0
         if residence_type == ResidenceType.OWNED_WITH_LOAN:
-            loan_amount = float(data.get('purchase_price', 0) or 0) - float(data.get('down_payment', 0) or 0)
+            loan_amount = to_yen(data.get('purchase_price', 0) or 0) - to_yen(data.get('down_payment', 0) or 0)
             mortgage_monthly = calculate_mortgage_payment(
                 loan_amount,
                 float(data.get('loan_interest_rate', 0) or 0),
@@ -1808,14 +2275,14 @@ def api_housing_expenses():
         
         # Calculate monthly total
         if residence_type == ResidenceType.RENTAL:
-            monthly_total = float(data.get('rent_monthly', 0) or 0)
+            monthly_total = to_yen(data.get('rent_monthly', 0) or 0)
         else:
             monthly_total = sum([
                 mortgage_monthly,
-                float(data.get('property_tax_monthly', 0) or 0),
-                float(data.get('management_fee_monthly', 0) or 0),
-                float(data.get('repair_reserve_monthly', 0) or 0),
-                float(data.get('fire_insurance_monthly', 0) or 0)
+                to_yen(data.get('property_tax_monthly', 0) or 0),
+                to_yen(data.get('management_fee_monthly', 0) or 0),
+                to_yen(data.get('repair_reserve_monthly', 0) or 0),
+                to_yen(data.get('fire_insurance_monthly', 0) or 0)
             ])
         
         # Update expense data
@@ -1824,14 +2291,14 @@ def api_housing_expenses():
         expense.start_year = int(data.get('start_year', 0))
         expense.end_year = int(data.get('end_year', 0))
         expense.residence_type = residence_type
-        expense.rent_monthly = float(data.get('rent_monthly', 0) or 0)
+        expense.rent_monthly = to_yen(data.get('rent_monthly', 0) or 0)
         expense.mortgage_monthly = mortgage_monthly
-        expense.property_tax_monthly = float(data.get('property_tax_monthly', 0) or 0)
-        expense.management_fee_monthly = float(data.get('management_fee_monthly', 0) or 0)
-        expense.repair_reserve_monthly = float(data.get('repair_reserve_monthly', 0) or 0)
-        expense.fire_insurance_monthly = float(data.get('fire_insurance_monthly', 0) or 0)
-        expense.purchase_price = float(data.get('purchase_price', 0) or 0)
-        expense.down_payment = float(data.get('down_payment', 0) or 0)
+        expense.property_tax_monthly = to_yen(data.get('property_tax_monthly', 0) or 0)
+        expense.management_fee_monthly = to_yen(data.get('management_fee_monthly', 0) or 0)
+        expense.repair_reserve_monthly = to_yen(data.get('repair_reserve_monthly', 0) or 0)
+        expense.fire_insurance_monthly = to_yen(data.get('fire_insurance_monthly', 0) or 0)
+        expense.purchase_price = to_yen(data.get('purchase_price', 0) or 0)
+        expense.down_payment = to_yen(data.get('down_payment', 0) or 0)
         expense.loan_interest_rate = float(data.get('loan_interest_rate', 0) or 0)
         expense.loan_term_years = int(data.get('loan_term_years', 0) or 0)
         expense.repayment_method = RepaymentMethod(data.get('repayment_method', 'EQUAL_PAYMENT'))
@@ -1875,8 +2342,8 @@ def api_salary_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
-        annual_bonus = float(data.get('annual_bonus', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
+        annual_bonus = to_yen(data.get('annual_bonus', 0) or 0)
         annual_amount = monthly_amount * 12 + annual_bonus
         
         income = SalaryIncomes(
@@ -1890,7 +2357,7 @@ def api_salary_incomes():
             end_year=int(data.get('end_year', 0)),
             salary_increase_rate=float(data.get('salary_increase_rate', 3.0)),
             has_cap=bool(data.get('has_cap', False)),
-            annual_income_cap=float(data.get('annual_income_cap', 0) or 0)
+            annual_income_cap=to_yen(data.get('annual_income_cap', 0) or 0)
         )
         
         db.session.add(income)
@@ -1909,8 +2376,8 @@ def api_salary_incomes():
         if not income:
             return jsonify({'success': False, 'message': '指定された給与収入が見つかりません'}), 404
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
-        annual_bonus = float(data.get('annual_bonus', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
+        annual_bonus = to_yen(data.get('annual_bonus', 0) or 0)
         annual_amount = monthly_amount * 12 + annual_bonus
         
         # Update income data
@@ -1923,7 +2390,7 @@ def api_salary_incomes():
         income.end_year = int(data.get('end_year', 0))
         income.salary_increase_rate = float(data.get('salary_increase_rate', 3.0))
         income.has_cap = bool(data.get('has_cap', False))
-        income.annual_income_cap = float(data.get('annual_income_cap', 0) or 0)
+        income.annual_income_cap = to_yen(data.get('annual_income_cap', 0) or 0)
         
         db.session.commit()
         
@@ -1970,271 +2437,273 @@ def api_delete_salary_income(income_id):
     
     return jsonify({'success': True, 'message': '給与収入を削除しました'})
 
+# 複製サービス（INSERT ... SELECTでデータベース内で行を複製する）
+# 行をPythonに読み込まず、子テーブルも親の新IDへの付け替えを式で書くため、件数によらず文の数が一定になる
+COPY_SUFFIX = ' (コピー)'
+
+# シミュレーションのリンク種別 → 複製するモデル（教育費のリンクは教育プランの統合IDを指す）
+COPY_EXPENSE_LINK_MODELS = {
+    'living': LivingExpenses,
+    'housing': HousingExpenses,
+    'insurance': InsuranceExpenses,
+    'event': EventExpenses,
+    'education': EducationPlans,
+}
+COPY_INCOME_LINK_MODELS = {
+    'salary': SalaryIncomes,
+    'sidejob': SidejobIncomes,
+    'business': BusinessIncomes,
+    'investment': InvestmentIncomes,
+    'pension': PensionIncomes,
+    'other': OtherIncomes,
+}
+
+# シミュレーションのリンクテーブル（リンクモデル, 種別列, 項目ID列, 種別 → 項目モデル）
+PLAN_LINK_TABLES = (
+    (LifeplanExpenseLinks, LifeplanExpenseLinks.expense_type, LifeplanExpenseLinks.expense_id, COPY_EXPENSE_LINK_MODELS),
+    (LifeplanIncomeLinks, LifeplanIncomeLinks.income_type, LifeplanIncomeLinks.income_id, COPY_INCOME_LINK_MODELS),
+)
+
+# 項目を削除したら、その項目を指すシミュレーションのリンクも同じトランザクションで消す
+# 参照先のないリンクが残ると、プランの実行時に選択項目の検証で弾かれるため
+def _delete_links_to_item(link_model, type_column, id_column, link_type):
+    def listener(mapper, connection, target):
+        connection.execute(db.delete(link_model).where(type_column == link_type, id_column == target.id))
+    return listener
+
+for _link_model, _type_column, _id_column, _link_models in PLAN_LINK_TABLES:
+    for _link_type, _item_model in _link_models.items():
+        event.listen(_item_model, 'after_delete', _delete_links_to_item(_link_model, _type_column, _id_column, _link_type))
+
+def prune_dangling_plan_links():
+    """参照先の項目が存在しないリンクを削除して件数を返す（項目の削除でリンクを消すようになる前のデータ用）"""
+    removed = 0
+    for link_model, type_column, id_column, models in PLAN_LINK_TABLES:
+        for link_type, model in models.items():
+            result = db.session.execute(
+                db.delete(link_model)
+                .where(type_column == link_type, ~db.exists().where(model.id == id_column))
+                .execution_options(synchronize_session=False)
+            )
+            removed += result.rowcount
+    return removed
+
+@app.cli.command('prune-plan-links')
+def prune_plan_links_command():
+    """参照先の項目が削除済みのシミュレーションのリンクを削除する（テナントモードでは作成済みのユーザーのファイル毎）"""
+    removed = 0
+    for user_id in tenant_database_user_ids() if tenant_mode_enabled() else [None]:
+        with tenant_scope(user_id):
+            removed += prune_dangling_plan_links()
+            db.session.commit()
+    click.echo(f'参照先のないリンクを{removed}件削除しました')
+
+def clone_rows(model, source_ids, **overrides):
+    """
+    source_ids（IDのSELECT）の行をID順に1文で複製し、複製の先頭IDを返す（対象がなければNone）
+    overridesは列名→値またはSQL式。nameには「 (コピー)」を付け、created_atは現在時刻にする
+    SQLiteは1文のINSERTで元の並び順に連続したrowidを振るため、元IDのk番目の複製は 先頭ID + k - 1 になる
+    """
+    table = model.__table__
+    overrides.setdefault('name', table.c.name + COPY_SUFFIX)
+    overrides.setdefault('created_at', datetime.utcnow())
+    names = [column.name for column in table.columns if not column.primary_key]
+    values = [
+        overrides[name] if isinstance(overrides.get(name), db.ColumnElement)
+        else db.literal(overrides[name], table.c[name].type) if name in overrides
+        else table.c[name]
+        for name in names
+    ]
+    source = db.select(*values).where(table.c.id.in_(source_ids)).order_by(table.c.id)
+    new_ids = db.session.execute(insert(table).from_select(names, source).returning(table.c.id)).scalars().all()
+    if not new_ids:
+        return None
+    if max(new_ids) - min(new_ids) + 1 != len(new_ids):
+        raise RuntimeError(f'{table.name}の複製IDが連続していません')
+    return min(new_ids)
+
+def cloned_id(model, source_ids, first_id, old_id):
+    """clone_rowsで複製した行のうち、元ID old_id（SQL式）に対応する新IDの式"""
+    rank = db.select(db.func.count()).select_from(model.__table__)\
+        .where(model.id.in_(source_ids), model.id <= old_id).scalar_subquery()
+    return db.literal(first_id) + rank - 1
+
+def _owned_ids(model, user_id, ids):
+    """ユーザーの行に絞ったIDのSELECT（外側のクエリと相関させない）"""
+    return db.select(model.id).where(model.user_id == user_id, model.id.in_(ids)).correlate(None)
+
+def copy_education_plans(user_id, plan_ids):
+    """教育プランを全段階の教育費ごと複製し、(プランの先頭ID, 複製元プランIDのSELECT) を返す"""
+    plans = _owned_ids(EducationPlans, user_id, plan_ids)
+    first_plan_id = clone_rows(EducationPlans, plans)
+    if first_plan_id is None:
+        return None, plans
+    stages = db.select(EducationExpenses.id).where(EducationExpenses.education_plan_id.in_(plans)).correlate(None)
+    # 「 (コピー)」を付けるのはプラン名だけで、各段階の教育費の名前はそのまま複製する
+    clone_rows(EducationExpenses, stages, name=EducationExpenses.__table__.c.name,
+               education_plan_id=cloned_id(EducationPlans, plans, first_plan_id, EducationExpenses.education_plan_id))
+    return first_plan_id, plans
+
+def copy_plan_item(model, user_id, item_id):
+    """収入・支出の項目を1件複製して新IDを返す（教育費は教育プランIDで全段階を複製）"""
+    if model is EducationPlans:
+        return copy_education_plans(user_id, [item_id])[0]
+    return clone_rows(model, _owned_ids(model, user_id, [item_id]))
+
+def copy_simulation_plan(user_id, plan_id, with_items=False):
+    """
+    シミュレーションプランとリンクを複製して新IDを返す（プランがなければNone）
+    with_items=Trueならリンク先の収入・支出項目も複製し、複製したプランは複製した項目を指す
+    """
+    new_plan_id = clone_rows(LifeplanSimulations, _owned_ids(LifeplanSimulations, user_id, [plan_id]))
+    if new_plan_id is None:
+        return None
+    
+    for link_model, type_column, id_column, models in PLAN_LINK_TABLES:
+        if not with_items:
+            db.session.execute(insert(link_model).from_select(
+                ['lifeplan_id', type_column.key, id_column.key],
+                db.select(db.literal(new_plan_id), type_column, id_column).where(link_model.lifeplan_id == plan_id)
+            ))
+            continue
+        
+        for link_type, model in models.items():
+            linked_ids = db.select(id_column).where(link_model.lifeplan_id == plan_id, type_column == link_type)\
+                .correlate(None)
+            if model is EducationPlans:
+                first_id, sources = copy_education_plans(user_id, linked_ids)
+            else:
+                sources = _owned_ids(model, user_id, linked_ids)
+                first_id = clone_rows(model, sources)
+            if first_id is None:
+                continue
+            # 複製した項目へのリンク（参照先が存在しないリンクは捨てる）
+            db.session.execute(insert(link_model).from_select(
+                ['lifeplan_id', type_column.key, id_column.key],
+                db.select(db.literal(new_plan_id), type_column, cloned_id(model, sources, first_id, id_column))
+                .where(link_model.lifeplan_id == plan_id, type_column == link_type, id_column.in_(sources))
+            ))
+    return new_plan_id
+
 # Copy APIs - IDのみを変更して中身をそのまま複製
 @app.route('/api/living-expenses/<int:expense_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_living_expense(expense_id):
-    # 元のデータを取得
-    original = LivingExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(LivingExpenses, current_user.id, expense_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '支出データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_expense = LivingExpenses(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        inflation_rate=original.inflation_rate if hasattr(original, 'inflation_rate') else 2.0,
-        food_home=original.food_home if hasattr(original, 'food_home') else 0,
-        food_outside=original.food_outside if hasattr(original, 'food_outside') else 0,
-        utility_electricity=original.utility_electricity if hasattr(original, 'utility_electricity') else 0,
-        utility_gas=original.utility_gas if hasattr(original, 'utility_gas') else 0,
-        utility_water=original.utility_water if hasattr(original, 'utility_water') else 0,
-        subscription_services=original.subscription_services if hasattr(original, 'subscription_services') else 0,
-        internet=original.internet if hasattr(original, 'internet') else 0,
-        phone=original.phone if hasattr(original, 'phone') else 0,
-        household_goods=original.household_goods if hasattr(original, 'household_goods') else 0,
-        hygiene=original.hygiene if hasattr(original, 'hygiene') else 0,
-        clothing=original.clothing if hasattr(original, 'clothing') else 0,
-        beauty=original.beauty if hasattr(original, 'beauty') else 0,
-        child_food=original.child_food if hasattr(original, 'child_food') else 0,
-        child_clothing=original.child_clothing if hasattr(original, 'child_clothing') else 0,
-        child_medical=original.child_medical if hasattr(original, 'child_medical') else 0,
-        child_other=original.child_other if hasattr(original, 'child_other') else 0,
-        transport=original.transport if hasattr(original, 'transport') else 0,
-        entertainment=original.entertainment if hasattr(original, 'entertainment') else 0,
-        pet_costs=original.pet_costs if hasattr(original, 'pet_costs') else 0,
-        other_expenses=original.other_expenses if hasattr(original, 'other_expenses') else 0,
-        monthly_total_amount=original.monthly_total_amount if hasattr(original, 'monthly_total_amount') else 0
-    )
-    
-    db.session.add(new_expense)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '生活費をコピーしました',
-        'new_id': new_expense.id
+        'new_id': new_id
     })
 
 @app.route('/api/housing-expenses/<int:expense_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_housing_expense(expense_id):
-    # 元のデータを取得
-    original = HousingExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(HousingExpenses, current_user.id, expense_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '住宅費データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_expense = HousingExpenses(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        residence_type=original.residence_type,
-        rent_monthly=original.rent_monthly if hasattr(original, 'rent_monthly') else 0,
-        mortgage_monthly=original.mortgage_monthly if hasattr(original, 'mortgage_monthly') else 0,
-        property_tax_monthly=original.property_tax_monthly if hasattr(original, 'property_tax_monthly') else 0,
-        management_fee_monthly=original.management_fee_monthly if hasattr(original, 'management_fee_monthly') else 0,
-        repair_reserve_monthly=original.repair_reserve_monthly if hasattr(original, 'repair_reserve_monthly') else 0,
-        fire_insurance_monthly=original.fire_insurance_monthly if hasattr(original, 'fire_insurance_monthly') else 0,
-        purchase_price=original.purchase_price if hasattr(original, 'purchase_price') else 0,
-        down_payment=original.down_payment if hasattr(original, 'down_payment') else 0,
-        loan_interest_rate=original.loan_interest_rate if hasattr(original, 'loan_interest_rate') else 0,
-        loan_term_years=original.loan_term_years if hasattr(original, 'loan_term_years') else 0,
-        repayment_method=original.repayment_method if hasattr(original, 'repayment_method') else None,
-        monthly_total_amount=original.monthly_total_amount if hasattr(original, 'monthly_total_amount') else 0
-    )
-    
-    db.session.add(new_expense)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '住宅費をコピーしました',
-        'new_id': new_expense.id
+        'new_id': new_id
     })
 
 @app.route('/api/salary-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_salary_income(income_id):
-    # 元のデータを取得
-    original = SalaryIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(SalaryIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '給与収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = SalaryIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_bonus=original.annual_bonus,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        salary_increase_rate=original.salary_increase_rate if hasattr(original, 'salary_increase_rate') else 3.0,
-        has_cap=original.has_cap if hasattr(original, 'has_cap') else False,
-        annual_income_cap=original.annual_income_cap if hasattr(original, 'annual_income_cap') else 0
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '給与収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 @app.route('/api/sidejob-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_sidejob_income(income_id):
-    # 元のデータを取得
-    original = SidejobIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(SidejobIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '副業収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = SidejobIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        income_increase_rate=original.income_increase_rate if hasattr(original, 'income_increase_rate') else 0.0,
-        has_cap=original.has_cap if hasattr(original, 'has_cap') else False,
-        annual_income_cap=original.annual_income_cap if hasattr(original, 'annual_income_cap') else 0
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '副業収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 @app.route('/api/investment-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_investment_income(income_id):
-    # 元のデータを取得
-    original = InvestmentIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(InvestmentIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '投資収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = InvestmentIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        annual_return_rate=original.annual_return_rate if hasattr(original, 'annual_return_rate') else 5.0
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '投資収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 @app.route('/api/pension-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_pension_income(income_id):
-    # 元のデータを取得
-    original = PensionIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(PensionIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '年金収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = PensionIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '年金収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 @app.route('/api/other-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_other_income(income_id):
-    # 元のデータを取得
-    original = OtherIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(OtherIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': 'その他収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = OtherIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': 'その他収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 @app.route('/api/business-incomes/<int:income_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_business_income(income_id):
-    # 元のデータを取得
-    original = BusinessIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(BusinessIncomes, current_user.id, income_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '事業収入データが見つかりません'}), 404
-    
-    # 新しいデータを作成（IDを除いて全てコピー）
-    new_income = BusinessIncomes(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        monthly_amount=original.monthly_amount,
-        annual_amount=original.annual_amount,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        income_increase_rate=original.income_increase_rate,
-        has_cap=original.has_cap,
-        annual_income_cap=original.annual_income_cap
-    )
-    
-    db.session.add(new_income)
     db.session.commit()
     
     return jsonify({
-        'success': True, 
+        'success': True,
         'message': '事業収入をコピーしました',
-        'new_id': new_income.id
+        'new_id': new_id
     })
 
 # Simulation API
@@ -2247,15 +2716,15 @@ def api_insurance_expenses():
         
         # Calculate monthly total with proper type conversion
         monthly_total = sum([
-            float(data.get('medical_insurance', 0) or 0),
-            float(data.get('cancer_insurance', 0) or 0),
-            float(data.get('life_insurance', 0) or 0),
-            float(data.get('income_protection', 0) or 0),
-            float(data.get('accident_insurance', 0) or 0),
-            float(data.get('liability_insurance', 0) or 0),
-            float(data.get('fire_insurance', 0) or 0),
-            float(data.get('long_term_care_insurance', 0) or 0),
-            float(data.get('other_insurance', 0) or 0)
+            to_yen(data.get('medical_insurance', 0) or 0),
+            to_yen(data.get('cancer_insurance', 0) or 0),
+            to_yen(data.get('life_insurance', 0) or 0),
+            to_yen(data.get('income_protection', 0) or 0),
+            to_yen(data.get('accident_insurance', 0) or 0),
+            to_yen(data.get('liability_insurance', 0) or 0),
+            to_yen(data.get('fire_insurance', 0) or 0),
+            to_yen(data.get('long_term_care_insurance', 0) or 0),
+            to_yen(data.get('other_insurance', 0) or 0)
         ])
         
         expense = InsuranceExpenses(
@@ -2264,15 +2733,15 @@ def api_insurance_expenses():
             description=data.get('description'),
             start_year=int(data.get('start_year', 0)),
             end_year=int(data.get('end_year', 0)),
-            medical_insurance=float(data.get('medical_insurance', 0) or 0),
-            cancer_insurance=float(data.get('cancer_insurance', 0) or 0),
-            life_insurance=float(data.get('life_insurance', 0) or 0),
-            income_protection=float(data.get('income_protection', 0) or 0),
-            accident_insurance=float(data.get('accident_insurance', 0) or 0),
-            liability_insurance=float(data.get('liability_insurance', 0) or 0),
-            fire_insurance=float(data.get('fire_insurance', 0) or 0),
-            long_term_care_insurance=float(data.get('long_term_care_insurance', 0) or 0),
-            other_insurance=float(data.get('other_insurance', 0) or 0),
+            medical_insurance=to_yen(data.get('medical_insurance', 0) or 0),
+            cancer_insurance=to_yen(data.get('cancer_insurance', 0) or 0),
+            life_insurance=to_yen(data.get('life_insurance', 0) or 0),
+            income_protection=to_yen(data.get('income_protection', 0) or 0),
+            accident_insurance=to_yen(data.get('accident_insurance', 0) or 0),
+            liability_insurance=to_yen(data.get('liability_insurance', 0) or 0),
+            fire_insurance=to_yen(data.get('fire_insurance', 0) or 0),
+            long_term_care_insurance=to_yen(data.get('long_term_care_insurance', 0) or 0),
+            other_insurance=to_yen(data.get('other_insurance', 0) or 0),
             insured_person=data.get('insured_person'),
             insurance_company=data.get('insurance_company'),
             insurance_term_years=int(data.get('insurance_term_years', 0) or 0),
@@ -2298,15 +2767,15 @@ def api_insurance_expenses():
         
         # Calculate monthly total with proper type conversion
         monthly_total = sum([
-            float(data.get('medical_insurance', 0) or 0),
-            float(data.get('cancer_insurance', 0) or 0),
-            float(data.get('life_insurance', 0) or 0),
-            float(data.get('income_protection', 0) or 0),
-            float(data.get('accident_insurance', 0) or 0),
-            float(data.get('liability_insurance', 0) or 0),
-            float(data.get('fire_insurance', 0) or 0),
-            float(data.get('long_term_care_insurance', 0) or 0),
-            float(data.get('other_insurance', 0) or 0)
+            to_yen(data.get('medical_insurance', 0) or 0),
+            to_yen(data.get('cancer_insurance', 0) or 0),
+            to_yen(data.get('life_insurance', 0) or 0),
+            to_yen(data.get('income_protection', 0) or 0),
+            to_yen(data.get('accident_insurance', 0) or 0),
+            to_yen(data.get('liability_insurance', 0) or 0),
+            to_yen(data.get('fire_insurance', 0) or 0),
+            to_yen(data.get('long_term_care_insurance', 0) or 0),
+            to_yen(data.get('other_insurance', 0) or 0)
         ])
         
         # Update expense data
@@ -2314,15 +2783,15 @@ def api_insurance_expenses():
         expense.description = data.get('description')
         expense.start_year = int(data.get('start_year', 0))
         expense.end_year = int(data.get('end_year', 0))
-        expense.medical_insurance = float(data.get('medical_insurance', 0) or 0)
-        expense.cancer_insurance = float(data.get('cancer_insurance', 0) or 0)
-        expense.life_insurance = float(data.get('life_insurance', 0) or 0)
-        expense.income_protection = float(data.get('income_protection', 0) or 0)
-        expense.accident_insurance = float(data.get('accident_insurance', 0) or 0)
-        expense.liability_insurance = float(data.get('liability_insurance', 0) or 0)
-        expense.fire_insurance = float(data.get('fire_insurance', 0) or 0)
-        expense.long_term_care_insurance = float(data.get('long_term_care_insurance', 0) or 0)
-        expense.other_insurance = float(data.get('other_insurance', 0) or 0)
+        expense.medical_insurance = to_yen(data.get('medical_insurance', 0) or 0)
+        expense.cancer_insurance = to_yen(data.get('cancer_insurance', 0) or 0)
+        expense.life_insurance = to_yen(data.get('life_insurance', 0) or 0)
+        expense.income_protection = to_yen(data.get('income_protection', 0) or 0)
+        expense.accident_insurance = to_yen(data.get('accident_insurance', 0) or 0)
+        expense.liability_insurance = to_yen(data.get('liability_insurance', 0) or 0)
+        expense.fire_insurance = to_yen(data.get('fire_insurance', 0) or 0)
+        expense.long_term_care_insurance = to_yen(data.get('long_term_care_insurance', 0) or 0)
+        expense.other_insurance = to_yen(data.get('other_insurance', 0) or 0)
         expense.insured_person = data.get('insured_person')
         expense.insurance_company = data.get('insurance_company')
         expense.insurance_term_years = int(data.get('insurance_term_years', 0) or 0)
@@ -2387,7 +2856,7 @@ def api_event_expenses():
                 start_year=int(data.get('start_year', 0)),
                 end_year=int(data.get('end_year', 0)),
                 category=category,
-                amount=float(data.get('amount', 0) or 0),
+                amount=to_yen(data.get('amount', 0) or 0),
                 is_recurring=bool(data.get('is_recurring', False)),
                 recurrence_interval=int(data.get('recurrence_interval', 1)),
                 recurrence_count=int(data.get('recurrence_count', 1))
@@ -2437,7 +2906,7 @@ def api_event_expenses():
             expense.start_year = int(data.get('start_year', 0))
             expense.end_year = int(data.get('end_year', 0))
             expense.category = category
-            expense.amount = float(data.get('amount', 0) or 0)
+            expense.amount = to_yen(data.get('amount', 0) or 0)
             expense.is_recurring = bool(data.get('is_recurring', False))
             expense.recurrence_interval = int(data.get('recurrence_interval', 1))
             expense.recurrence_count = int(data.get('recurrence_count', 1))
@@ -2473,127 +2942,48 @@ def api_event_expenses():
 
 @app.route('/api/event-expenses/<int:expense_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_events_expense(expense_id):
-    # 元のデータを取得
-    original = EventExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(EventExpenses, current_user.id, expense_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '元データが見つかりません'}), 404
-    
-    # コピーを作成
-    copy = EventExpenses(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        category=original.category,
-        amount=original.amount,
-        is_recurring=original.is_recurring if hasattr(original, 'is_recurring') else False,
-        recurrence_interval=original.recurrence_interval if hasattr(original, 'recurrence_interval') else 1,
-        recurrence_count=original.recurrence_count if hasattr(original, 'recurrence_count') else 1
-    )
-    
-    db.session.add(copy)
     db.session.commit()
     
     return jsonify({
         'success': True,
         'message': '特別費をコピーしました',
-        'new_id': copy.id
+        'new_id': new_id
     })
 
 @app.route('/api/insurance-expenses/<int:expense_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_insurance_expense(expense_id):
-    # 元のデータを取得
-    original = InsuranceExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-    if not original:
+    new_id = copy_plan_item(InsuranceExpenses, current_user.id, expense_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '元データが見つかりません'}), 404
-    
-    # コピーを作成
-    copy = InsuranceExpenses(
-        user_id=current_user.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        medical_insurance=original.medical_insurance if hasattr(original, 'medical_insurance') else 0,
-        cancer_insurance=original.cancer_insurance if hasattr(original, 'cancer_insurance') else 0,
-        life_insurance=original.life_insurance if hasattr(original, 'life_insurance') else 0,
-        income_protection=original.income_protection if hasattr(original, 'income_protection') else 0,
-        accident_insurance=original.accident_insurance if hasattr(original, 'accident_insurance') else 0,
-        liability_insurance=original.liability_insurance if hasattr(original, 'liability_insurance') else 0,
-        fire_insurance=original.fire_insurance if hasattr(original, 'fire_insurance') else 0,
-        long_term_care_insurance=original.long_term_care_insurance if hasattr(original, 'long_term_care_insurance') else 0,
-        other_insurance=original.other_insurance if hasattr(original, 'other_insurance') else 0,
-        insured_person=original.insured_person if hasattr(original, 'insured_person') else None,
-        insurance_company=original.insurance_company if hasattr(original, 'insurance_company') else None,
-        insurance_term_years=original.insurance_term_years if hasattr(original, 'insurance_term_years') else 0,
-        renew_type=original.renew_type if hasattr(original, 'renew_type') else None,
-        monthly_total_amount=original.monthly_total_amount if hasattr(original, 'monthly_total_amount') else 0
-    )
-    
-    db.session.add(copy)
     db.session.commit()
     
     return jsonify({
         'success': True,
         'message': '保険費をコピーしました',
-        'new_id': copy.id
+        'new_id': new_id
     })
 
 @app.route('/api/education-expenses/<int:expense_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_education_expense(expense_id):
-    # 元のデータを取得
-    original = EducationExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-    if not original:
+    # 一覧・詳細・削除と同じく教育プランの統合IDで指定し、全段階の教育費ごと複製する
+    new_id = copy_plan_item(EducationPlans, current_user.id, expense_id)
+    if new_id is None:
         return jsonify({'success': False, 'message': '教育費データが見つかりません'}), 404
-    
-    # 教育プランも一緒にコピー
-    original_plan = original.education_plan
-    if not original_plan:
-        return jsonify({'success': False, 'message': '教育プランが見つかりません'}), 404
-    
-    # 新しい教育プランを作成
-    new_plan = EducationPlans(
-        user_id=current_user.id,
-        name=original_plan.name + ' (コピー)',
-        description=original_plan.description,
-        child_name=original_plan.child_name,
-        child_birth_date=original_plan.child_birth_date,
-        kindergarten_type=original_plan.kindergarten_type if hasattr(original_plan, 'kindergarten_type') else None,
-        elementary_type=original_plan.elementary_type if hasattr(original_plan, 'elementary_type') else None,
-        junior_type=original_plan.junior_type if hasattr(original_plan, 'junior_type') else None,
-        high_type=original_plan.high_type if hasattr(original_plan, 'high_type') else None,
-        college_type=original_plan.college_type if hasattr(original_plan, 'college_type') else None
-    )
-    
-    db.session.add(new_plan)
-    db.session.flush()  # プランのIDを取得するためにflush
-    
-    # 新しい教育費を作成
-    new_expense = EducationExpenses(
-        user_id=current_user.id,
-        education_plan_id=new_plan.id,
-        name=original.name + ' (コピー)',
-        description=original.description,
-        start_year=original.start_year,
-        end_year=original.end_year,
-        child_name=original.child_name,
-        child_birth_date=original.child_birth_date,
-        stage=original.stage if hasattr(original, 'stage') else '',
-        stage_type=original.stage_type if hasattr(original, 'stage_type') else '',
-        monthly_amount=original.monthly_amount if hasattr(original, 'monthly_amount') else 0
-    )
-    
-    db.session.add(new_expense)
     db.session.commit()
     
     return jsonify({
         'success': True,
         'message': '教育費をコピーしました',
-        'new_id': new_expense.id
+        'new_id': new_id
     })
 
 # 副業収入API
@@ -2603,7 +2993,7 @@ def api_sidejob_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income = SidejobIncomes(
             user_id=current_user.id,
             name=data.get('name'),
@@ -2614,7 +3004,7 @@ def api_sidejob_incomes():
             end_year=int(data.get('end_year', 0)),
             income_increase_rate=float(data.get('income_increase_rate', 0.0)),
             has_cap=bool(data.get('has_cap', False)),
-            annual_income_cap=float(data.get('annual_income_cap', 0) or 0)
+            annual_income_cap=to_yen(data.get('annual_income_cap', 0) or 0)
         )
         
         db.session.add(income)
@@ -2633,7 +3023,7 @@ def api_sidejob_incomes():
         if not income:
             return jsonify({'success': False, 'message': '指定された副業収入が見つかりません'}), 404
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         
         # Update income data
         income.name = data.get('name')
@@ -2644,7 +3034,7 @@ def api_sidejob_incomes():
         income.end_year = int(data.get('end_year', 0))
         income.income_increase_rate = float(data.get('income_increase_rate', 0.0))
         income.has_cap = bool(data.get('has_cap', False))
-        income.annual_income_cap = float(data.get('annual_income_cap', 0) or 0)
+        income.annual_income_cap = to_yen(data.get('annual_income_cap', 0) or 0)
         
         db.session.commit()
         
@@ -2672,7 +3062,7 @@ def api_investment_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income = InvestmentIncomes(
             user_id=current_user.id,
             name=data.get('name'),
@@ -2697,7 +3087,7 @@ def api_investment_incomes():
         if not income:
             return jsonify({'success': False, 'message': '投資収入が見つかりません'})
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         
         # Update income data
         income.name = data.get('name')
@@ -2732,7 +3122,7 @@ def api_pension_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income = PensionIncomes(
             user_id=current_user.id,
             name=data.get('name'),
@@ -2767,7 +3157,7 @@ def api_other_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income = OtherIncomes(
             user_id=current_user.id,
             name=data.get('name'),
@@ -2802,7 +3192,7 @@ def api_business_incomes():
     if request.method == 'POST':
         data = request.get_json()
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income = BusinessIncomes(
             user_id=current_user.id,
             name=data.get('name'),
@@ -2813,7 +3203,7 @@ def api_business_incomes():
             end_year=int(data.get('end_year', 0)),
             income_increase_rate=float(data.get('income_increase_rate', 0) or 0),
             has_cap=bool(data.get('has_cap', False)),
-            annual_income_cap=float(data.get('annual_income_cap', 0) or 0)
+            annual_income_cap=to_yen(data.get('annual_income_cap', 0) or 0)
         )
         
         db.session.add(income)
@@ -2829,7 +3219,7 @@ def api_business_incomes():
         if not income:
             return jsonify({'success': False, 'message': '事業収入が見つかりません'})
         
-        monthly_amount = float(data.get('monthly_amount', 0) or 0)
+        monthly_amount = to_yen(data.get('monthly_amount', 0) or 0)
         income.name = data.get('name')
         income.description = data.get('description')
         income.monthly_amount = monthly_amount
@@ -2838,7 +3228,7 @@ def api_business_incomes():
         income.end_year = int(data.get('end_year', 0))
         income.income_increase_rate = float(data.get('income_increase_rate', 0) or 0)
         income.has_cap = bool(data.get('has_cap', False))
-        income.annual_income_cap = float(data.get('annual_income_cap', 0) or 0)
+        income.annual_income_cap = to_yen(data.get('annual_income_cap', 0) or 0)
         
         db.session.commit()
         
@@ -2983,123 +3373,162 @@ def api_delete_other_income(income_id):
     return jsonify({'success': False, 'message': 'その他収入が見つかりません'})
 
 # 各種データ取得API（シミュレーション選択用）
+# 種別 → (モデル, 一覧の出力項目の対応表)
+_education_monthly_total = db.func.coalesce(db.func.sum(EducationExpenses.monthly_amount), 0)
+ALL_EXPENSE_FIELDS = {
+    'living': (LivingExpenses, item_fields(
+        LivingExpenses, 'name', 'description', 'start_year', 'end_year', 'monthly_total_amount',
+        annual_amount=LivingExpenses.monthly_total_amount * 12
+    )),
+    'education': (EducationPlans, item_fields(
+        EducationPlans, 'name', 'description', 'child_name',
+        start_year=db.func.coalesce(db.func.min(EducationExpenses.start_year), 0),
+        end_year=db.func.coalesce(db.func.max(EducationExpenses.end_year), 0),
+        monthly_total_amount=_education_monthly_total,
+        annual_amount=_education_monthly_total * 12
+    )),
+    'housing': (HousingExpenses, item_fields(
+        HousingExpenses, 'name', 'description', 'start_year', 'end_year', 'monthly_total_amount', 'residence_type',
+        annual_amount=HousingExpenses.monthly_total_amount * 12
+    )),
+    'insurance': (InsuranceExpenses, item_fields(
+        InsuranceExpenses, 'name', 'description', 'start_year', 'end_year', 'monthly_total_amount', 'insured_person',
+        annual_amount=InsuranceExpenses.monthly_total_amount * 12
+    )),
+    'event': (EventExpenses, item_fields(
+        EventExpenses, 'name', 'description', 'start_year', 'end_year', 'amount', 'category'
+    )),
+}
+_INCOME_COLUMNS = ('name', 'description', 'start_year', 'end_year', 'monthly_amount', 'annual_amount')
+ALL_INCOME_FIELDS = {
+    'salary': (SalaryIncomes, item_fields(SalaryIncomes, *_INCOME_COLUMNS, 'annual_bonus')),
+    'sidejob': (SidejobIncomes, item_fields(SidejobIncomes, *_INCOME_COLUMNS)),
+    'business': (BusinessIncomes, item_fields(BusinessIncomes, *_INCOME_COLUMNS)),
+    'investment': (InvestmentIncomes, item_fields(InvestmentIncomes, *_INCOME_COLUMNS)),
+    'pension': (PensionIncomes, item_fields(PensionIncomes, *_INCOME_COLUMNS)),
+    'other': (OtherIncomes, item_fields(OtherIncomes, *_INCOME_COLUMNS)),
+}
+
 @app.route('/api/all-expenses', methods=['GET'])
 @login_required
 def api_all_expenses():
-    living_expenses = LivingExpenses.query.filter_by(user_id=current_user.id).all()
-    education_plans = EducationPlans.query.filter_by(user_id=current_user.id).all()  # 統合ID使用
-    housing_expenses = HousingExpenses.query.filter_by(user_id=current_user.id).all()
-    insurance_expenses = InsuranceExpenses.query.filter_by(user_id=current_user.id).all()
-    event_expenses = EventExpenses.query.filter_by(user_id=current_user.id).all()
-    
-    # 教育費の統合表示用データ作成
-    education_list = []
-    for plan in education_plans:
-        # 関連する教育費の合計を計算
-        related_expenses = EducationExpenses.query.filter_by(education_plan_id=plan.id).all()
-        total_monthly = sum(exp.monthly_amount for exp in related_expenses)
-        
-        # 期間の最小開始年と最大終了年を取得
-        start_years = [exp.start_year for exp in related_expenses]
-        end_years = [exp.end_year for exp in related_expenses]
-        
-        education_list.append({
-            'id': plan.id,  # 統合ID
-            'name': plan.name,
-            'description': plan.description,
-            'start_year': min(start_years) if start_years else 0,
-            'end_year': max(end_years) if end_years else 0,
-            'monthly_total_amount': total_monthly,
-            'annual_amount': total_monthly * 12,
-            'child_name': plan.child_name
-        })
-    
-    return jsonify({
-        'living': [{
-            'id': e.id, 'name': e.name, 'description': e.description,
-            'start_year': e.start_year, 'end_year': e.end_year,
-            'monthly_total_amount': e.monthly_total_amount,
-            'annual_amount': e.monthly_total_amount * 12
-        } for e in living_expenses],
-        'education': education_list,
-        'housing': [{
-            'id': e.id, 'name': e.name, 'description': e.description,
-            'start_year': e.start_year, 'end_year': e.end_year,
-            'monthly_total_amount': e.monthly_total_amount,
-            'annual_amount': e.monthly_total_amount * 12,
-            'residence_type': e.residence_type.value
-        } for e in housing_expenses],
-        'insurance': [{
-            'id': e.id, 'name': e.name, 'description': e.description,
-            'start_year': e.start_year, 'end_year': e.end_year,
-            'monthly_total_amount': e.monthly_total_amount,
-            'annual_amount': e.monthly_total_amount * 12,
-            'insured_person': e.insured_person
-        } for e in insurance_expenses],
-        'event': [{
-            'id': e.id, 'name': e.name, 'description': e.description,
-            'start_year': e.start_year, 'end_year': e.end_year,
-            'amount': e.amount,
-            'category': e.category.value
-        } for e in event_expenses]
-    })
+    try:
+        names = requested_fields(*(fields for _, fields in ALL_EXPENSE_FIELDS.values()))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # 全種別を1クエリで読む（教育費は統合ID（教育プラン）毎に各段階の合計と期間を集計する）
+    return jsonify(project_rows_by_type({
+        expense_type: (model, fields,
+                       (EducationExpenses, EducationExpenses.education_plan_id == EducationPlans.id)
+                       if model is EducationPlans else None)
+        for expense_type, (model, fields) in ALL_EXPENSE_FIELDS.items()
+    }, names, current_user.id))
 
 @app.route('/api/all-incomes', methods=['GET'])
 @login_required
 def api_all_incomes():
-    salary_incomes = SalaryIncomes.query.filter_by(user_id=current_user.id).all()
-    sidejob_incomes = SidejobIncomes.query.filter_by(user_id=current_user.id).all()
-    business_incomes = BusinessIncomes.query.filter_by(user_id=current_user.id).all()
-    investment_incomes = InvestmentIncomes.query.filter_by(user_id=current_user.id).all()
-    pension_incomes = PensionIncomes.query.filter_by(user_id=current_user.id).all()
-    other_incomes = OtherIncomes.query.filter_by(user_id=current_user.id).all()
-    
-    return jsonify({
-        'salary': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_bonus': i.annual_bonus, 'annual_amount': i.annual_amount
-        } for i in salary_incomes],
-        'sidejob': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_amount': i.annual_amount
-        } for i in sidejob_incomes],
-        'business': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_amount': i.annual_amount
-        } for i in business_incomes],
-        'investment': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_amount': i.annual_amount
-        } for i in investment_incomes],
-        'pension': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_amount': i.annual_amount
-        } for i in pension_incomes],
-        'other': [{
-            'id': i.id, 'name': i.name, 'description': i.description,
-            'start_year': i.start_year, 'end_year': i.end_year,
-            'monthly_amount': i.monthly_amount, 'annual_amount': i.annual_amount
-        } for i in other_incomes]
-    })
+    try:
+        names = requested_fields(*(fields for _, fields in ALL_INCOME_FIELDS.values()))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify(project_rows_by_type({
+        income_type: (model, fields, None)
+        for income_type, (model, fields) in ALL_INCOME_FIELDS.items()
+    }, names, current_user.id))
+
+def normalize_selected_ids(selected, models):
+    """{種別: [項目ID, ...]} の選択を種別毎の重複のないintのIDのリスト（指定順）にする。不明な種別・不正なIDはValueError"""
+    if not isinstance(selected, dict):
+        raise ValueError('選択項目の形式が不正です')
+    normalized = {}
+    for item_type, item_ids in selected.items():
+        if item_type not in models:
+            raise ValueError(f'不明な項目種別です: {item_type}')
+        if item_ids is None:
+            item_ids = []
+        if not isinstance(item_ids, list):
+            raise ValueError(f'項目IDが不正です: {item_type}')
+        try:
+            normalized[item_type] = list(dict.fromkeys(int(item_id) for item_id in item_ids))
+        except (TypeError, ValueError):
+            raise ValueError(f'項目IDが不正です: {item_type}')
+    return normalized
+
+def fetch_selected_items(user_id, selected_ids, models, load=False):
+    """
+    正規化済みの選択について、種別毎に WHERE user_id = ? AND id IN (...) の1クエリで所有を確認する
+    他人の項目・存在しない項目が1件でもあればValueError。load=Trueなら行を、そうでなければIDを指定順で返す
+    """
+    items = {}
+    for item_type, item_ids in selected_ids.items():
+        if not item_ids:
+            items[item_type] = []
+            continue
+        model = models[item_type]
+        rows = db.session.execute(
+            db.select(model if load else model.id).where(model.user_id == user_id, model.id.in_(item_ids))
+        ).scalars().all()
+        found = {row.id: row for row in rows} if load else {row: row for row in rows}
+        if len(found) != len(item_ids):
+            raise ValueError(f'選択された項目が見つかりません: {item_type}')
+        items[item_type] = [found[item_id] for item_id in item_ids]
+    return items
+
+def sync_plan_links(plan_id, user_id, selected_expenses, selected_incomes):
+    """
+    プランのリンクを選択内容に合わせる（差分同期）
+    既存リンクとの差分だけを1回の一括DELETEと1回の一括INSERTで反映し、変わらないリンクには触れない
+    追加する項目IDの所有者は種別ごとに1クエリで確認し、不正な種別・他人の項目が含まれていればValueError
+    """
+    for (link_model, type_column, id_column, models), selected in zip(
+        PLAN_LINK_TABLES, (selected_expenses or {}, selected_incomes or {})
+    ):
+        wanted = {
+            (link_type, item_id)
+            for link_type, item_ids in normalize_selected_ids(selected, models).items() for item_id in item_ids
+        }
+        
+        current = {}
+        for link_id, link_type, item_id in db.session.execute(
+            db.select(link_model.id, type_column, id_column).where(link_model.lifeplan_id == plan_id)
+        ):
+            current.setdefault((link_type, item_id), []).append(link_id)
+        
+        added = wanted - current.keys()
+        added_by_type = {}
+        for link_type, item_id in sorted(added):
+            added_by_type.setdefault(link_type, []).append(item_id)
+        fetch_selected_items(user_id, added_by_type, models)
+        
+        removed = [link_id for key, link_ids in current.items() if key not in wanted for link_id in link_ids]
+        if removed:
+            db.session.execute(db.delete(link_model).where(link_model.id.in_(removed)))
+        if added:
+            db.session.execute(insert(link_model), [
+                {'lifeplan_id': plan_id, type_column.key: link_type, id_column.key: item_id}
+                for link_type, item_id in sorted(added)
+            ])
 
 # Simulation Plans CRUD API
 @app.route('/api/simulation-plans', methods=['GET', 'POST', 'PUT'])
 @login_required
 def api_simulation_plans():
     if request.method == 'GET':
-        plans = LifeplanSimulations.query.filter_by(user_id=current_user.id).order_by(LifeplanSimulations.created_at.desc()).all()
+        # 支出・収入のリンク件数はプラン一覧と同じクエリで数える
+        expense_count = db.select(db.func.count()).where(LifeplanExpenseLinks.lifeplan_id == LifeplanSimulations.id)\
+            .scalar_subquery()
+        income_count = db.select(db.func.count()).where(LifeplanIncomeLinks.lifeplan_id == LifeplanSimulations.id)\
+            .scalar_subquery()
+        plans = db.session.execute(
+            db.select(LifeplanSimulations, expense_count, income_count)
+            .where(LifeplanSimulations.user_id == current_user.id)
+            .order_by(LifeplanSimulations.created_at.desc())
+        ).all()
         
         plan_list = []
-        for plan in plans:
-            # 関連する支出・収入項目を取得
-            expense_links = LifeplanExpenseLinks.query.filter_by(lifeplan_id=plan.id).all()
-            income_links = LifeplanIncomeLinks.query.filter_by(lifeplan_id=plan.id).all()
-            
+        for plan, expense_links_count, income_links_count in plans:
             plan_list.append({
                 'id': plan.id,
                 'name': plan.name,
@@ -3107,8 +3536,8 @@ def api_simulation_plans():
                 'base_age': plan.base_age,
                 'start_year': plan.start_year,
                 'end_year': plan.end_year,
-                'expense_count': len(expense_links),
-                'income_count': len(income_links),
+                'expense_count': expense_links_count,
+                'income_count': income_links_count,
                 'created_at': plan.created_at.strftime('%Y-%m-%d %H:%M')
             })
         
@@ -3140,27 +3569,8 @@ def api_simulation_plans():
             db.session.add(plan)
             db.session.flush()  # IDを取得するためflush
             
-            # 選択された支出項目のリンクを保存
-            selected_expenses = data.get('selected_expenses', {})
-            for expense_type, expense_ids in selected_expenses.items():
-                for expense_id in expense_ids:
-                    link = LifeplanExpenseLinks(
-                        lifeplan_id=plan.id,
-                        expense_type=expense_type,
-                        expense_id=expense_id
-                    )
-                    db.session.add(link)
-            
-            # 選択された収入項目のリンクを保存
-            selected_incomes = data.get('selected_incomes', {})
-            for income_type, income_ids in selected_incomes.items():
-                for income_id in income_ids:
-                    link = LifeplanIncomeLinks(
-                        lifeplan_id=plan.id,
-                        income_type=income_type,
-                        income_id=income_id
-                    )
-                    db.session.add(link)
+            # 選択された支出・収入項目のリンクを保存
+            sync_plan_links(plan.id, current_user.id, data.get('selected_expenses', {}), data.get('selected_incomes', {}))
             
             db.session.commit()
             
@@ -3168,6 +3578,9 @@ def api_simulation_plans():
                 'message': 'シミュレーションプランが登録されました',
                 'plan_id': plan.id
             })
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': f'プランの作成中にエラーが発生しました: {str(e)}'}), 500
@@ -3194,34 +3607,15 @@ def api_simulation_plans():
             plan.start_year = data.get('start_year')
             plan.end_year = data.get('end_year')
             
-            # 既存のリンクを削除
-            LifeplanExpenseLinks.query.filter_by(lifeplan_id=plan.id).delete()
-            LifeplanIncomeLinks.query.filter_by(lifeplan_id=plan.id).delete()
-            
-            # 新しいリンクを追加
-            selected_expenses = data.get('selected_expenses', {})
-            for expense_type, expense_ids in selected_expenses.items():
-                for expense_id in expense_ids:
-                    link = LifeplanExpenseLinks(
-                        lifeplan_id=plan.id,
-                        expense_type=expense_type,
-                        expense_id=expense_id
-                    )
-                    db.session.add(link)
-            
-            selected_incomes = data.get('selected_incomes', {})
-            for income_type, income_ids in selected_incomes.items():
-                for income_id in income_ids:
-                    link = LifeplanIncomeLinks(
-                        lifeplan_id=plan.id,
-                        income_type=income_type,
-                        income_id=income_id
-                    )
-                    db.session.add(link)
+            # リンクは差分だけを反映
+            sync_plan_links(plan.id, current_user.id, data.get('selected_expenses', {}), data.get('selected_incomes', {}))
             
             db.session.commit()
             
             return jsonify({'message': 'シミュレーションプランが更新されました'})
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': f'プランの更新中にエラーが発生しました: {str(e)}'}), 500
@@ -3276,53 +3670,83 @@ def api_simulation_plan_detail(plan_id):
 
 @app.route('/api/simulation-plans/<int:plan_id>/copy', methods=['POST'])
 @login_required
+@idempotent
 def api_copy_simulation_plan(plan_id):
-    # 元のプランを取得
-    original_plan = LifeplanSimulations.query.filter_by(id=plan_id, user_id=current_user.id).first()
-    if not original_plan:
-        return jsonify({'success': False, 'message': 'プランが見つかりません'}), 404
-    
+    data = request.get_json(silent=True) or {}
     try:
-        # 新しいプランを作成
-        new_plan = LifeplanSimulations(
-            user_id=current_user.id,
-            name=original_plan.name + ' (コピー)',
-            description=original_plan.description,
-            base_age=original_plan.base_age,
-            start_year=original_plan.start_year,
-            end_year=original_plan.end_year
-        )
-        db.session.add(new_plan)
-        db.session.flush()  # IDを取得するためにflush
-        
-        # 元のプランの支出リンクをコピー
-        original_expense_links = LifeplanExpenseLinks.query.filter_by(lifeplan_id=plan_id).all()
-        for link in original_expense_links:
-            new_link = LifeplanExpenseLinks(
-                lifeplan_id=new_plan.id,
-                expense_type=link.expense_type,
-                expense_id=link.expense_id
-            )
-            db.session.add(new_link)
-        
-        # 元のプランの収入リンクをコピー
-        original_income_links = LifeplanIncomeLinks.query.filter_by(lifeplan_id=plan_id).all()
-        for link in original_income_links:
-            new_link = LifeplanIncomeLinks(
-                lifeplan_id=new_plan.id,
-                income_type=link.income_type,
-                income_id=link.income_id
-            )
-            db.session.add(new_link)
-        
+        # with_items=trueならリンクしている収入・支出項目も複製し、複製したプランから参照する
+        new_plan_id = copy_simulation_plan(current_user.id, plan_id, with_items=bool(data.get('with_items')))
+        if new_plan_id is None:
+            return jsonify({'success': False, 'message': 'プランが見つかりません'}), 404
         db.session.commit()
         
-        return jsonify({'success': True, 'message': 'シミュレーションプランをコピーしました'})
+        return jsonify({'success': True, 'message': 'シミュレーションプランをコピーしました', 'new_id': new_plan_id})
     
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'コピーに失敗しました: {str(e)}'}), 500
 
+# シミュレーション対象のプラン種別とモデル
+SIMULATION_INCOME_MODELS = {
+    'salary': SalaryIncomes,
+    'sidejob': SidejobIncomes,
+    'business': BusinessIncomes,
+    'investment': InvestmentIncomes,
+    'pension': PensionIncomes,
+    'other': OtherIncomes,
+}
+# 教育費は教育プラン（統合ID）で選択し、計算にはプランの各段階の教育費を使う
+SIMULATION_EXPENSE_MODELS = {
+    'living': LivingExpenses,
+    'housing': HousingExpenses,
+    'education': EducationPlans,
+    'insurance': InsuranceExpenses,
+    'event': EventExpenses,
+}
+
+def _education_stages(plans):
+    """教育プランの各段階の教育費をプランの指定順に返す"""
+    if not plans:
+        return []
+    stages = {}
+    for stage in EducationExpenses.query.filter(EducationExpenses.education_plan_id.in_([plan.id for plan in plans]))\
+            .order_by(EducationExpenses.id):
+        stages.setdefault(stage.education_plan_id, []).append(stage)
+    return [stage for plan in plans for stage in stages.get(plan.id, [])]
+
+def _yen_series(years, start_year, end_year, annual_amount, rate=0.0, cap=0):
+    """
+    年別の金額（円単位のint64配列）。期間外は0、rateは開始年からの年率%の複利
+    各年の金額は円未満を四捨五入してから合計する
+    """
+    active = (years >= start_year) & (years <= end_year)
+    amounts = float(annual_amount or 0) * (1 + (rate or 0) / 100) ** (years - start_year).astype(np.float64)
+    if cap and cap > 0:
+        amounts = np.minimum(amounts, cap)
+    return np.where(active, np.floor(amounts + 0.5), 0).astype(np.int64)
+
+def _income_series(income_type, income, years):
+    if income_type == 'salary':
+        annual = income.monthly_amount * 12 + (income.annual_bonus or 0)
+        return _yen_series(years, income.start_year, income.end_year, annual, income.salary_increase_rate,
+                           income.annual_income_cap if income.has_cap else 0)
+    if income_type in ('sidejob', 'business'):
+        return _yen_series(years, income.start_year, income.end_year, income.monthly_amount * 12,
+                           income.income_increase_rate, income.annual_income_cap if income.has_cap else 0)
+    if income_type == 'investment':
+        return _yen_series(years, income.start_year, income.end_year, income.annual_amount, income.annual_return_rate)
+    return _yen_series(years, income.start_year, income.end_year, income.annual_amount)
+
+def _expense_series(expense_type, expense, years):
+    if expense_type == 'living':
+        return _yen_series(years, expense.start_year, expense.end_year, (expense.monthly_total_amount or 0) * 12,
+                           expense.inflation_rate)
+    if expense_type == 'education':
+        return _yen_series(years, expense.start_year, expense.end_year, (expense.monthly_amount or 0) * 12)
+    if expense_type == 'event':
+        return _yen_series(years, expense.start_year, expense.end_year, expense.amount)
+    return _yen_series(years, expense.start_year, expense.end_year, (expense.monthly_total_amount or 0) * 12)
+
 @app.route('/api/simulate', methods=['POST'])
 @login_required
 def api_simulate():
@@ -3349,190 +3773,89 @@ def api_simulate():
             app.logger.error(f"シミュレーションバリデーションエラー - ユーザー: {current_user.id}, エラー: {error_msg}")
             return jsonify({'error': True, 'message': error_msg}), 400
         
+        # 選択項目は種別毎に1クエリで読み、他人の項目・存在しない項目が含まれていれば計算前に弾く
+        try:
+            incomes = fetch_selected_items(
+                current_user.id, normalize_selected_ids(selected_incomes, SIMULATION_INCOME_MODELS),
+                SIMULATION_INCOME_MODELS, load=True
+            )
+            expenses = fetch_selected_items(
+                current_user.id, normalize_selected_ids(selected_expenses, SIMULATION_EXPENSE_MODELS),
+                SIMULATION_EXPENSE_MODELS, load=True
+            )
+        except ValueError as e:
+            app.logger.error(f"シミュレーションバリデーションエラー - ユーザー: {current_user.id}, エラー: {str(e)}")
+            return jsonify({'error': True, 'message': str(e)}), 400
+        if 'education' in expenses:
+            expenses['education'] = _education_stages(expenses['education'])
+        
+        years = np.arange(start_year, end_year + 1, dtype=np.int64)
+        
+        # 収入計算（項目毎に年別の円単位int64配列を作る）
+        try:
+            income_series = []
+            for income_type in SIMULATION_INCOME_MODELS:
+                for income in incomes.get(income_type, []):
+                    income_series.append((income_type, income, _income_series(income_type, income, years)))
+        except Exception as e:
+            error_msg = f"収入計算エラー: {str(e)}"
+            app.logger.error(f"シミュレーション収入エラー - ユーザー: {current_user.id}, {error_msg}")
+            return jsonify({
+                'error': True, 
+                'message': '収入データの処理中にエラーが発生しました', 
+                'details': error_msg
+            }), 500
+        
+        # 支出計算
+        try:
+            expense_series = []
+            for expense_type in SIMULATION_EXPENSE_MODELS:
+                for expense in expenses.get(expense_type, []):
+                    expense_series.append((expense_type, expense, _expense_series(expense_type, expense, years)))
+        except Exception as e:
+            error_msg = f"支出計算エラー: {str(e)}"
+            app.logger.error(f"シミュレーション支出エラー - ユーザー: {current_user.id}, {error_msg}")
+            return jsonify({
+                'error': True, 
+                'message': '支出データの処理中にエラーが発生しました', 
+                'details': error_msg
+            }), 500
+        
+        # 年間収支・累計は整数の配列演算で求める（合計に丸め誤差が出ない）
+        zeros = np.zeros(len(years), dtype=np.int64)
+        year_incomes = np.sum([series for _, _, series in income_series], axis=0, dtype=np.int64) if income_series else zeros
+        year_expenses = np.sum([series for _, _, series in expense_series], axis=0, dtype=np.int64) if expense_series else zeros
+        annual_balances = year_incomes - year_expenses
+        cumulative_balances = np.cumsum(annual_balances)
+        
         simulation_data = []
-        cumulative_balance = 0
-        total_income = 0
-        total_expenses = 0
-        
-        for year in range(start_year, end_year + 1):
-            age = base_age + (year - start_year)
-            year_income = 0
-            year_expenses = 0
-            income_details = []
-            expense_details = []
-            
-            # 収入計算
-            try:
-                if 'salary' in selected_incomes:
-                    for income_id in selected_incomes['salary']:
-                        income = SalaryIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            # 昇給率を適用した複利計算
-                            years_passed = year - income.start_year
-                            
-                            # 月額給与の計算
-                            monthly_with_increase = income.monthly_amount * ((1 + income.salary_increase_rate / 100) ** years_passed)
-                            
-                            # ボーナスの計算
-                            bonus_with_increase = income.annual_bonus * ((1 + income.salary_increase_rate / 100) ** years_passed)
-                            
-                            # 年間収入の計算
-                            annual_amount = monthly_with_increase * 12 + bonus_with_increase
-                            
-                            # 年間収入上限の適用
-                            if hasattr(income, 'has_cap') and income.has_cap and hasattr(income, 'annual_income_cap') and income.annual_income_cap > 0:
-                                annual_amount = min(annual_amount, income.annual_income_cap)
-                            year_income += annual_amount
-                            income_details.append({'type': 'salary', 'name': income.name, 'amount': annual_amount})
-                
-                if 'sidejob' in selected_incomes:
-                    for income_id in selected_incomes['sidejob']:
-                        income = SidejobIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            # 昇給率を適用した複利計算（副業にも昇給率がある場合）
-                            years_passed = year - income.start_year
-                            increase_rate = income.income_increase_rate if hasattr(income, 'income_increase_rate') else 0.0
-                            
-                            # 月額収入の計算
-                            monthly_with_increase = income.monthly_amount * ((1 + increase_rate / 100) ** years_passed)
-                            
-                            # 年間収入の計算
-                            annual_amount = monthly_with_increase * 12
-                            
-                            # 年間収入上限の適用
-                            if hasattr(income, 'has_cap') and income.has_cap and hasattr(income, 'annual_income_cap') and income.annual_income_cap > 0:
-                                annual_amount = min(annual_amount, income.annual_income_cap)
-                            year_income += annual_amount
-                            income_details.append({'type': 'sidejob', 'name': income.name, 'amount': annual_amount})
-                
-                # business収入（事業収入）の計算を追加
-                if 'business' in selected_incomes:
-                    for income_id in selected_incomes['business']:
-                        income = BusinessIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            years_passed = year - income.start_year
-                            increase_rate = income.income_increase_rate if hasattr(income, 'income_increase_rate') else 0.0
-                            # 月額収入の計算
-                            monthly_with_increase = income.monthly_amount * ((1 + increase_rate / 100) ** years_passed)
-                            # 年間収入の計算
-                            annual_amount = monthly_with_increase * 12
-                            # 年間収入上限の適用
-                            if hasattr(income, 'has_cap') and income.has_cap and hasattr(income, 'annual_income_cap') and income.annual_income_cap > 0:
-                                annual_amount = min(annual_amount, income.annual_income_cap)
-                            year_income += annual_amount
-                            income_details.append({'type': 'business', 'name': income.name, 'amount': annual_amount})
-                
-                if 'investment' in selected_incomes:
-                    for income_id in selected_incomes['investment']:
-                        income = InvestmentIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            # 運用利回りを適用した複利計算
-                            years_passed = year - income.start_year
-                            annual_amount = income.annual_amount * ((1 + income.annual_return_rate / 100) ** years_passed)
-                            year_income += annual_amount
-                            income_details.append({'type': 'investment', 'name': income.name, 'amount': annual_amount})
-                
-                if 'pension' in selected_incomes:
-                    for income_id in selected_incomes['pension']:
-                        income = PensionIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            annual_amount = income.annual_amount
-                            year_income += annual_amount
-                            income_details.append({'type': 'pension', 'name': income.name, 'amount': annual_amount})
-                
-                if 'other' in selected_incomes:
-                    for income_id in selected_incomes['other']:
-                        income = OtherIncomes.query.filter_by(id=income_id, user_id=current_user.id).first()
-                        if income and income.start_year <= year <= income.end_year:
-                            annual_amount = income.annual_amount
-                            year_income += annual_amount
-                            income_details.append({'type': 'other', 'name': income.name, 'amount': annual_amount})
-            
-            except Exception as e:
-                error_msg = f"収入計算エラー（{year}年）: {str(e)}"
-                app.logger.error(f"シミュレーション収入エラー - ユーザー: {current_user.id}, {error_msg}")
-                return jsonify({
-                    'error': True, 
-                    'message': '収入データの処理中にエラーが発生しました', 
-                    'details': error_msg
-                }), 500
-            
-            # 支出計算
-            try:
-                if 'living' in selected_expenses:
-                    for expense_id in selected_expenses['living']:
-                        expense = LivingExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-                        if expense and expense.start_year <= year <= expense.end_year:
-                            # 物価上昇率を適用した複利計算
-                            years_passed = year - expense.start_year
-                            annual_amount = expense.monthly_total_amount * 12 * ((1 + expense.inflation_rate / 100) ** years_passed)
-                            year_expenses += annual_amount
-                            expense_details.append({'type': 'living', 'name': expense.name, 'amount': annual_amount})
-                
-                # その他の支出項目も同様に処理...
-                if 'housing' in selected_expenses:
-                    for expense_id in selected_expenses['housing']:
-                        expense = HousingExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-                        if expense and expense.start_year <= year <= expense.end_year:
-                            annual_amount = expense.monthly_total_amount * 12
-                            year_expenses += annual_amount
-                            expense_details.append({'type': 'housing', 'name': expense.name, 'amount': annual_amount})
-                
-                if 'education' in selected_expenses:
-                    for expense_id in selected_expenses['education']:
-                        expense = EducationExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-                        if expense and expense.start_year <= year <= expense.end_year:
-                            annual_amount = expense.monthly_amount * 12
-                            year_expenses += annual_amount
-                            expense_details.append({'type': 'education', 'name': expense.name, 'amount': annual_amount})
-                
-                if 'insurance' in selected_expenses:
-                    for expense_id in selected_expenses['insurance']:
-                        expense = InsuranceExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-                        if expense and expense.start_year <= year <= expense.end_year:
-                            annual_amount = expense.monthly_total_amount * 12
-                            year_expenses += annual_amount
-                            expense_details.append({'type': 'insurance', 'name': expense.name, 'amount': annual_amount})
-                
-                if 'event' in selected_expenses:
-                    for expense_id in selected_expenses['event']:
-                        expense = EventExpenses.query.filter_by(id=expense_id, user_id=current_user.id).first()
-                        if expense and expense.start_year <= year <= expense.end_year:
-                            annual_amount = expense.amount
-                            year_expenses += annual_amount
-                            expense_details.append({'type': 'event', 'name': expense.name, 'amount': annual_amount})
-            
-            except Exception as e:
-                error_msg = f"支出計算エラー（{year}年）: {str(e)}"
-                app.logger.error(f"シミュレーション支出エラー - ユーザー: {current_user.id}, {error_msg}")
-                return jsonify({
-                    'error': True, 
-                    'message': '支出データの処理中にエラーが発生しました', 
-                    'details': error_msg
-                }), 500
-            
-            # 年間収支計算
-            annual_balance = year_income - year_expenses
-            cumulative_balance += annual_balance
-            
-            total_income += year_income
-            total_expenses += year_expenses
-            
+        for index, year in enumerate(years.tolist()):
+            annual_balance = int(annual_balances[index])
             # デバッグログ: 収支がマイナスの場合のみログ出力
             if annual_balance < 0:
-                app.logger.info(f"年間収支マイナス - 年: {year}, 収入: {year_income:,.0f}, 支出: {year_expenses:,.0f}, 収支: {annual_balance:,.0f}")
+                app.logger.info(f"年間収支マイナス - 年: {year}, 収入: {int(year_incomes[index]):,}, 支出: {int(year_expenses[index]):,}, 収支: {annual_balance:,}")
             
             simulation_data.append({
                 'year': year,
-                'age': age,
-                'total_income': year_income,
-                'total_expenses': year_expenses,
+                'age': base_age + (year - start_year),
+                'total_income': int(year_incomes[index]),
+                'total_expenses': int(year_expenses[index]),
                 'balance': annual_balance,
-                'cumulative_balance': cumulative_balance,
-                'income_details': income_details,
-                'expense_details': expense_details
+                'cumulative_balance': int(cumulative_balances[index]),
+                'income_details': [
+                    {'type': income_type, 'name': income.name, 'amount': int(series[index])}
+                    for income_type, income, series in income_series if income.start_year <= year <= income.end_year
+                ],
+                'expense_details': [
+                    {'type': expense_type, 'name': expense.name, 'amount': int(series[index])}
+                    for expense_type, expense, series in expense_series if expense.start_year <= year <= expense.end_year
+                ]
             })
         
+        total_income = int(year_incomes.sum())
+        total_expenses = int(year_expenses.sum())
+        cumulative_balance = int(cumulative_balances[-1]) if len(cumulative_balances) else 0
+        
         # サマリー計算
         summary = {
             'total_years': len(simulation_data),
@@ -3702,50 +4025,35 @@ def api_delete_account():
         if not data or 'password' not in data:
             return jsonify({'error': 'パスワードが必要です'}), 400
         
-        # 現在のユーザーのパスワードを確認
-        if not check_password_hash(current_user.password_hash, data['password']):
+        # 現在のユーザーのパスワードを確認（キャッシュのユーザーはパスワードを持たないため読み直す）
+        user = find_user(current_user.id)
+        if not user or not check_password_hash(user.password_hash, data['password']):
             return jsonify({'error': 'パスワードが正しくありません'}), 401
         
-        user_id = current_user.id
-        username = current_user.username
+        user_id = user.id
+        username = user.username
         
-        # 関連データを削除（外部キー制約により自動削除されない場合のため）
+        # 関連データを集合単位のDELETEでまとめて削除（大きなユーザーはバックグラウンドで削除）
         try:
-            # 収入データの削除
-            SalaryIncomes.query.filter_by(user_id=user_id).delete()
-            SidejobIncomes.query.filter_by(user_id=user_id).delete()
-            InvestmentIncomes.query.filter_by(user_id=user_id).delete()
-            PensionIncomes.query.filter_by(user_id=user_id).delete()
-            OtherIncomes.query.filter_by(user_id=user_id).delete()
-            
-            # 支出データの削除
-            LivingExpenses.query.filter_by(user_id=user_id).delete()
-            HousingExpenses.query.filter_by(user_id=user_id).delete()
-            InsuranceExpenses.query.filter_by(user_id=user_id).delete()
-            EventExpenses.query.filter_by(user_id=user_id).delete()
-            EducationExpenses.query.filter_by(user_id=user_id).delete()
-            EducationPlans.query.filter_by(user_id=user_id).delete()
-            
-            # シミュレーション関連データの削除
-            simulation_plans = LifeplanSimulations.query.filter_by(user_id=user_id).all()
-            for plan in simulation_plans:
-                # 関連するリンクテーブルのデータを削除
-                LifeplanExpenseLinks.query.filter_by(lifeplan_id=plan.id).delete()
-                LifeplanIncomeLinks.query.filter_by(lifeplan_id=plan.id).delete()
-            
-            LifeplanSimulations.query.filter_by(user_id=user_id).delete()
-            
-            # ユーザーアカウントの削除
-            User.query.filter_by(id=user_id).delete()
+            # テナントモードはファイル削除で済むため常に同期で削除する
+            background = not tenant_mode_enabled() and count_user_rows(user_id) > PURGE_BACKGROUND_THRESHOLD
+            if background:
+                schedule_user_purge(user_id)
+            else:
+                counts = delete_user_data(user_id)
             
             # 変更をコミット
             db.session.commit()
+            invalidate_user_cache(user_id)
             
             # ログアウト
             logout_user()
             
-            # ログ記録
-            app.logger.info(f"アカウント削除完了: ユーザー名={username}, ID={user_id}")
+            if background:
+                start_user_purge(user_id)
+                app.logger.info(f"アカウント削除受付（バックグラウンド削除）: ユーザー名={username}, ID={user_id}")
+            else:
+                app.logger.info(f"アカウント削除完了: ユーザー名={username}, ID={user_id}, 件数={counts}")
             
             return jsonify({
                 'success': True,
@@ -3803,19 +4111,23 @@ def api_update_profile():
                 return jsonify({'error': 'このメールアドレスは既に使用されています'}), 400
         
         # プロフィール更新
-        current_user.username = username
-        current_user.email = email if email else None
+        user = find_user(current_user.id)
+        if not user:
+            return jsonify({'error': 'ユーザーが見つかりません'}), 404
+        user.username = username
+        user.email = email if email else None
         
         db.session.commit()
+        invalidate_user_cache(user.id)
         
-        app.logger.info(f"プロフィール更新: ユーザーID={current_user.id}, 新ユーザー名={username}")
+        app.logger.info(f"プロフィール更新: ユーザーID={user.id}, 新ユーザー名={username}")
         
         return jsonify({
             'success': True,
             'message': 'プロフィールを更新しました',
             'user': {
-                'username': current_user.username,
-                'email': current_user.email
+                'username': user.username,
+                'email': user.email
             }
         }), 200
         
@@ -3836,8 +4148,9 @@ def api_change_password():
         if not current_password or not new_password:
             return jsonify({'error': '現在のパスワードと新しいパスワードを入力してください'}), 400
         
-        # 現在のパスワードを確認
-        if not check_password_hash(current_user.password_hash, current_password):
+        # 現在のパスワードを確認（キャッシュのユーザーはパスワードを持たないため読み直す）
+        user = find_user(current_user.id)
+        if not user or not check_password_hash(user.password_hash, current_password):
             return jsonify({'error': '現在のパスワードが正しくありません'}), 400
         
         # 新しいパスワードの長さチェック
@@ -3845,8 +4158,9 @@ def api_change_password():
             return jsonify({'error': 'パスワードは6文字以上で入力してください'}), 400
         
         # パスワードを更新
-        current_user.password_hash = generate_password_hash(new_password)
+        user.password_hash = generate_password_hash(new_password)
         db.session.commit()
+        invalidate_user_cache(user.id)
         
         return jsonify({'message': 'パスワードを変更しました'})
         
@@ -3856,326 +4170,362 @@ def api_change_password():
         return jsonify({'error': 'パスワード変更中にエラーが発生しました'}), 500
 
 # データエクスポートAPI
-@app.route('/api/export-data', methods=['GET'])
-@login_required
-def api_export_data():
-    """ユーザーのすべてのデータをJSONでエクスポート"""
+EXPORT_YIELD_PER = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# (キー, モデル, シリアライザ)
+EXPORT_INCOME_TABLES = [
+    ('salary', SalaryIncomes, lambda i: serialize_income(i)),
+    ('sidejob', SidejobIncomes, lambda i: serialize_income(i)),
+    ('business', BusinessIncomes, lambda i: serialize_income(i)),
+    ('investment', InvestmentIncomes, lambda i: serialize_income(i)),
+    ('pension', PensionIncomes, lambda i: serialize_income(i)),
+    ('other', OtherIncomes, lambda i: serialize_income(i)),
+]
+
+EXPORT_EXPENSE_TABLES = [
+    ('housing', HousingExpenses, lambda e: serialize_expense(e)),
+    ('insurance', InsuranceExpenses, lambda e: serialize_expense(e)),
+    ('education_plans', EducationPlans, lambda e: serialize_columns(e)),
+    ('education', EducationExpenses, lambda e: serialize_education_expense(e)),
+    ('living', LivingExpenses, lambda e: serialize_living_expense(e)),
+    ('events', EventExpenses, lambda e: serialize_event_expense(e)),
+]
+
+def _to_json(value):
+    return json.dumps(value, ensure_ascii=False)
+
+def _iter_json_array(items):
+    """dictのイテレータをJSON配列として少しずつ書き出す"""
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + _to_json(item)
+    yield ']'
+
+def _iter_json_object(fields):
+    """(キー, 値のチャンク列) のイテレータをJSONオブジェクトとして書き出す"""
+    yield '{'
+    for index, (key, chunks) in enumerate(fields):
+        yield (',' if index else '') + _to_json(key) + ':'
+        yield from chunks
+    yield '}'
+
+def _buffer_chunks(chunks, size=EXPORT_CHUNK_SIZE):
+    """細かいチャンクをまとめて一定サイズ毎に送る"""
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+def _merge_children(parents, children, parent_key, child_key):
+    """
+    親と子をそれぞれキー順に読みながら、親毎に子のリストを付けて返す（マージ結合）
+    親毎にクエリを発行せず、どちらも1クエリをストリーミングで読むだけで済む
+    """
+    children = iter(children)
+    pending = next(children, None)
+    for parent in parents:
+        key = parent_key(parent)
+        # 対応する親がない子（他ユーザーの家計簿を指すエントリーなど）は読み飛ばす
+        while pending is not None and child_key(pending) < key:
+            pending = next(children, None)
+        items = []
+        while pending is not None and child_key(pending) == key:
+            items.append(pending)
+            pending = next(children, None)
+        yield parent, items
+
+def _user_rows(model, user_id, *order_by):
+    """ユーザーの行を主キー順にyield_perで少しずつ読み込む"""
+    return model.query.filter_by(user_id=user_id)\
+        .order_by(*(order_by or (model.id,))).yield_per(EXPORT_YIELD_PER)
+
+def _iter_simulations(user_id):
+    """シミュレーションと選択項目のリンクを、プラン毎のクエリなしで読み出す"""
+    plans = _user_rows(LifeplanSimulations, user_id)
+    plan_ids = db.session.query(LifeplanSimulations.id).filter_by(user_id=user_id)
+    expense_links = LifeplanExpenseLinks.query.filter(LifeplanExpenseLinks.lifeplan_id.in_(plan_ids))\
+        .order_by(LifeplanExpenseLinks.lifeplan_id, LifeplanExpenseLinks.id).yield_per(EXPORT_YIELD_PER)
+    income_links = LifeplanIncomeLinks.query.filter(LifeplanIncomeLinks.lifeplan_id.in_(plan_ids))\
+        .order_by(LifeplanIncomeLinks.lifeplan_id, LifeplanIncomeLinks.id).yield_per(EXPORT_YIELD_PER)
+    
+    with_expenses = _merge_children(plans, expense_links, lambda p: p.id, lambda l: l.lifeplan_id)
+    for (plan, plan_expense_links), plan_income_links in _merge_children(
+            with_expenses, income_links, lambda pair: pair[0].id, lambda l: l.lifeplan_id):
+        yield serialize_simulation(plan, plan_expense_links, plan_income_links)
+
+def _iter_household_json(user_id):
+    """家計簿をエントリー込みで書き出す（エントリーは全件を1クエリで日付順に読む）"""
+    books = _user_rows(HouseholdBook, user_id)
+    entries = _user_rows(HouseholdEntry, user_id, HouseholdEntry.household_book_id, HouseholdEntry.entry_date, HouseholdEntry.id)
+    
+    yield '['
+    for index, (book, book_entries) in enumerate(_merge_children(books, entries, lambda b: b.id, lambda e: e.household_book_id)):
+        book_data = serialize_household(book)
+        book_data['entries'] = [serialize_household_entry(entry) for entry in book_entries]
+        yield (',' if index else '') + _to_json(book_data)
+    yield ']'
+
+def generate_export_json(user_id, username, email):
+    """ユーザーの全データをJSONとして少しずつ生成する（データ量に関わらずメモリ使用量は一定）"""
+    user_info = {
+        'username': username,
+        'email': email,
+        'export_date': datetime.utcnow().isoformat()
+    }
+    
+    def tables(definitions):
+        return _iter_json_object(
+            (key, _iter_json_array(serialize(row) for row in _user_rows(model, user_id)))
+            for key, model, serialize in definitions
+        )
+    
+    sections = [
+        ('user_info', [_to_json(user_info)]),
+        ('categories', _iter_json_object([
+            ('expense', _iter_json_array(serialize_columns(c) for c in ExpenseCategory.query.order_by(ExpenseCategory.id))),
+            ('income', _iter_json_array(serialize_columns(c) for c in IncomeCategory.query.order_by(IncomeCategory.id)))
+        ])),
+        ('income_data', tables(EXPORT_INCOME_TABLES)),
+        ('expense_data', tables(EXPORT_EXPENSE_TABLES)),
+        ('simulation_data', _iter_json_array(_iter_simulations(user_id))),
+        ('household_data', _iter_household_json(user_id)),
+        ('account_data', _iter_json_object([
+            ('accounts', _iter_json_array(serialize_columns(a) for a in _user_rows(Account, user_id))),
+            ('transactions', _iter_json_array(serialize_columns(t) for t in _user_rows(AccountTransaction, user_id)))
+        ]))
+    ]
+    
     try:
-        print(f"エクスポート開始: ユーザーID {current_user.id}")
-        
-        # ユーザー情報
-        user_info = {
-            'username': current_user.username,
-            'email': current_user.email,
+        yield from _buffer_chunks(_iter_json_object(sections))
+    except Exception as e:
+        # ストリーミング開始後はエラーレスポンスを返せないためログに残して中断する
+        app.logger.error(f"データエクスポートエラー: ユーザーID={user_id}, {str(e)}\n{traceback.format_exc()}")
+        raise
+
+# 圧縮・表形式エクスポート（format=ndjson / csv）
+EXPORT_FORMATS = {
+    # format: (拡張子, mimetype)
+    'json': ('json', 'application/json'),
+    'ndjson': ('ndjson.gz', 'application/gzip'),
+    'csv': ('zip', 'application/zip'),
+    'sqlite': ('db', 'application/vnd.sqlite3'),  # テナントモードのみ
+}
+
+def _iter_flat_tables(user_id):
+    """表形式エクスポート用に (モデル, 行のイテレータ) をテーブル毎に返す"""
+    yield ExpenseCategory, ExpenseCategory.query.order_by(ExpenseCategory.id)
+    yield IncomeCategory, IncomeCategory.query.order_by(IncomeCategory.id)
+    for _, model, _ in EXPORT_INCOME_TABLES + EXPORT_EXPENSE_TABLES:
+        yield model, _user_rows(model, user_id)
+    yield LifeplanSimulations, _user_rows(LifeplanSimulations, user_id)
+    plan_ids = db.session.query(LifeplanSimulations.id).filter_by(user_id=user_id)
+    for model in (LifeplanExpenseLinks, LifeplanIncomeLinks):
+        yield model, model.query.filter(model.lifeplan_id.in_(plan_ids)).order_by(model.id).yield_per(EXPORT_YIELD_PER)
+    for model in (HouseholdBook, HouseholdEntry, Account, AccountTransaction):
+        yield model, _user_rows(model, user_id)
+
+def _export_columns(model):
+    return [column.name for column in model.__table__.columns if column.name != 'user_id']
+
+def generate_export_ndjson_gzip(user_id, username, email):
+    """1行1レコードのNDJSONをgzip圧縮しながら生成する"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31でgzip形式
+    
+    def lines():
+        yield _to_json({'table': 'user_info', 'row': {
+            'username': username,
+            'email': email,
             'export_date': datetime.utcnow().isoformat()
-        }
-        print("✓ ユーザー情報取得完了")
-        
-        # 収入データ
-        print("収入データ取得中...")
-        income_data = {}
-        try:
-            income_data['salary'] = [serialize_income(i) for i in SalaryIncomes.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 給与収入: {len(income_data['salary'])}件")
-        except Exception as e:
-            print(f"✗ 給与収入エラー: {e}")
-            income_data['salary'] = []
-            
-        try:
-            income_data['sidejob'] = [serialize_income(i) for i in SidejobIncomes.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 副業収入: {len(income_data['sidejob'])}件")
-        except Exception as e:
-            print(f"✗ 副業収入エラー: {e}")
-            income_data['sidejob'] = []
-            
-        try:
-            # テーブルが存在するかチェック
-            from sqlalchemy import inspect
-            inspector = inspect(db.engine)
-            if 'business_incomes' in inspector.get_table_names():
-                income_data['business'] = [serialize_income(i) for i in BusinessIncomes.query.filter_by(user_id=current_user.id).all()]
-                print(f"✓ 事業収入: {len(income_data['business'])}件")
-            else:
-                print("⚠ business_incomes テーブルが存在しません")
-                income_data['business'] = []
-        except Exception as e:
-            print(f"✗ 事業収入エラー: {e}")
-            income_data['business'] = []
-            
-        try:
-            income_data['investment'] = [serialize_income(i) for i in InvestmentIncomes.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 投資収入: {len(income_data['investment'])}件")
-        except Exception as e:
-            print(f"✗ 投資収入エラー: {e}")
-            income_data['investment'] = []
-            
-        try:
-            income_data['pension'] = [serialize_income(i) for i in PensionIncomes.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 年金収入: {len(income_data['pension'])}件")
-        except Exception as e:
-            print(f"✗ 年金収入エラー: {e}")
-            income_data['pension'] = []
-            
-        try:
-            income_data['other'] = [serialize_income(i) for i in OtherIncomes.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ その他収入: {len(income_data['other'])}件")
-        except Exception as e:
-            print(f"✗ その他収入エラー: {e}")
-            income_data['other'] = []
-        
-        # 支出データ
-        print("支出データ取得中...")
-        expense_data = {}
-        try:
-            expense_data['housing'] = [serialize_expense(e) for e in HousingExpenses.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 住居費: {len(expense_data['housing'])}件")
-        except Exception as e:
-            print(f"✗ 住居費エラー: {e}")
-            expense_data['housing'] = []
-            
-        try:
-            expense_data['insurance'] = [serialize_expense(e) for e in InsuranceExpenses.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 保険料: {len(expense_data['insurance'])}件")
-        except Exception as e:
-            print(f"✗ 保険料エラー: {e}")
-            expense_data['insurance'] = []
-            
-        try:
-            expense_data['education'] = [serialize_education_expense(e) for e in EducationExpenses.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 教育費: {len(expense_data['education'])}件")
-        except Exception as e:
-            print(f"✗ 教育費エラー: {e}")
-            expense_data['education'] = []
-            
-        try:
-            expense_data['living'] = [serialize_living_expense(e) for e in LivingExpenses.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 生活費: {len(expense_data['living'])}件")
-        except Exception as e:
-            print(f"✗ 生活費エラー: {e}")
-            expense_data['living'] = []
-            
-        try:
-            expense_data['events'] = [serialize_event_expense(e) for e in EventExpenses.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ イベント支出: {len(expense_data['events'])}件")
-        except Exception as e:
-            print(f"✗ イベント支出エラー: {e}")
-            expense_data['events'] = []
-        
-        # シミュレーションデータ
-        print("シミュレーションデータ取得中...")
-        try:
-            simulation_data = [serialize_simulation(s) for s in LifeplanSimulations.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ シミュレーション: {len(simulation_data)}件")
-        except Exception as e:
-            print(f"✗ シミュレーションエラー: {e}")
-            simulation_data = []
-        
-        # 家計簿データ
-        print("家計簿データ取得中...")
-        try:
-            household_data = [serialize_household(h) for h in HouseholdBook.query.filter_by(user_id=current_user.id).all()]
-            print(f"✓ 家計簿: {len(household_data)}件")
-        except Exception as e:
-            print(f"✗ 家計簿エラー: {e}")
-            household_data = []
-        
-        # データをまとめる
-        export_data = {
-            'user_info': user_info,
-            'income_data': income_data,
-            'expense_data': expense_data,
-            'simulation_data': simulation_data,
-            'household_data': household_data
-        }
-        
-        print("JSONレスポンス作成中...")
-        # JSONレスポンスとして返す
-        try:
-            response = make_response(jsonify(export_data))
-            filename = f'lifeplan_data_{current_user.username}_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.json'
-            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
-            response.headers['Content-Type'] = 'application/json'
-            print(f"✓ エクスポート完了: {filename}")
-            return response
-        except Exception as json_error:
-            print(f"✗ JSONレスポンス作成エラー: {json_error}")
-            raise json_error
-        
+        }}) + '\n'
+        for model, rows in _iter_flat_tables(user_id):
+            for row in rows:
+                yield _to_json({'table': model.__tablename__, 'row': serialize_columns(row)}) + '\n'
+    
+    try:
+        for chunk in _buffer_chunks(lines()):
+            compressed = compressor.compress(chunk.encode('utf-8'))
+            if compressed:
+                yield compressed
+        yield compressor.flush()
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"✗ データエクスポートエラー: {str(e)}")
-        print(f"スタックトレース:\n{error_details}")
-        app.logger.error(f"データエクスポートエラー: {str(e)}\n{error_details}")
-        return jsonify({'success': False, 'error': f'データエクスポートに失敗しました: {str(e)}'}), 500
+        app.logger.error(f"データエクスポートエラー(ndjson): ユーザーID={user_id}, {str(e)}\n{traceback.format_exc()}")
+        raise
 
-def serialize_income(income):
-    """収入データのシリアライズ"""
-    data = {
-        'id': income.id,
-        'name': income.name,
-        'description': income.description,
-        'monthly_amount': income.monthly_amount,
-        'annual_amount': income.annual_amount,
-        'start_year': income.start_year,
-        'end_year': income.end_year,
-        'created_at': income.created_at.isoformat() if income.created_at else None
-    }
+class _ZipStreamBuffer:
+    """ZipFileの書き込み先。書かれたバイト列を溜めておき、ジェネレータ側で取り出す"""
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
     
-    # 収入タイプ別の特別な属性を追加
-    if hasattr(income, 'annual_bonus'):
-        data['annual_bonus'] = income.annual_bonus
-    if hasattr(income, 'salary_increase_rate'):
-        data['salary_increase_rate'] = income.salary_increase_rate
-    if hasattr(income, 'income_increase_rate'):
-        data['income_increase_rate'] = income.income_increase_rate
-    if hasattr(income, 'annual_return_rate'):
-        data['annual_return_rate'] = income.annual_return_rate
-    if hasattr(income, 'has_cap'):
-        data['has_cap'] = income.has_cap
-    if hasattr(income, 'annual_income_cap'):
-        data['annual_income_cap'] = income.annual_income_cap
+    def flush(self):
+        pass
     
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def generate_export_csv_zip(user_id):
+    """テーブル毎のCSVをzipに書きながら生成する（シークできない出力先なのでサイズは後置き）"""
+    sink = _ZipStreamBuffer()
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for model, rows in _iter_flat_tables(user_id):
+                columns = _export_columns(model)
+                with archive.open(f'{model.__tablename__}.csv', 'w', force_zip64=True) as member:
+                    text = io.StringIO()
+                    writer = csv.DictWriter(text, fieldnames=columns, extrasaction='ignore')
+                    writer.writeheader()
+                    for row in rows:
+                        writer.writerow(serialize_columns(row))
+                        if text.tell() >= EXPORT_CHUNK_SIZE:
+                            member.write(text.getvalue().encode('utf-8'))
+                            text.seek(0)
+                            text.truncate()
+                            data = sink.drain()
+                            if data:
+                                yield data
+                    member.write(text.getvalue().encode('utf-8'))
+                data = sink.drain()
+                if data:
+                    yield data
+        yield sink.drain()
+    except Exception as e:
+        app.logger.error(f"データエクスポートエラー(csv): ユーザーID={user_id}, {str(e)}\n{traceback.format_exc()}")
+        raise
+
+def generate_export_sqlite(user_id):
+    """ユーザーのファイルをバックアップAPIで一時ファイルに複製して送信する（書き込み中でも一貫した状態になる）"""
+    with tempfile.NamedTemporaryFile(suffix='.db') as copy:
+        engine = tenant_engine(user_id)
+        if engine is None:
+            # ファイルのない（データのない）ユーザーには空のテーブルだけのファイルを送る
+            engine = db.create_engine(f'sqlite:///{copy.name}', poolclass=NullPool)
+            db.metadata.create_all(engine, tables=tenant_tables())
+            engine.dispose()
+        else:
+            connection = engine.raw_connection()
+            try:
+                target = sqlite3.connect(copy.name)
+                try:
+                    connection.driver_connection.backup(target)
+                finally:
+                    target.close()
+            finally:
+                connection.close()
+        while True:
+            chunk = copy.read(EXPORT_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+@app.route('/api/export-data', methods=['GET'])
+@login_required
+def api_export_data():
+    """
+    ユーザーのすべてのデータをエクスポート（生成しながら送信する）
+    format=json: 復元用のJSON（デフォルト）
+    format=ndjson: gzip圧縮した1行1レコードのNDJSON
+    format=csv: テーブル毎のCSVをまとめたzip
+    format=sqlite: ユーザーのSQLiteファイル（テナントモードのみ）
+    """
+    export_format = request.args.get('format', 'json')
+    if export_format not in EXPORT_FORMATS or (export_format == 'sqlite' and not tenant_mode_enabled()):
+        return jsonify({'success': False, 'error': f'未対応のエクスポート形式です: {export_format}'}), 400
+    
+    extension, mimetype = EXPORT_FORMATS[export_format]
+    filename = f'lifeplan_data_{current_user.username}_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    app.logger.info(f"データエクスポート開始: ユーザーID={current_user.id}, 形式={export_format}")
+    
+    if export_format == 'ndjson':
+        generator = generate_export_ndjson_gzip(current_user.id, current_user.username, current_user.email)
+    elif export_format == 'csv':
+        generator = generate_export_csv_zip(current_user.id)
+    elif export_format == 'sqlite':
+        generator = generate_export_sqlite(current_user.id)
+    else:
+        generator = generate_export_json(current_user.id, current_user.username, current_user.email)
+    
+    response = Response(stream_with_context(generator), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def serialize_columns(obj, exclude=('user_id',)):
+    """モデルの全カラムをJSON化可能なdictに変換（インポートで復元できる形式）"""
+    data = {}
+    for column in obj.__table__.columns:
+        if column.key in exclude:
+            continue
+        value = getattr(obj, column.key)
+        if isinstance(value, Enum):
+            value = value.value
+        elif isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        data[column.key] = value
     return data
 
+def serialize_income(income):
+    """収入データのシリアライズ"""
+    return serialize_columns(income)
+
 def serialize_expense(expense):
     """支出データのシリアライズ"""
-    data = {
-        'id': expense.id,
-        'name': expense.name,
-        'description': expense.description,
-        'start_year': expense.start_year,
-        'end_year': expense.end_year,
-        'created_at': expense.created_at.isoformat() if expense.created_at else None
-    }
-    
-    # 支出タイプ別の特別な属性を追加
-    if hasattr(expense, 'monthly_total_amount'):
-        data['monthly_total_amount'] = expense.monthly_total_amount
-    if hasattr(expense, 'residence_type'):
-        data['residence_type'] = expense.residence_type.value if expense.residence_type else None
-    if hasattr(expense, 'rent_monthly'):
-        data['rent_monthly'] = expense.rent_monthly
-    if hasattr(expense, 'mortgage_monthly'):
-        data['mortgage_monthly'] = expense.mortgage_monthly
-    
-    return data
+    return serialize_columns(expense)
 
 def serialize_living_expense(expense):
     """生活費データのシリアライズ"""
-    return {
-        'id': expense.id,
-        'name': expense.name,
-        'description': expense.description,
-        'start_year': expense.start_year,
-        'end_year': expense.end_year,
-        'inflation_rate': expense.inflation_rate,
-        'food_home': expense.food_home,
-        'food_outside': expense.food_outside,
-        'utility_electricity': expense.utility_electricity,
-        'utility_gas': expense.utility_gas,
-        'utility_water': expense.utility_water,
-        'monthly_total_amount': expense.monthly_total_amount,
-        'created_at': expense.created_at.isoformat() if expense.created_at else None
-    }
+    return serialize_columns(expense)
 
 def serialize_education_expense(expense):
     """教育費データのシリアライズ"""
-    return {
-        'id': expense.id,
-        'name': expense.name,
-        'description': expense.description,
-        'start_year': expense.start_year,
-        'end_year': expense.end_year,
-        'child_name': expense.child_name,
-        'child_birth_date': expense.child_birth_date.isoformat() if expense.child_birth_date else None,
-        'stage': expense.stage,
-        'stage_type': expense.stage_type,
-        'monthly_amount': expense.monthly_amount,
-        'created_at': expense.created_at.isoformat() if expense.created_at else None
-    }
+    return serialize_columns(expense)
 
 def serialize_event_expense(expense):
     """イベント支出データのシリアライズ"""
+    return serialize_columns(expense)
+
+def serialize_simulation(simulation, expense_links=(), income_links=()):
+    """シミュレーションデータのシリアライズ（選択項目のリンクを含む）"""
+    data = serialize_columns(simulation)
+    data['expense_links'] = [{'expense_type': link.expense_type, 'expense_id': link.expense_id} for link in expense_links]
+    data['income_links'] = [{'income_type': link.income_type, 'income_id': link.income_id} for link in income_links]
+    return data
+
+def serialize_household(household):
+    """家計簿データのシリアライズ（エントリーは含まない）"""
     return {
-        'id': expense.id,
-        'name': expense.name,
-        'description': expense.description,
-        'start_year': expense.start_year,
-        'end_year': expense.end_year,
-        'category': expense.category.value if expense.category else None,
-        'amount': expense.amount,
-        'is_recurring': expense.is_recurring,
-        'recurrence_interval': expense.recurrence_interval,
-        'recurrence_count': expense.recurrence_count,
-        'created_at': expense.created_at.isoformat() if expense.created_at else None
+        'id': household.id,
+        'name': household.name,
+        'year': household.year,
+        'month': household.month,
+        'description': household.description,
+        'created_at': household.created_at.isoformat() if household.created_at else None
     }
 
-def serialize_simulation(simulation):
-    """シミュレーションデータのシリアライズ"""
+def serialize_household_entry(entry):
+    """家計簿エントリーのシリアライズ"""
     return {
-        'id': simulation.id,
-        'name': simulation.name,
-        'description': simulation.description,
-        'base_age': simulation.base_age,
-        'start_year': simulation.start_year,
-        'end_year': simulation.end_year,
-        'created_at': simulation.created_at.isoformat() if simulation.created_at else None
+        'id': entry.id,
+        'amount': entry.amount,
+        'description': entry.description,
+        'entry_type': entry.entry_type,
+        'date': entry.entry_date.isoformat() if entry.entry_date else None,
+        'expense_category_id': entry.expense_category_id,
+        'income_category_id': entry.income_category_id,
+        'created_at': entry.created_at.isoformat() if entry.created_at else None
     }
 
-def serialize_household(household):
-    """家計簿データのシリアライズ"""
-    try:
-        entries = HouseholdEntry.query.filter_by(household_book_id=household.id).all()
-        entry_list = []
-        for entry in entries:
-            try:
-                entry_data = {
-                    'id': entry.id,
-                    'amount': entry.amount,
-                    'description': entry.description,
-                    'entry_type': entry.entry_type
-                }
-                
-                # 日付フィールドを安全に取得
-                if hasattr(entry, 'entry_date') and entry.entry_date:
-                    entry_data['date'] = entry.entry_date.isoformat()
-                elif hasattr(entry, 'date') and entry.date:
-                    entry_data['date'] = entry.date.isoformat()
-                else:
-                    entry_data['date'] = None
-                
-                # カテゴリフィールドを安全に取得
-                if hasattr(entry, 'expense_category_id'):
-                    entry_data['expense_category_id'] = entry.expense_category_id
-                if hasattr(entry, 'income_category_id'):
-                    entry_data['income_category_id'] = entry.income_category_id
-                
-                entry_list.append(entry_data)
-            except Exception as entry_error:
-                print(f"家計簿エントリ処理エラー (ID: {getattr(entry, 'id', 'unknown')}): {entry_error}")
-                continue
-        
-        return {
-            'id': household.id,
-            'name': household.name,
-            'year': household.year,
-            'month': household.month,
-            'created_at': household.created_at.isoformat() if household.created_at else None,
-            'entries': entry_list
-        }
-    except Exception as e:
-        print(f"家計簿データシリアライズエラー (ID: {getattr(household, 'id', 'unknown')}): {e}")
-        return {
-            'id': getattr(household, 'id', None),
-            'name': getattr(household, 'name', 'エラー'),
-            'year': getattr(household, 'year', 0),
-            'month': getattr(household, 'month', 0),
-            'created_at': None,
-            'entries': [],
-            'error': str(e)
-        }
-
 # 家計簿関連のモデル
 class HouseholdBook(db.Model):
     __tablename__ = 'household_books'
@@ -4209,14 +4559,197 @@ class IncomeCategory(db.Model):
     is_default = db.Column(db.Boolean, default=True)  # デフォルトカテゴリかどうか
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# デフォルトカテゴリ（flask init-db のinit_databaseで投入する）
+DEFAULT_EXPENSE_CATEGORIES = [
+    {'name': '食費', 'icon': 'restaurant', 'color': '#FF5722'},
+    {'name': '交通費', 'icon': 'directions_car', 'color': '#2196F3'},
+    {'name': '娯楽', 'icon': 'movie', 'color': '#9C27B0'},
+    {'name': '光熱費', 'icon': 'bolt', 'color': '#FF9800'},
+    {'name': 'その他', 'icon': 'category', 'color': '#666666'}
+]
+
+DEFAULT_INCOME_CATEGORIES = [
+    {'name': '給与', 'icon': 'work', 'color': '#4CAF50'},
+    {'name': '副業', 'icon': 'business_center', 'color': '#8BC34A'},
+    {'name': 'その他', 'icon': 'attach_money', 'color': '#4CAF50'}
+]
+
+def seed_default_categories():
+    """不足しているデフォルトカテゴリを作成する（作成した件数を返す）"""
+    created = 0
+    for model, defaults in ((ExpenseCategory, DEFAULT_EXPENSE_CATEGORIES), (IncomeCategory, DEFAULT_INCOME_CATEGORIES)):
+        existing = {name for (name,) in db.session.query(model.name)}
+        for cat_data in defaults:
+            if cat_data['name'] not in existing:
+                db.session.add(model(**cat_data))
+                created += 1
+    if created:
+        db.session.commit()
+    return created
+
+# カテゴリのプロセス内キャッシュ
+# カテゴリはほぼ変更されないがリクエスト毎に読まれるため、書き込みがあるまでメモリから返す
+# versionは書き込みのコミット毎に進み、読み込み中に書き込みがあった結果は保存しない
+CATEGORY_MODELS = {'expense': ExpenseCategory, 'income': IncomeCategory}
+_category_cache = {'version': 0, 'expense': None, 'income': None}
+_category_cache_lock = threading.Lock()
+CATEGORY_CACHE_MAX_AGE = 300  # 秒
+
+def invalidate_category_cache():
+    with _category_cache_lock:
+        _category_cache['version'] += 1
+        _category_cache['expense'] = None
+        _category_cache['income'] = None
+
+def get_categories(kind):
+    """
+    カテゴリ一覧をキャッシュから取得
+    戻り値は (カテゴリのdictのタプル, ETag)。dictはテンプレートからも属性と同じ書き方で参照できる
+    """
+    with _category_cache_lock:
+        version = _category_cache['version']
+        cached = _category_cache[kind]
+    if cached is not None:
+        return cached
+    
+    categories = tuple(dict(row) for row in db.session.execute(CATEGORY_ROWS[kind]).mappings())
+    etag = hashlib.md5(json.dumps(categories, ensure_ascii=False).encode('utf-8')).hexdigest()
+    cached = (categories, etag)
+    
+    with _category_cache_lock:
+        if _category_cache['version'] == version:
+            _category_cache[kind] = cached
+    return cached
+
+def get_category(kind, category_id):
+    """IDからカテゴリを取得（キャッシュ経由、見つからなければNone）"""
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+    for category in get_categories(kind)[0]:
+        if category['id'] == category_id:
+            return category
+    return None
+
+def _mark_categories_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['categories_changed'] = True
+
+def _invalidate_categories_after_commit(session):
+    if session.info.pop('categories_changed', False):
+        invalidate_category_cache()
+
+def _discard_category_changes(session):
+    session.info.pop('categories_changed', None)
+
+for _category_model in CATEGORY_MODELS.values():
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_category_model, _event_name, _mark_categories_changed)
+event.listen(Session, 'after_commit', _invalidate_categories_after_commit)
+event.listen(Session, 'after_rollback', _discard_category_changes)
+
+# 頻出クエリの事前構築
+# ほぼ全リクエストで実行される文は読み込み時に一度だけ組み立て、値はbindparamで渡す
+# 毎回のクエリ組み立てを省き、SQLAlchemyのコンパイル済みキャッシュにもそのまま当たる
+USER_BY_ID = db.select(User).where(User.id == db.bindparam('user_id'))
+HOUSEHOLD_BOOK_BY_MONTH = db.select(HouseholdBook).where(
+    HouseholdBook.user_id == db.bindparam('user_id'),
+    HouseholdBook.year == db.bindparam('year'),
+    HouseholdBook.month == db.bindparam('month'),
+).limit(1)
+CATEGORY_ROWS = {
+    kind: db.select(model.id, model.name, model.icon, model.color).order_by(model.id)
+    for kind, model in CATEGORY_MODELS.items()
+}
+
+def find_user(user_id):
+    """IDからユーザーを取得（見つからなければNone）"""
+    return db.session.execute(USER_BY_ID, {'user_id': user_id}).scalar_one_or_none()
+
+def find_household_book(user_id, year, month):
+    """指定年月の家計簿を取得（なければNone）"""
+    return db.session.execute(HOUSEHOLD_BOOK_BY_MONTH, {'user_id': user_id, 'year': year, 'month': month}).scalar()
+
+@app.cli.command('bench-queries')
+@click.option('--iterations', default=2000, show_default=True, help='1種類あたりの実行回数')
+def bench_queries_command(iterations):
+    """頻出クエリの1回あたりの所要時間を、毎回組み立てるORMクエリと事前構築した文で比較する"""
+    user = db.session.query(User).order_by(User.id).first()
+    if user is None:
+        click.echo('ユーザーがいないため計測できません')
+        return
+    user_id = user.id
+    today = date.today()
+    cases = [
+        ('load_user',
+         lambda: User.query.get(user_id),
+         lambda: find_user(user_id)),
+        ('household_book',
+         lambda: HouseholdBook.query.filter_by(user_id=user_id, year=today.year, month=today.month).first(),
+         lambda: find_household_book(user_id, today.year, today.month)),
+        ('categories',
+         lambda: [(c.id, c.name, c.icon, c.color) for c in ExpenseCategory.query.order_by(ExpenseCategory.id)],
+         lambda: db.session.execute(CATEGORY_ROWS['expense']).all()),
+    ]
+    with tenant_scope(user_id if tenant_mode_enabled() else None):
+        for name, before, after in cases:
+            timings = []
+            for run in (before, after):
+                run()  # ウォームアップ（コンパイル済みキャッシュの作成）
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    run()
+                    # リクエスト毎に新しいセッションになるのと同じく、identity mapを空にする
+                    db.session.expunge_all()
+                timings.append((time.perf_counter() - started) / iterations * 1e6)
+            click.echo(f'{name}: 従来 {timings[0]:.1f}µs → 事前構築 {timings[1]:.1f}µs / 回')
+
+def upgrade_schema(engine, tables):
+    """テーブル作成・スキーマ移行・索引の作成（ユーザーのファイルはtenant_scopeの中で呼ぶ）"""
+    db.metadata.create_all(engine, tables=tables)
+    migrate_database(engine)
+    # create_allは既存テーブルに後から追加したインデックスを作らないため個別に作成する
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # 月次集計テーブルを追加した直後は既存エントリーから作成する
+    if not db.session.query(HouseholdMonthlyRollup.query.exists()).scalar() \
+            and db.session.query(HouseholdEntry.query.exists()).scalar():
+        rebuild_household_rollups()
+    # ユーザー毎のファイルへの接続を持ち越さないよう、ファイル毎に終える
+    db.session.commit()
+
+def init_database():
+    """テーブル作成・スキーマ移行とデフォルトカテゴリの投入（テナントモードでは作成済みのユーザーのファイルも移行する）"""
+    upgrade_schema(db.engine, db.metadata.sorted_tables)
+    if tenant_mode_enabled():
+        for user_id in tenant_database_user_ids():
+            with tenant_scope(user_id):
+                upgrade_schema(tenant_engine(user_id), tenant_tables())
+    return seed_default_categories()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """テーブルを作成し、デフォルトカテゴリを投入する"""
+    created = init_database()
+    click.echo(f'デフォルトカテゴリを{created}件作成しました')
+
 class HouseholdEntry(db.Model):
     __tablename__ = 'household_entries'
+    __table_args__ = (
+        # カレンダーの日別集計（ユーザー×日付の範囲）用
+        db.Index('ix_household_entries_user_date', 'user_id', 'entry_date'),
+        # 家計簿毎のキーセットページング（entry_date, id の降順）用
+        db.Index('ix_household_entries_book_date_id', 'household_book_id', 'entry_date', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     household_book_id = db.Column(db.Integer, db.ForeignKey('household_books.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
     entry_type = db.Column(db.String(10), nullable=False)  # 'income' or 'expense'
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Yen, nullable=False)
     description = db.Column(db.String(200))
     
     # カテゴリ
@@ -4234,6 +4767,140 @@ class HouseholdEntry(db.Model):
     expense_category = db.relationship('ExpenseCategory', backref='entries')
     income_category = db.relationship('IncomeCategory', backref='entries')
 
+class HouseholdMonthlyRollup(db.Model):
+    """家計簿エントリーの月次集計（エントリーの書き込みと同じトランザクションで更新する）"""
+    __tablename__ = 'household_monthly_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', 'entry_type', 'category_id', name='uq_household_monthly_rollup'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    entry_type = db.Column(db.String(10), nullable=False)  # 'income' or 'expense'
+    category_id = db.Column(db.Integer, nullable=False, default=0)  # 収入/支出カテゴリID（未分類は0）
+    total = db.Column(Yen, nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+
+def _rollup_key(user_id, entry_date, entry_type, expense_category_id, income_category_id):
+    category_id = income_category_id if entry_type == 'income' else expense_category_id
+    return {
+        'user_id': user_id,
+        'year': entry_date.year,
+        'month': entry_date.month,
+        'entry_type': entry_type,
+        'category_id': category_id or 0
+    }
+
+def _apply_rollup_delta(connection, key, amount, count):
+    """集計行に差分を加算する（行がなければ作成）"""
+    table = HouseholdMonthlyRollup.__table__
+    statement = sqlite_insert(table).values(total=amount, entry_count=count, **key)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=['user_id', 'year', 'month', 'entry_type', 'category_id'],
+        set_={
+            'total': table.c.total + statement.excluded.total,
+            'entry_count': table.c.entry_count + statement.excluded.entry_count
+        }
+    ))
+
+def _entry_rollup_values(entry, old=False):
+    """エントリーの集計キーと金額（old=Trueなら更新前の値）"""
+    def value(name):
+        if old:
+            history = get_history(entry, name)
+            if history.deleted:
+                return history.deleted[0]
+        return getattr(entry, name)
+    
+    key = _rollup_key(value('user_id'), value('entry_date'), value('entry_type'),
+                      value('expense_category_id'), value('income_category_id'))
+    return key, value('amount')
+
+@event.listens_for(HouseholdEntry, 'after_insert')
+def _rollup_entry_insert(mapper, connection, entry):
+    key, amount = _entry_rollup_values(entry)
+    _apply_rollup_delta(connection, key, amount, 1)
+
+@event.listens_for(HouseholdEntry, 'after_update')
+def _rollup_entry_update(mapper, connection, entry):
+    old_key, old_amount = _entry_rollup_values(entry, old=True)
+    new_key, new_amount = _entry_rollup_values(entry)
+    if old_key == new_key:
+        if old_amount != new_amount:
+            _apply_rollup_delta(connection, new_key, new_amount - old_amount, 0)
+    else:
+        _apply_rollup_delta(connection, old_key, -old_amount, -1)
+        _apply_rollup_delta(connection, new_key, new_amount, 1)
+
+@event.listens_for(HouseholdEntry, 'after_delete')
+def _rollup_entry_delete(mapper, connection, entry):
+    key, amount = _entry_rollup_values(entry, old=True)
+    _apply_rollup_delta(connection, key, -amount, -1)
+
+def rebuild_household_rollups(user_id=None):
+    """
+    エントリーから月次集計を作り直す（バックフィル・一括登録後用、コミットは呼び出し側）
+    user_idを指定するとそのユーザーのみ作り直す
+    """
+    category_id = db.case(
+        (HouseholdEntry.entry_type == 'income', db.func.coalesce(HouseholdEntry.income_category_id, 0)),
+        else_=db.func.coalesce(HouseholdEntry.expense_category_id, 0)
+    )
+    year = db.cast(db.func.strftime('%Y', HouseholdEntry.entry_date), db.Integer)
+    month = db.cast(db.func.strftime('%m', HouseholdEntry.entry_date), db.Integer)
+    source = db.select(
+        HouseholdEntry.user_id, year, month, HouseholdEntry.entry_type, category_id,
+        db.func.sum(HouseholdEntry.amount), db.func.count()
+    ).group_by(HouseholdEntry.user_id, year, month, HouseholdEntry.entry_type, category_id)
+    
+    clear = db.delete(HouseholdMonthlyRollup)
+    if user_id is not None:
+        source = source.where(HouseholdEntry.user_id == user_id)
+        clear = clear.where(HouseholdMonthlyRollup.user_id == user_id)
+    
+    db.session.execute(clear.execution_options(synchronize_session=False))
+    db.session.execute(insert(HouseholdMonthlyRollup).from_select(
+        ['user_id', 'year', 'month', 'entry_type', 'category_id', 'total', 'entry_count'], source
+    ))
+
+def get_monthly_rollup(user_id, year, month):
+    """指定月の集計行（entry_type, category_id, total, entry_count）"""
+    return db.session.execute(
+        db.select(HouseholdMonthlyRollup.entry_type, HouseholdMonthlyRollup.category_id,
+                  HouseholdMonthlyRollup.total, HouseholdMonthlyRollup.entry_count)
+        .where(HouseholdMonthlyRollup.user_id == user_id,
+               HouseholdMonthlyRollup.year == year,
+               HouseholdMonthlyRollup.month == month,
+               HouseholdMonthlyRollup.entry_count != 0)
+    ).all()
+
+def get_monthly_totals(user_id, year, month):
+    """指定月の (収入合計, 支出合計)"""
+    totals = {'income': 0, 'expense': 0}
+    for row in get_monthly_rollup(user_id, year, month):
+        totals[row.entry_type] = totals.get(row.entry_type, 0) + row.total
+    return totals['income'], totals['expense']
+
+@app.cli.command('rebuild-rollups')
+@click.option('--username', default=None, help='対象ユーザー名（省略時は全ユーザー）')
+def rebuild_rollups_command(username):
+    """家計簿の月次集計をエントリーから作り直す"""
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f'ユーザーが見つかりません: {username}')
+        user_id = user.id
+    user_ids = [user_id] if user_id is not None and tenant_mode_enabled() else tenant_scoped_user_ids()
+    created = 0
+    for scope_user_id in user_ids:
+        with tenant_scope(scope_user_id):
+            rebuild_household_rollups(user_id)
+            db.session.commit()
+            created += HouseholdMonthlyRollup.query.count()
+    click.echo(f'月次集計を{created}行作成しました')
+
 # 口座管理のためのモデル
 class Account(db.Model):
     __tablename__ = 'accounts'
@@ -4241,7 +4908,7 @@ class Account(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)  # 口座名
     account_type = db.Column(db.String(20), nullable=False)  # 'wallet', 'bank', 'savings', 'investment'
-    balance = db.Column(db.Float, default=0.0)  # 残高
+    balance = db.Column(Yen, default=0)  # 残高
     currency = db.Column(db.String(3), default='JPY')  # 通貨
     icon = db.Column(db.String(30), default='account_balance_wallet')  # Material Icons名
     color = db.Column(db.String(7), default='#2196F3')  # HEXカラー
@@ -4256,16 +4923,1016 @@ class Account(db.Model):
 
 class AccountTransaction(db.Model):
     __tablename__ = 'account_transactions'
+    __table_args__ = (
+        # 取引履歴のキーセットページング（created_at, id の降順）用
+        db.Index('ix_account_transactions_user_created_id', 'user_id', 'created_at', 'id'),
+        # 口座毎の取引（スナップショット以降の集計）用
+        db.Index('ix_account_transactions_from_id', 'from_account_id', 'id'),
+        db.Index('ix_account_transactions_to_id', 'to_account_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     from_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=True)  # 送金元口座（収入の場合はNull）
-    to_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)  # 送金先口座
-    amount = db.Column(db.Float, nullable=False)  # 金額
-    transaction_type = db.Column(db.String(20), nullable=False)  # 'transfer', 'income', 'expense'
+    to_account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=True)  # 送金先口座（支出の場合はNull）
+    amount = db.Column(Yen, nullable=False)  # 金額
+    transaction_type = db.Column(db.String(20), nullable=False)  # 'transfer', 'income', 'expense', 'adjustment'
     description = db.Column(db.String(200))  # 説明
     transaction_date = db.Column(db.Date, nullable=False, default=date.today)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class AccountBalanceSnapshot(db.Model):
+    """口座残高のスナップショット（last_transaction_id時点の残高。以降の取引を足せば現在残高になる）"""
+    __tablename__ = 'account_balance_snapshots'
+    __table_args__ = (
+        db.Index('ix_account_balance_snapshots_account_txn', 'account_id', 'last_transaction_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    balance = db.Column(Yen, nullable=False)
+    last_transaction_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# 口座の元帳
+# 残高は必ず条件付きUPDATEで増減し、1つの移動につき1件の取引履歴を書く
+# Pythonで読んで書き戻さないため、複数ワーカーから同時に更新されても更新が失われず残高もマイナスにならない
+LEDGER_SNAPSHOT_INTERVAL = 100  # 口座毎にこの件数の取引ごとに残高スナップショットを保存
+
+class LedgerError(Exception):
+    """元帳の操作エラー（status_codeはAPIで返すHTTPステータス）"""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _ledger_update(account_id, user_id, delta, condition=None):
+    """残高にdeltaを加える条件付きUPDATE（更新後の残高を返し、条件に合わなければNone）"""
+    statement = db.update(Account).where(
+        Account.id == account_id,
+        Account.user_id == user_id,
+        Account.is_active == True
+    )
+    if condition is not None:
+        statement = statement.where(condition)
+    statement = statement.values(balance=Account.balance + delta, updated_at=datetime.utcnow())\
+        .returning(Account.balance).execution_options(synchronize_session=False)
+    return db.session.execute(statement).scalar()
+
+def _account_exists(account_id, user_id):
+    return db.session.query(
+        Account.query.filter_by(id=account_id, user_id=user_id, is_active=True).exists()
+    ).scalar()
+
+def post_ledger_movement(user_id, amount, from_account_id=None, to_account_id=None,
+                         transaction_type='transfer', description='', transaction_date=None):
+    """
+    口座間で金額を移動し取引履歴を書く（コミットは呼び出し側）
+    送金元は残高が足りる場合のみ減らす。戻り値は (取引, 送金元の新残高, 送金先の新残高)
+    """
+    if amount <= 0:
+        raise LedgerError('金額は0より大きい値を入力してください')
+    if from_account_id is None and to_account_id is None:
+        raise LedgerError('口座が指定されていません')
+    if from_account_id is not None and from_account_id == to_account_id:
+        raise LedgerError('送金元と送金先が同じ口座です')
+    
+    from_balance = to_balance = None
+    if from_account_id is not None:
+        from_balance = _ledger_update(from_account_id, user_id, -amount, Account.balance >= amount)
+        if from_balance is None:
+            if not _account_exists(from_account_id, user_id):
+                raise LedgerError('送金元口座が見つかりません', 404)
+            raise LedgerError('残高が不足しています')
+    if to_account_id is not None:
+        to_balance = _ledger_update(to_account_id, user_id, amount)
+        if to_balance is None:
+            raise LedgerError('送金先口座が見つかりません', 404)
+    
+    transaction = AccountTransaction(
+        user_id=user_id,
+        from_account_id=from_account_id,
+        to_account_id=to_account_id,
+        amount=amount,
+        transaction_type=transaction_type,
+        description=description,
+        transaction_date=transaction_date or date.today()
+    )
+    db.session.add(transaction)
+    db.session.flush()
+    
+    for account_id, balance in ((from_account_id, from_balance), (to_account_id, to_balance)):
+        if account_id is not None:
+            _maybe_snapshot_balance(account_id, balance, transaction.id)
+    return transaction, from_balance, to_balance
+
+def set_ledger_balance(user_id, account_id, expected_balance, new_balance, description='残高調整'):
+    """
+    残高を指定値に合わせる（差額を調整取引として記録する、コミットは呼び出し側）
+    読み込み後に他の取引で残高が変わっていた場合はLedgerError(409)
+    """
+    delta = new_balance - expected_balance
+    if delta == 0:
+        return None
+    balance = _ledger_update(account_id, user_id, delta, Account.balance == expected_balance)
+    if balance is None:
+        raise LedgerError('残高が他の操作で更新されました。再度お試しください', 409)
+    
+    transaction = AccountTransaction(
+        user_id=user_id,
+        from_account_id=account_id if delta < 0 else None,
+        to_account_id=account_id if delta > 0 else None,
+        amount=abs(delta),
+        transaction_type='adjustment',
+        description=description
+    )
+    db.session.add(transaction)
+    db.session.flush()
+    _maybe_snapshot_balance(account_id, balance, transaction.id)
+    return transaction
+
+def _account_movements(account_id, after_transaction_id=0, until_transaction_id=None):
+    """取引ID範囲内の口座の増減合計"""
+    condition = [AccountTransaction.id > after_transaction_id]
+    if until_transaction_id is not None:
+        condition.append(AccountTransaction.id <= until_transaction_id)
+    credit = db.session.query(db.func.coalesce(db.func.sum(AccountTransaction.amount), 0))\
+        .filter(AccountTransaction.to_account_id == account_id, *condition).scalar()
+    debit = db.session.query(db.func.coalesce(db.func.sum(AccountTransaction.amount), 0))\
+        .filter(AccountTransaction.from_account_id == account_id, *condition).scalar()
+    return credit - debit
+
+def _latest_snapshot(account_id, until_transaction_id=None):
+    query = AccountBalanceSnapshot.query.filter_by(account_id=account_id)
+    if until_transaction_id is not None:
+        query = query.filter(AccountBalanceSnapshot.last_transaction_id <= until_transaction_id)
+    return query.order_by(AccountBalanceSnapshot.last_transaction_id.desc()).first()
+
+def _maybe_snapshot_balance(account_id, balance, transaction_id):
+    """前回のスナップショットから一定件数の取引があれば現在の残高を保存する"""
+    snapshot = _latest_snapshot(account_id)
+    since = snapshot.last_transaction_id if snapshot else 0
+    count = db.session.query(db.func.count(AccountTransaction.id)).filter(
+        AccountTransaction.id > since,
+        db.or_(AccountTransaction.from_account_id == account_id, AccountTransaction.to_account_id == account_id)
+    ).scalar()
+    if count >= LEDGER_SNAPSHOT_INTERVAL:
+        db.session.add(AccountBalanceSnapshot(account_id=account_id, balance=balance, last_transaction_id=transaction_id))
+
+def snapshot_account_balances(account_ids):
+    """指定口座の現在残高をスナップショットとして保存する（移行・復元後の起点用、コミットは呼び出し側）"""
+    last_transaction_id = db.session.query(db.func.coalesce(db.func.max(AccountTransaction.id), 0)).scalar()
+    rows = [
+        {'account_id': account_id, 'balance': balance or 0, 'last_transaction_id': last_transaction_id,
+         'created_at': datetime.utcnow()}
+        for account_id, balance in db.session.query(Account.id, Account.balance).filter(Account.id.in_(account_ids))
+    ]
+    if rows:
+        db.session.execute(insert(AccountBalanceSnapshot), rows)
+
+def reconstruct_balance(account_id, until_transaction_id=None):
+    """直近のスナップショットとそれ以降の取引から残高を再計算する（until指定でその取引時点の残高）"""
+    snapshot = _latest_snapshot(account_id, until_transaction_id)
+    base, since = (snapshot.balance, snapshot.last_transaction_id) if snapshot else (0, 0)
+    return base + _account_movements(account_id, since, until_transaction_id)
+
+def _rebuild_table(engine, table, plan, verify=None):
+    """
+    SQLiteは列の型・制約を変更できないため、テーブルを作り直してデータを移す（作り直したらTrue）
+    plan(connection)は列名→旧テーブルから値を取るSQL式（作り直し不要ならNone）。書き込みロックを取ってから判定する
+    verify(connection, 旧テーブル名, 列の対応)が例外を出せば全体を戻す
+    """
+    old_name = f'{table.name}_old'
+    # pysqlite はDDLでトランザクションを開始しないため、BEGIN/COMMITを明示して作り直し全体を1トランザクションにする
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        # 他テーブルの外部キーが旧テーブル名に書き換わらないようにする
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+        # 移行の要否の判定から作り直しまでを他の接続と競合させない
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        try:
+            select_columns = plan(connection)
+            if select_columns is None:
+                connection.exec_driver_sql('ROLLBACK')
+                return False
+            names = ', '.join(select_columns)
+            values = ', '.join(select_columns.values())
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old_name}')
+            for index in table.indexes:
+                connection.exec_driver_sql(f'DROP INDEX IF EXISTS {index.name}')
+            table.create(connection)
+            connection.exec_driver_sql(f'INSERT INTO {table.name} ({names}) SELECT {values} FROM {old_name}')
+            if verify is not None:
+                verify(connection, old_name, select_columns)
+            connection.exec_driver_sql(f'DROP TABLE {old_name}')
+            connection.exec_driver_sql('COMMIT')
+            return True
+        except Exception:
+            connection.exec_driver_sql('ROLLBACK')
+            raise
+        finally:
+            connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+
+def _migrate_account_transactions(engine):
+    """account_transactionsの送金先を任意にする移行（支出・残高調整は送金先がない）"""
+    table = AccountTransaction.__table__
+    
+    def plan(connection):
+        columns = {column['name']: column for column in inspect(connection).get_columns(table.name)}
+        if columns['to_account_id']['nullable']:
+            return None
+        return {column.name: column.name for column in table.columns if column.name in columns}
+    
+    return _rebuild_table(engine, table, plan)
+
+def money_columns():
+    """金額（Yen型）の列を持つテーブルと列名の一覧"""
+    return [
+        (table, [column.name for column in table.columns if isinstance(column.type, Yen)])
+        for table in db.metadata.sorted_tables
+        if any(isinstance(column.type, Yen) for column in table.columns)
+    ]
+
+def _verify_money_copy(connection, table_name, old_name, names):
+    """移行後の件数・列毎の合計が、移行前の値を四捨五入したものと一致するか確認する"""
+    for name in names:
+        expected = connection.exec_driver_sql(
+            f'SELECT COUNT(*), SUM(CAST(ROUND({name}) AS INTEGER)), MAX(ABS({name} - ROUND({name}))) FROM {old_name}'
+        ).one()
+        actual = connection.exec_driver_sql(
+            f"SELECT COUNT(*), SUM({name}), SUM(typeof({name}) NOT IN ('integer', 'null')) FROM {table_name}"
+        ).one()
+        if tuple(actual[:2]) != tuple(expected[:2]) or actual[2]:
+            raise RuntimeError(f'金額列の移行結果が一致しません: {table_name}.{name} 移行前={tuple(expected[:2])} 移行後={tuple(actual)}')
+        if expected[2]:
+            app.logger.info(f'金額列の端数を丸めました: {table_name}.{name} 最大誤差={expected[2]}')
+
+def _migrate_money_columns(engine):
+    """金額列をREALから円単位のINTEGERへ移行する（テーブル毎に作り直し、合計を検証する）"""
+    migrated = []
+    for table, names in money_columns():
+        def plan(connection, table=table, names=names):
+            inspector = inspect(connection)
+            if not inspector.has_table(table.name):
+                return None
+            columns = {column['name']: column for column in inspector.get_columns(table.name)}
+            targets = [name for name in names if name in columns and not isinstance(columns[name]['type'], db.Integer)]
+            if not targets:
+                return None
+            return {
+                column.name: f'CAST(ROUND({column.name}) AS INTEGER)' if column.name in targets else column.name
+                for column in table.columns if column.name in columns
+            }
+        
+        if _rebuild_table(
+            engine, table, plan,
+            verify=lambda connection, old_name, select_columns, table=table, names=names:
+                _verify_money_copy(connection, table.name, old_name, [name for name in names if name in select_columns])
+        ):
+            migrated.append(table.name)
+    if migrated:
+        app.logger.info(f"金額列を整数に移行しました: {', '.join(migrated)}")
+    return migrated
+
+def migrate_database(engine=None):
+    """既存データベースのスキーマ移行（engineの省略時は共有ファイル。ユーザーのファイルはtenant_scopeの中で渡す）"""
+    engine = engine or db.engine
+    _migrate_account_transactions(engine)
+    migrated = _migrate_money_columns(engine)
+    # テーブルを作り直すと同期トリガーも消えるため、移行の後で作成する
+    ensure_household_search_index(engine)
+    if migrated:
+        # 行毎の四捨五入で生じた端数の差を揃える（月次集計は明細から作り直し、口座は丸めた残高を新しい起点にする）
+        if 'household_entries' in migrated:
+            rebuild_household_rollups()
+        if {'accounts', 'account_transactions', 'account_balance_snapshots'} & set(migrated):
+            snapshot_account_balances([account_id for (account_id,) in db.session.query(Account.id)])
+        db.session.commit()
+        for problem in verify_money_integrity():
+            app.logger.error(f'金額移行の検証エラー: {problem}')
+    # スナップショットのない口座は現在残高を起点にする
+    missing = db.session.query(Account.id).filter(
+        ~db.exists().where(AccountBalanceSnapshot.account_id == Account.id)
+    ).all()
+    if missing:
+        snapshot_account_balances([account_id for (account_id,) in missing])
+        db.session.commit()
+
+def verify_money_integrity():
+    """
+    金額データの検証（問題の一覧を返す）
+    整数以外の金額、エントリーと一致しない月次集計、取引履歴と一致しない口座残高を調べる
+    """
+    problems = []
+    for table, names in money_columns():
+        for name in names:
+            count = db.session.scalar(db.select(db.func.count()).select_from(table).where(
+                db.text(f"typeof({name}) NOT IN ('integer', 'null')")
+            ))
+            if count:
+                problems.append(f'{table.name}.{name}: 整数でない金額が{count}件あります')
+
+    year = db.cast(db.func.strftime('%Y', HouseholdEntry.entry_date), db.Integer)
+    month = db.cast(db.func.strftime('%m', HouseholdEntry.entry_date), db.Integer)
+    entry_totals = {
+        (row.user_id, row.year, row.month, row.entry_type): row.total
+        for row in db.session.execute(
+            db.select(HouseholdEntry.user_id, year.label('year'), month.label('month'), HouseholdEntry.entry_type,
+                      db.func.sum(HouseholdEntry.amount).label('total'))
+            .group_by(HouseholdEntry.user_id, year, month, HouseholdEntry.entry_type)
+        )
+    }
+    rollup_totals = {
+        (row.user_id, row.year, row.month, row.entry_type): row.total
+        for row in db.session.execute(
+            db.select(HouseholdMonthlyRollup.user_id, HouseholdMonthlyRollup.year, HouseholdMonthlyRollup.month,
+                      HouseholdMonthlyRollup.entry_type, db.func.sum(HouseholdMonthlyRollup.total).label('total'))
+            .where(HouseholdMonthlyRollup.entry_count != 0)
+            .group_by(HouseholdMonthlyRollup.user_id, HouseholdMonthlyRollup.year,
+                      HouseholdMonthlyRollup.month, HouseholdMonthlyRollup.entry_type)
+        )
+    }
+    for key in sorted(set(entry_totals) | set(rollup_totals)):
+        if entry_totals.get(key, 0) != rollup_totals.get(key, 0):
+            problems.append(f'月次集計 {key}: エントリー合計={entry_totals.get(key, 0)} 集計={rollup_totals.get(key, 0)}')
+
+    for account_id, balance in db.session.query(Account.id, Account.balance):
+        expected = reconstruct_balance(account_id)
+        if (balance or 0) != expected:
+            problems.append(f'口座 {account_id}: 残高={balance} 取引からの再計算={expected}')
+    return problems
+
+@app.cli.command('verify-money')
+def verify_money_command():
+    """金額の整数化・月次集計・口座残高の整合性を検証する"""
+    problems = []
+    for user_id in tenant_scoped_user_ids():
+        with tenant_scope(user_id):
+            problems.extend(verify_money_integrity())
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        raise click.ClickException(f'{len(problems)}件の不整合があります')
+    click.echo('金額データに不整合はありません')
+
+# 家計簿エントリーの全文検索（FTS5）
+# trigramトークナイザーで部分一致（前方一致を含む）を日本語でも分かち書きなしで行う
+# household_entriesを外部コンテンツとし、トリガーで同期するため一括登録・集合削除でもずれない
+HOUSEHOLD_FTS_TABLE = 'household_entries_fts'
+FTS_MIN_TERM_LENGTH = 3  # trigramで索引を引ける最小の文字数（これより短い語はLIKEで絞り込む）
+household_fts_enabled = None  # 未確認ならNone（最初の検索で索引の有無を調べる）
+
+HOUSEHOLD_FTS_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS household_entries_fts_ai AFTER INSERT ON household_entries BEGIN
+        INSERT INTO {HOUSEHOLD_FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS household_entries_fts_ad AFTER DELETE ON household_entries BEGIN
+        INSERT INTO {HOUSEHOLD_FTS_TABLE}({HOUSEHOLD_FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS household_entries_fts_au AFTER UPDATE OF description ON household_entries BEGIN
+        INSERT INTO {HOUSEHOLD_FTS_TABLE}({HOUSEHOLD_FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {HOUSEHOLD_FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+]
+
+def ensure_household_search_index(engine=None):
+    """全文検索テーブルと同期トリガーを作成する（新規作成時は既存エントリーから索引を作る）"""
+    global household_fts_enabled
+    try:
+        with (engine or db.engine).begin() as connection:
+            exists = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (HOUSEHOLD_FTS_TABLE,)
+            ).first()
+            if not exists:
+                connection.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {HOUSEHOLD_FTS_TABLE} USING fts5("
+                    f"description, content='household_entries', content_rowid='id', tokenize='trigram')"
+                )
+                connection.exec_driver_sql(f"INSERT INTO {HOUSEHOLD_FTS_TABLE}({HOUSEHOLD_FTS_TABLE}) VALUES ('rebuild')")
+            for trigger in HOUSEHOLD_FTS_TRIGGERS:
+                connection.exec_driver_sql(trigger)
+        household_fts_enabled = True
+    except exc.OperationalError as e:
+        # FTS5やtrigramに対応していないSQLiteではLIKE検索で代替する
+        household_fts_enabled = False
+        app.logger.warning(f"全文検索索引を作成できません（LIKE検索で代替します）: {str(e)}")
+
+def household_search_index_exists():
+    """全文検索テーブルが作成済みか（init-dbで作成する。読み取りのみ）"""
+    return db.session.execute(
+        db.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': HOUSEHOLD_FTS_TABLE}
+    ).first() is not None
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_household_entries(user_id, keywords):
+    """
+    説明文にすべてのキーワードを含むエントリーのクエリ
+    3文字以上の語はFTSの索引で引き、短い語はユーザーのエントリーに対するLIKEで絞り込む
+    """
+    global household_fts_enabled
+    if household_fts_enabled is None:
+        household_fts_enabled = household_search_index_exists()
+    query = HouseholdEntry.query.filter(HouseholdEntry.user_id == user_id)
+    terms = [term for term in keywords.split() if term]
+    indexed = [term for term in terms if len(term) >= FTS_MIN_TERM_LENGTH] if household_fts_enabled else []
+    if indexed:
+        match = ' AND '.join(_fts_phrase(term) for term in indexed)
+        query = query.filter(HouseholdEntry.id.in_(
+            db.select(db.literal_column('rowid')).select_from(db.table(HOUSEHOLD_FTS_TABLE))
+            .where(db.text(f'{HOUSEHOLD_FTS_TABLE} MATCH :match').bindparams(match=match))
+        ))
+    for term in terms:
+        if term not in indexed:
+            query = query.filter(HouseholdEntry.description.like(f'%{_escape_like(term)}%', escape='\\'))
+    return query
+
+# ユーザー毎のSQLiteファイル（テナントモード）
+# 共有ファイルでは書き込みがデータベース全体のロックで直列化され、1ユーザーの一括登録が全員を待たせる
+# ユーザーデータのテーブルをユーザー毎のファイルに分け、ユーザー・カテゴリなどは共有ファイルに残す
+SHARED_TABLES = {'users', 'expense_categories', 'income_categories', 'user_purges', 'idempotency_keys'}
+TENANT_DATABASE_SIDECARS = ('', '-journal', '-wal', '-shm')
+_tenant_scope = ContextVar('tenant_scope', default=None)
+_tenant_engines = {}
+_tenant_engines_lock = threading.Lock()
+
+def tenant_mode_enabled():
+    return bool(app.config.get('TENANT_DATABASE_DIR'))
+
+def is_tenant_table(table):
+    return table.name not in SHARED_TABLES
+
+def tenant_tables():
+    return [table for table in db.metadata.sorted_tables if is_tenant_table(table)]
+
+def _uses_tenant_tables(mapper, clause):
+    if mapper is not None:
+        return is_tenant_table(inspect(mapper).local_table)
+    if clause is not None:
+        return any(isinstance(table, Table) and is_tenant_table(table)
+                   for table in find_tables(clause, include_crud=True))
+    return False
+
+@contextmanager
+def tenant_scope(user_id):
+    """リクエスト外（CLI・バックグラウンド処理）で指定ユーザーのファイルを使う（Noneなら共有ファイル）"""
+    token = _tenant_scope.set(user_id)
+    try:
+        yield
+    finally:
+        _tenant_scope.reset(token)
+
+def current_tenant_id():
+    """ユーザーデータの振り分け先のユーザーID（tenant_scope優先、なければログイン中のユーザー）"""
+    user_id = _tenant_scope.get()
+    if user_id is None and has_request_context() and current_user.is_authenticated:
+        user_id = current_user.id
+    return user_id
+
+def tenant_scoped_user_ids():
+    """CLIでユーザーデータを扱う範囲（テナントモードでは全ユーザー、それ以外は共有ファイルを表すNone）"""
+    if not tenant_mode_enabled():
+        return [None]
+    return [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+def tenant_database_path(user_id):
+    directory = os.path.join(app.instance_path, app.config['TENANT_DATABASE_DIR'])
+    return os.path.join(directory, f'user_{int(user_id)}.db')
+
+def tenant_database_user_ids():
+    """ファイルが作成済みのユーザーのID"""
+    return [user_id for user_id in tenant_scoped_user_ids() if os.path.exists(tenant_database_path(user_id))]
+
+def tenant_engine(user_id, create=False):
+    """
+    ユーザーのファイルのエンジン（ファイルがなければNone）
+    create=Trueならファイルがない時にテーブル・索引・全文検索ごと作成する（登録時・移行時・書き込み時）
+    """
+    path = tenant_database_path(user_id)
+    engine = _tenant_engines.get(user_id)
+    # 別プロセスでファイルが削除されていれば、キャッシュしたエンジンを捨てる
+    if engine is not None and os.path.exists(path):
+        return engine
+    with _tenant_engines_lock:
+        engine = _tenant_engines.get(user_id)
+        if engine is not None and not os.path.exists(path):
+            _tenant_engines.pop(user_id).dispose()
+            engine = None
+        if engine is None:
+            created = not os.path.exists(path)
+            if created:
+                if not create:
+                    return None
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                sqlite3.connect(path).close()
+            # ユーザー数だけエンジンができるため、接続はプールせず都度開く
+            # mode=rwで接続し、削除済みのファイルを空のまま作り直さないようにする
+            engine = db.create_engine(f'sqlite:///file:{path}?mode=rw&uri=true', poolclass=NullPool)
+            if created:
+                tables = tenant_tables()
+                db.metadata.create_all(engine, tables=tables)
+                for table in tables:
+                    for index in table.indexes:
+                        index.create(bind=engine, checkfirst=True)
+                ensure_household_search_index(engine)
+            _tenant_engines[user_id] = engine
+    return engine
+
+def remove_tenant_database(user_id):
+    """ユーザーのファイルを削除する（存在しなければFalse）"""
+    with _tenant_engines_lock:
+        engine = _tenant_engines.pop(user_id, None)
+        if engine is not None:
+            engine.dispose()
+    path = tenant_database_path(user_id)
+    existed = os.path.exists(path)
+    for suffix in TENANT_DATABASE_SIDECARS:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return existed
+
+def move_user_data_to_tenant(user_id):
+    """共有ファイルにあるユーザーデータをユーザーのファイルへ移す（コピー後に共有側を削除する）"""
+    counts = {}
+    models = [(model, condition) for model, condition in user_data_deletes(user_id)
+              if is_tenant_table(model.__table__)]
+    with db.engine.connect() as source, tenant_engine(user_id, create=True).begin() as target:
+        for model, condition in reversed(models):
+            table = model.__table__
+            result = source.execution_options(yield_per=RESTORE_BATCH_SIZE).execute(db.select(table).where(condition))
+            for rows in result.mappings().partitions():
+                target.execute(insert(table), [dict(row) for row in rows])
+                counts[table.name] = counts.get(table.name, 0) + len(rows)
+    for model, condition in models:
+        db.session.execute(db.delete(model).where(condition).execution_options(synchronize_session=False))
+    db.session.commit()
+    return counts
+
+@app.cli.command('split-tenants')
+def split_tenants_command():
+    """共有ファイルのユーザーデータをユーザー毎のファイルへ移す（テナントモードを有効にした時の移行用）"""
+    if not tenant_mode_enabled():
+        raise click.ClickException('TENANT_DATABASE_DIR（LIFEPLAN_TENANT_DATABASE_DIR）が設定されていません')
+    for (user_id,) in db.session.query(User.id).order_by(User.id).all():
+        counts = move_user_data_to_tenant(user_id)
+        click.echo(f'ユーザーID={user_id}: {sum(counts.values())}件移動')
+
+# アカウント削除（ユーザーの全データを集合単位のDELETEで削除する）
+PURGE_BATCH_SIZE = 5000
+# これを超える行数のユーザーはバックグラウンドで少しずつ削除する
+PURGE_BACKGROUND_THRESHOLD = 50000
+# 削除待ちユーザーのパスワードハッシュ（どのパスワードとも一致せず、load_userでも弾く）
+PURGED_PASSWORD_HASH = '!purge'
+
+class UserPurge(db.Model):
+    """バックグラウンド削除待ちのユーザー（削除完了時にユーザーと一緒に消える）"""
+    __tablename__ = 'user_purges'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+USER_DATA_TABLES = [
+    SalaryIncomes, SidejobIncomes, BusinessIncomes, InvestmentIncomes, PensionIncomes, OtherIncomes,
+    LivingExpenses, HousingExpenses, InsuranceExpenses, EventExpenses,
+]
+
+def user_data_deletes(user_id):
+    """
+    ユーザーの全データを削除する (モデル, 条件) のリスト（子テーブルが先）
+    子テーブルは自分のuser_idに加えて親のID経由でも消し、他ユーザー側に残った参照も残さない
+    """
+    plan_ids = db.select(LifeplanSimulations.id).where(LifeplanSimulations.user_id == user_id)
+    education_plan_ids = db.select(EducationPlans.id).where(EducationPlans.user_id == user_id)
+    book_ids = db.select(HouseholdBook.id).where(HouseholdBook.user_id == user_id)
+    account_ids = db.select(Account.id).where(Account.user_id == user_id)
+    
+    return [
+        (LifeplanExpenseLinks, LifeplanExpenseLinks.lifeplan_id.in_(plan_ids)),
+        (LifeplanIncomeLinks, LifeplanIncomeLinks.lifeplan_id.in_(plan_ids)),
+        (EducationExpenses, db.or_(EducationExpenses.user_id == user_id,
+                                   EducationExpenses.education_plan_id.in_(education_plan_ids))),
+        (HouseholdEntry, db.or_(HouseholdEntry.user_id == user_id,
+                                HouseholdEntry.household_book_id.in_(book_ids))),
+        (HouseholdMonthlyRollup, HouseholdMonthlyRollup.user_id == user_id),
+        (AccountTransaction, db.or_(AccountTransaction.user_id == user_id,
+                                    AccountTransaction.from_account_id.in_(account_ids),
+                                    AccountTransaction.to_account_id.in_(account_ids))),
+        (AccountBalanceSnapshot, AccountBalanceSnapshot.account_id.in_(account_ids)),
+        (LifeplanSimulations, LifeplanSimulations.user_id == user_id),
+        (EducationPlans, EducationPlans.user_id == user_id),
+        (HouseholdBook, HouseholdBook.user_id == user_id),
+        (Account, Account.user_id == user_id),
+    ] + [(model, model.user_id == user_id) for model in USER_DATA_TABLES] + [
+        (IdempotencyKey, IdempotencyKey.user_id == user_id),
+        (UserPurge, UserPurge.user_id == user_id),
+        (User, User.id == user_id),
+    ]
+
+def count_user_rows(user_id):
+    """削除対象の行数（バックグラウンド削除にするかの判定用）"""
+    return sum(
+        db.session.scalar(db.select(db.func.count()).select_from(model).where(condition))
+        for model, condition in user_data_deletes(user_id)
+    )
+
+def delete_user_data(user_id):
+    """
+    ユーザーと全データを1トランザクションで削除する（コミットは呼び出し側）
+    テーブル毎に1回のDELETEで済み、戻り値はテーブル名毎の削除件数
+    テナントモードでは共有ファイルの行だけをDELETEし、ユーザーのファイルはコミット成功後に削除する
+    """
+    counts = {}
+    tenant_mode = tenant_mode_enabled()
+    if tenant_mode:
+        counts['tenant_database'] = int(os.path.exists(tenant_database_path(user_id)))
+        db.session.info.setdefault('tenant_databases_to_remove', set()).add(user_id)
+    for model, condition in user_data_deletes(user_id):
+        if tenant_mode and is_tenant_table(model.__table__):
+            continue
+        result = db.session.execute(
+            db.delete(model).where(condition).execution_options(synchronize_session=False)
+        )
+        counts[model.__tablename__] = result.rowcount
+    return counts
+
+def _remove_tenant_databases_after_commit(session):
+    for user_id in session.info.pop('tenant_databases_to_remove', ()):
+        try:
+            remove_tenant_database(user_id)
+        except OSError as e:
+            app.logger.error(f"ユーザーファイル削除エラー: ユーザーID={user_id}, {str(e)}")
+
+def _keep_tenant_databases_after_rollback(session):
+    session.info.pop('tenant_databases_to_remove', None)
+
+event.listen(Session, 'after_commit', _remove_tenant_databases_after_commit)
+event.listen(Session, 'after_rollback', _keep_tenant_databases_after_rollback)
+
+def schedule_user_purge(user_id):
+    """
+    ユーザーを即座にログイン不可にし、削除待ちとして登録する（コミットは呼び出し側）
+    ユーザー行は削除完了まで残してIDが再利用されないようにする
+    """
+    db.session.execute(db.update(User).where(User.id == user_id).values(
+        username=f'__purge__{user_id}_{uuid.uuid4().hex}',
+        email=None,
+        password_hash=PURGED_PASSWORD_HASH
+    ))
+    db.session.add(UserPurge(user_id=user_id))
+
+def purge_user_data(user_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    削除待ちユーザーのデータをバッチ毎にコミットしながら削除する
+    1回のロック時間が短く済み、途中で止まっても再実行すれば続きから消える
+    """
+    counts = {}
+    for model, condition in user_data_deletes(user_id):
+        batch = db.select(model.id).where(condition).limit(batch_size)
+        while True:
+            result = db.session.execute(
+                db.delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            counts[model.__tablename__] = counts.get(model.__tablename__, 0) + result.rowcount
+            if result.rowcount < batch_size:
+                break
+    return counts
+
+def _run_user_purge(user_id):
+    with app.app_context():
+        try:
+            counts = purge_user_data(user_id)
+            app.logger.info(f"バックグラウンド削除完了: ユーザーID={user_id}, 件数={counts}")
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"バックグラウンド削除エラー: ユーザーID={user_id}, {str(e)}")
+
+def start_user_purge(user_id):
+    threading.Thread(target=_run_user_purge, args=(user_id,), daemon=True).start()
+
+@app.cli.command('purge-users')
+def purge_users_command():
+    """削除待ちのユーザーのデータを削除する（中断されたバックグラウンド削除の再開用）"""
+    user_ids = [user_id for (user_id,) in db.session.query(UserPurge.user_id)]
+    for user_id in user_ids:
+        counts = purge_user_data(user_id)
+        click.echo(f'ユーザーID={user_id}: {sum(counts.values())}件削除')
+
+# データインポート（エクスポートファイルからの復元）
+RESTORE_BATCH_SIZE = 1000
+
+# (エクスポート内のパス, モデル, 区分, リンク種別) ※シミュレーションのリンクから参照される項目
+RESTORE_ITEM_TABLES = [
+    ('income_data.salary', SalaryIncomes, 'income', 'salary'),
+    ('income_data.sidejob', SidejobIncomes, 'income', 'sidejob'),
+    ('income_data.business', BusinessIncomes, 'income', 'business'),
+    ('income_data.investment', InvestmentIncomes, 'income', 'investment'),
+    ('income_data.pension', PensionIncomes, 'income', 'pension'),
+    ('income_data.other', OtherIncomes, 'income', 'other'),
+    ('expense_data.living', LivingExpenses, 'expense', 'living'),
+    ('expense_data.housing', HousingExpenses, 'expense', 'housing'),
+    ('expense_data.insurance', InsuranceExpenses, 'expense', 'insurance'),
+    ('expense_data.events', EventExpenses, 'expense', 'event'),
+    ('expense_data.education_plans', EducationPlans, 'expense', 'education'),
+]
+
+def _column_default(column):
+    """カラムに定義されたデフォルト値を返す"""
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        return default.arg(None)
+    return default.arg
+
+def _restore_value(column, value):
+    """エクスポートされた値をカラムの型に合わせて変換"""
+    if value is None:
+        return _column_default(column)
+    column_type = column.type
+    if isinstance(column_type, db.Enum) and column_type.enum_class is not None:
+        enum_class = column_type.enum_class
+        if value in enum_class.__members__:
+            return enum_class[value]
+        return enum_class(value)
+    if isinstance(column_type, db.DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, db.Date):
+        return date.fromisoformat(value[:10])
+    return value
+
+def _restore_row(model, data, **overrides):
+    """エクスポートされた1行をINSERT用のdictに変換（IDは振り直すため含めない）"""
+    row = {}
+    for column in model.__table__.columns:
+        if column.primary_key:
+            continue
+        if column.key in overrides:
+            row[column.key] = overrides[column.key]
+        else:
+            row[column.key] = _restore_value(column, data.get(column.key))
+    return row
+
+def _bulk_insert(model, rows, returning=False):
+    """複数行を1文でINSERTし、必要なら新しいIDを入力順に返す"""
+    if not rows:
+        return []
+    stmt = insert(model)
+    if returning:
+        result = db.session.execute(stmt.returning(model.id, sort_by_parameter_order=True), rows)
+        return result.scalars().all()
+    db.session.execute(stmt, rows)
+    return []
+
+def _iter_batches(items, size):
+    """イテレータを一定件数ずつのリストに区切る"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _restore_legacy_education_plan(item, user_id, plan_map):
+    """education_plan_idを持たない旧形式の教育費には、子供毎に教育プランを作り直す"""
+    key = (item.get('child_name'), item.get('child_birth_date'))
+    if key not in plan_map:
+        plan = EducationPlans(
+            user_id=user_id,
+            name=f"{item.get('child_name')}の教育費",
+            child_name=item.get('child_name'),
+            child_birth_date=_restore_value(EducationPlans.__table__.c.child_birth_date, item.get('child_birth_date'))
+        )
+        db.session.add(plan)
+        db.session.flush()
+        plan_map[key] = plan.id
+    return plan_map[key]
+
+def restore_user_data(fileobj, user_id):
+    """
+    エクスポートファイルを指定ユーザーのデータとして復元する
+    ファイル全体を読み込まず、テーブル毎に依存関係の順でストリーミング読み込みして一括INSERTする。
+    IDは全て振り直し、教育プラン・シミュレーションのリンク・口座の参照も新しいIDに置き換える。
+    コミット・ロールバックは呼び出し側で行う（全体を1トランザクションで扱うため）。
+    """
+    import ijson
+    
+    def stream(path):
+        fileobj.seek(0)
+        return ijson.items(fileobj, path + '.item', use_float=True)
+    
+    counts = {}
+    
+    def count(model, n):
+        counts[model.__tablename__] = counts.get(model.__tablename__, 0) + n
+    
+    # カテゴリは全ユーザー共通のため名前で対応付ける（旧形式はIDをそのまま使う）
+    category_maps = {}
+    for kind, model in (('expense', ExpenseCategory), ('income', IncomeCategory)):
+        existing = dict(db.session.query(model.name, model.id).all())
+        mapping = {category.get('id'): existing.get(category.get('name')) for category in stream(f'categories.{kind}')}
+        category_maps[kind] = mapping or {category_id: category_id for category_id in existing.values()}
+    
+    # 収入・支出項目（旧ID → 新ID を区分・種別毎に保持）
+    id_maps = {'income': {}, 'expense': {}}
+    for path, model, side, link_type in RESTORE_ITEM_TABLES:
+        mapping = id_maps[side].setdefault(link_type, {})
+        for batch in _iter_batches(stream(path), RESTORE_BATCH_SIZE):
+            rows = [_restore_row(model, item, user_id=user_id) for item in batch]
+            new_ids = _bulk_insert(model, rows, returning=True)
+            mapping.update(zip((item.get('id') for item in batch), new_ids))
+            count(model, len(batch))
+    
+    # 教育費（各段階）は教育プランの新IDに付け替える
+    plan_map = id_maps['expense']['education']
+    for batch in _iter_batches(stream('expense_data.education'), RESTORE_BATCH_SIZE):
+        rows = []
+        for item in batch:
+            plan_id = plan_map.get(item.get('education_plan_id'))
+            if plan_id is None:
+                plan_id = _restore_legacy_education_plan(item, user_id, plan_map)
+            rows.append(_restore_row(EducationExpenses, item, user_id=user_id, education_plan_id=plan_id))
+        _bulk_insert(EducationExpenses, rows)
+        count(EducationExpenses, len(batch))
+    
+    # シミュレーションとリンク（参照先が復元されていないリンクは捨てる）
+    for batch in _iter_batches(stream('simulation_data'), RESTORE_BATCH_SIZE):
+        rows = [_restore_row(LifeplanSimulations, item, user_id=user_id) for item in batch]
+        new_ids = _bulk_insert(LifeplanSimulations, rows, returning=True)
+        count(LifeplanSimulations, len(batch))
+        
+        expense_links = []
+        income_links = []
+        for simulation, lifeplan_id in zip(batch, new_ids):
+            for link in simulation.get('expense_links', []):
+                expense_id = id_maps['expense'].get(link.get('expense_type'), {}).get(link.get('expense_id'))
+                if expense_id is not None:
+                    expense_links.append({'lifeplan_id': lifeplan_id, 'expense_type': link['expense_type'], 'expense_id': expense_id})
+            for link in simulation.get('income_links', []):
+                income_id = id_maps['income'].get(link.get('income_type'), {}).get(link.get('income_id'))
+                if income_id is not None:
+                    income_links.append({'lifeplan_id': lifeplan_id, 'income_type': link['income_type'], 'income_id': income_id})
+        _bulk_insert(LifeplanExpenseLinks, expense_links)
+        _bulk_insert(LifeplanIncomeLinks, income_links)
+        count(LifeplanExpenseLinks, len(expense_links))
+        count(LifeplanIncomeLinks, len(income_links))
+    
+    # 家計簿（同じ年月の家計簿が既にあればそこへ追加する）
+    book_ids = {
+        (year, month): book_id
+        for year, month, book_id in db.session.query(HouseholdBook.year, HouseholdBook.month, HouseholdBook.id).filter_by(user_id=user_id)
+    }
+    entry_date_column = HouseholdEntry.__table__.c.entry_date
+    entry_rows = []
+    for book in stream('household_data'):
+        key = (book.get('year'), book.get('month'))
+        if key not in book_ids:
+            book_ids[key] = _bulk_insert(HouseholdBook, [_restore_row(HouseholdBook, book, user_id=user_id)], returning=True)[0]
+            count(HouseholdBook, 1)
+        for entry in book.get('entries', []):
+            entry_rows.append(_restore_row(
+                HouseholdEntry, entry,
+                user_id=user_id,
+                household_book_id=book_ids[key],
+                entry_date=_restore_value(entry_date_column, entry.get('date') or entry.get('entry_date')),
+                expense_category_id=category_maps['expense'].get(entry.get('expense_category_id')),
+                income_category_id=category_maps['income'].get(entry.get('income_category_id'))
+            ))
+            if len(entry_rows) >= RESTORE_BATCH_SIZE:
+                _bulk_insert(HouseholdEntry, entry_rows)
+                count(HouseholdEntry, len(entry_rows))
+                entry_rows = []
+    _bulk_insert(HouseholdEntry, entry_rows)
+    count(HouseholdEntry, len(entry_rows))
+    # 一括登録はエントリーのイベントを通らないため月次集計をまとめて作り直す
+    rebuild_household_rollups(user_id)
+    
+    # 口座と取引履歴
+    account_map = {}
+    for batch in _iter_batches(stream('account_data.accounts'), RESTORE_BATCH_SIZE):
+        rows = [_restore_row(Account, item, user_id=user_id) for item in batch]
+        account_map.update(zip((item.get('id') for item in batch), _bulk_insert(Account, rows, returning=True)))
+        count(Account, len(batch))
+    
+    for batch in _iter_batches(stream('account_data.transactions'), RESTORE_BATCH_SIZE):
+        rows = []
+        for item in batch:
+            to_account_id = account_map.get(item.get('to_account_id'))
+            from_account_id = account_map.get(item.get('from_account_id'))
+            if (item.get('to_account_id') is not None and to_account_id is None) \
+                    or (item.get('from_account_id') is not None and from_account_id is None) \
+                    or (to_account_id is None and from_account_id is None):
+                continue
+            rows.append(_restore_row(AccountTransaction, item, user_id=user_id, from_account_id=from_account_id, to_account_id=to_account_id))
+        _bulk_insert(AccountTransaction, rows)
+        count(AccountTransaction, len(rows))
+    
+    # 復元した残高を元帳の起点にする
+    snapshot_account_balances(list(account_map.values()))
+    
+    return counts
+
+@app.route('/api/import-data', methods=['POST'])
+@login_required
+def api_import_data():
+    """エクスポートしたJSONファイルを現在のユーザーのデータとして取り込む"""
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'error': 'ファイルが指定されていません'}), 400
+    
+    try:
+        counts = restore_user_data(upload.stream, current_user.id)
+        db.session.commit()
+        app.logger.info(f"データインポート完了: ユーザーID={current_user.id}, 件数={counts}")
+        return jsonify({'success': True, 'message': 'データをインポートしました', 'counts': counts})
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"データインポートエラー: {str(e)}")
+        return jsonify({'success': False, 'error': f'データインポートに失敗しました: {str(e)}'}), 500
+
+@app.cli.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--username', required=True, help='取り込み先のユーザー名')
+def import_data_command(path, username):
+    """エクスポートファイルを指定ユーザーのデータとして取り込む"""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'ユーザーが見つかりません: {username}')
+    
+    with open(path, 'rb') as f, tenant_scope(user.id if tenant_mode_enabled() else None):
+        try:
+            counts = restore_user_data(f, user.id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    
+    for table, n in counts.items():
+        click.echo(f'{table}: {n}件')
+
+# キーセットページング
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+def encode_cursor(*values):
+    """ページの最後の行のソートキーを不透明なカーソル文字列にする"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """カーソル文字列をソートキーのリストに戻す（不正な場合はValueError）"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('不正なカーソルです')
+
+def get_page_size():
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE_DEFAULT))
+    except ValueError:
+        limit = PAGE_SIZE_DEFAULT
+    return max(1, min(limit, PAGE_SIZE_MAX))
+
+def paginate_keyset(query, sort_columns, cursor, limit, cursor_values):
+    """
+    (sort_columns...) の降順でカーソルの次から limit 件を取得する
+    cursor_values(row) は行からカーソルに入れる値を返す。戻り値は (行のリスト, 次のカーソル)
+    """
+    if cursor:
+        query = query.filter(db.tuple_(*sort_columns) < db.tuple_(*cursor))
+    rows = query.order_by(*(column.desc() for column in sort_columns)).limit(limit + 1).all()
+    next_cursor = encode_cursor(*cursor_values(rows[limit - 1])) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def decode_entry_cursor(cursor):
+    """エントリー一覧のカーソル（entry_date, id）を復元する（不正な場合はValueError）"""
+    if not cursor:
+        return None
+    try:
+        entry_date, entry_id = decode_cursor(cursor)
+        return [datetime.strptime(entry_date, '%Y-%m-%d').date(), int(entry_id)]
+    except (TypeError, ValueError):
+        raise ValueError('不正なカーソルです')
+
+def paginate_entries(query, cursor):
+    return paginate_keyset(
+        query, (HouseholdEntry.entry_date, HouseholdEntry.id), cursor, get_page_size(),
+        lambda entry: (entry.entry_date.isoformat(), entry.id)
+    )
+
+def serialize_entry_with_categories(entry):
+    """一覧用のエントリー（カテゴリはキャッシュから付ける）"""
+    return {
+        'id': entry.id,
+        'household_book_id': entry.household_book_id,
+        'entry_type': entry.entry_type,
+        'amount': entry.amount,
+        'description': entry.description,
+        'entry_date': entry.entry_date.isoformat(),
+        'expense_category': get_category('expense', entry.expense_category_id) if entry.expense_category_id else None,
+        'income_category': get_category('income', entry.income_category_id) if entry.income_category_id else None,
+        'created_at': entry.created_at.isoformat()
+    }
+
 # 家計簿API
 @app.route('/api/household-books', methods=['GET', 'POST'])
 @login_required
@@ -4295,9 +5962,7 @@ def api_household_books():
             description = data.get('description', '')
             
             # 既存チェック
-            existing_book = HouseholdBook.query.filter_by(
-                user_id=current_user.id, year=year, month=month
-            ).first()
+            existing_book = find_household_book(current_user.id, year, month)
             
             if existing_book:
                 return jsonify({'error': 'この年月の家計簿は既に存在します'}), 400
@@ -4328,8 +5993,121 @@ def api_household_books():
             app.logger.error(f'家計簿作成エラー: {str(e)}')
             return jsonify({'error': '家計簿作成中にエラーが発生しました'}), 500
 
+# 家計簿エントリー登録のグループコミット
+# 連続入力では小さな登録が続けて届くため、数ミリ秒の間に届いた登録を1回のコミット（fsync）にまとめる
+# 各リクエストはまとめたコミットの完了後に応答するので、応答済みのエントリーは必ず保存されている
+# 書き込み中のコミットがなければ待たずにコミットし、書き込み中に届いた登録だけを待ち時間の間まとめる
+GROUP_COMMIT_WINDOW = 0.005  # 書き込み中に届いた最初の登録からまとめて書き込むまでの待ち時間（秒）
+GROUP_COMMIT_MAX_BATCH = 100  # この件数に達したら待たずに書き込む
+
+class _PendingEntry:
+    """コミット待ちの登録（完了するとentry_idかerrorが入る）"""
+    def __init__(self, values):
+        self.values = values
+        self.entry_id = None
+        self.error = None
+        self.done = threading.Event()
+
+class _EntryBatch:
+    def __init__(self):
+        self.entries = []
+        self.full = threading.Event()
+
+_group_commit_lock = threading.Lock()
+_group_commit_batches = {}  # 書き込み先（テナントモードではユーザーID）→ 受付中のバッチ
+_group_commit_writing = {}  # 書き込み先 → 書き込み中のバッチ数
+
+def insert_household_entry(values):
+    """
+    エントリーを同時期の他の登録とまとめてコミットし、IDを返す（失敗時は例外）
+    最初に受付中のバッチに入ったリクエストが全員分を書き込む（他のバッチの書き込み中なら一定時間待ってから）
+    """
+    # 冪等性キー付きのリクエストはキーと同じトランザクションで書き込む（キーの予約が書き込みロックを持っているため）
+    if db.session.info.get('defer_commit'):
+        entry = HouseholdEntry(**values)
+        db.session.add(entry)
+        db.session.flush()
+        return entry.id
+    
+    key = current_tenant_id() if tenant_mode_enabled() else None
+    pending = _PendingEntry(values)
+    with _group_commit_lock:
+        batch = _group_commit_batches.get(key)
+        leader = batch is None
+        if leader:
+            batch = _group_commit_batches[key] = _EntryBatch()
+            wait = _group_commit_writing.get(key, 0) > 0
+        batch.entries.append(pending)
+        if len(batch.entries) >= GROUP_COMMIT_MAX_BATCH:
+            batch.full.set()
+    
+    if leader:
+        if wait:
+            batch.full.wait(GROUP_COMMIT_WINDOW)
+        with _group_commit_lock:
+            # 締め切った後の登録は次のバッチになる
+            del _group_commit_batches[key]
+            _group_commit_writing[key] = _group_commit_writing.get(key, 0) + 1
+        try:
+            _commit_entry_batch(key, batch.entries)
+        finally:
+            with _group_commit_lock:
+                _group_commit_writing[key] -= 1
+                if not _group_commit_writing[key]:
+                    del _group_commit_writing[key]
+            # 想定外のエラーでも待っているリクエストを止めない
+            for waiting in batch.entries:
+                if not waiting.done.is_set():
+                    waiting.error = RuntimeError('エントリーを登録できませんでした')
+                    waiting.done.set()
+    
+    pending.done.wait()
+    if pending.error is not None:
+        raise pending.error
+    return pending.entry_id
+
+def _is_entry_error(e):
+    """登録内容が原因のエラーか（制約違反・値の変換の失敗。ロックやI/Oなどのデータベースのエラーは含めない）"""
+    if isinstance(e, (exc.IntegrityError, exc.DataError)):
+        return True
+    # DBAPIErrorでないStatementErrorは、実行前のパラメータの変換で失敗したもの
+    return isinstance(e, exc.StatementError) and not isinstance(e, exc.DBAPIError)
+
+def _commit_entry_batch(key, pendings):
+    """
+    まとめて1トランザクションで登録する
+    登録内容が原因の失敗なら1件ずつ登録し直して不正な登録だけを失敗にし、それ以外の失敗はバッチ全体を失敗にする
+    """
+    with tenant_scope(key):
+        session = db.session.session_factory()
+        try:
+            entries = [HouseholdEntry(**pending.values) for pending in pendings]
+            session.add_all(entries)
+            session.flush()
+            entry_ids = [entry.id for entry in entries]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(pendings) > 1 and _is_entry_error(e):
+                app.logger.warning(f'エントリーのまとめ登録に失敗したため1件ずつ登録します: {str(e)}')
+                for pending in pendings:
+                    _commit_entry_batch(key, [pending])
+                return
+            # ロック待ちの超過などは1件ずつ登録し直しても失敗するため、全員に同じエラーを返す
+            for pending in pendings:
+                pending.error = e
+                pending.done.set()
+            return
+        finally:
+            session.close()
+    
+    for pending, entry_id in zip(pendings, entry_ids):
+        pending.entry_id = entry_id
+        pending.done.set()
+
 @app.route('/api/household-entries', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def api_household_entries():
     if request.method == 'GET':
         # エントリー一覧を取得
@@ -4337,54 +6115,46 @@ def api_household_entries():
         if not household_book_id:
             return jsonify({'error': '家計簿IDが必要です'}), 400
         
-        entries = HouseholdEntry.query.filter_by(
+        # (entry_date, id) の降順でキーセットページング
+        try:
+            cursor = decode_entry_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'success': False, 'error': '不正なカーソルです'}), 400
+        
+        query = HouseholdEntry.query.filter_by(
             household_book_id=household_book_id,
             user_id=current_user.id
-        ).order_by(HouseholdEntry.entry_date.desc()).all()
+        )
+        entries, next_cursor = paginate_entries(query, cursor)
         
-        return jsonify([{
-            'id': entry.id,
-            'entry_type': entry.entry_type,
-            'amount': entry.amount,
-            'description': entry.description,
-            'entry_date': entry.entry_date.isoformat(),
-            'expense_category': {
-                'id': entry.expense_category.id,
-                'name': entry.expense_category.name,
-                'icon': entry.expense_category.icon,
-                'color': entry.expense_category.color
-            } if entry.expense_category else None,
-            'income_category': {
-                'id': entry.income_category.id,
-                'name': entry.income_category.name,
-                'icon': entry.income_category.icon,
-                'color': entry.income_category.color
-            } if entry.income_category else None,
-            'created_at': entry.created_at.isoformat()
-        } for entry in entries])
+        return jsonify({'success': True, 'next_cursor': next_cursor,
+                        'entries': [serialize_entry_with_categories(entry) for entry in entries]})
     
     elif request.method == 'POST':
         # 新しいエントリーを作成
         try:
             data = request.get_json()
+            entry_date = datetime.strptime(data['entry_date'], '%Y-%m-%d').date()
             
-            entry = HouseholdEntry(
-                household_book_id=data['household_book_id'],
-                user_id=current_user.id,
-                entry_type=data['entry_type'],
-                amount=float(data['amount']),
-                description=data.get('description', ''),
-                entry_date=datetime.strptime(data['entry_date'], '%Y-%m-%d').date(),
-                expense_category_id=data.get('expense_category_id'),
-                income_category_id=data.get('income_category_id')
-            )
+            # 未作成の家計簿（表示用の空の家計簿はidがnull）への最初の登録で家計簿を作成する
+            household_book_id = data.get('household_book_id')
+            if not household_book_id:
+                household_book_id = get_or_create_household_book(current_user.id, entry_date.year, entry_date.month).id
             
-            db.session.add(entry)
-            db.session.commit()
+            entry_id = insert_household_entry({
+                'household_book_id': household_book_id,
+                'user_id': current_user.id,
+                'entry_type': data['entry_type'],
+                'amount': to_yen(data['amount']),
+                'description': data.get('description', ''),
+                'entry_date': entry_date,
+                'expense_category_id': data.get('expense_category_id'),
+                'income_category_id': data.get('income_category_id')
+            })
             
             return jsonify({
                 'success': True,
-                'id': entry.id,
+                'id': entry_id,
                 'message': 'エントリーを追加しました'
             }), 201
             
@@ -4393,6 +6163,52 @@ def api_household_entries():
             app.logger.error(f'エントリー作成エラー: {str(e)}')
             return jsonify({'success': False, 'error': 'エントリー作成中にエラーが発生しました'}), 500
 
+@app.route('/api/household-entries/search', methods=['GET'])
+@login_required
+def api_search_household_entries():
+    """
+    家計簿エントリーの全文検索API（全期間の説明文から検索）
+    q: キーワード（空白区切りでAND）, start_date / end_date: 日付範囲, entry_type, category_id（entry_typeと併せて指定）
+    """
+    keywords = (request.args.get('q') or '').strip()
+    if not keywords:
+        return jsonify({'success': False, 'error': '検索キーワードを入力してください'}), 400
+    
+    try:
+        cursor = decode_entry_cursor(request.args.get('cursor'))
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        category_id = int(request.args['category_id']) if request.args.get('category_id') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': '検索条件が不正です'}), 400
+    entry_type = request.args.get('entry_type')
+    # 支出と収入のカテゴリIDは別々の採番のため、カテゴリでの絞り込みには種別の指定が必要
+    if category_id is not None and entry_type not in ('income', 'expense'):
+        return jsonify({'success': False, 'error': 'カテゴリで絞り込む場合はentry_typeを指定してください'}), 400
+    
+    try:
+        query = search_household_entries(current_user.id, keywords)
+        if start_date:
+            query = query.filter(HouseholdEntry.entry_date >= start_date)
+        if end_date:
+            query = query.filter(HouseholdEntry.entry_date <= end_date)
+        if entry_type in ('income', 'expense'):
+            query = query.filter(HouseholdEntry.entry_type == entry_type)
+        if category_id is not None:
+            if entry_type == 'income':
+                query = query.filter(HouseholdEntry.income_category_id == category_id)
+            else:
+                query = query.filter(HouseholdEntry.expense_category_id == category_id)
+        
+        entries, next_cursor = paginate_entries(query, cursor)
+        return jsonify({'success': True, 'next_cursor': next_cursor,
+                        'entries': [serialize_entry_with_categories(entry) for entry in entries]})
+    except Exception as e:
+        app.logger.error(f'エントリー検索エラー: {str(e)}')
+        return jsonify({'success': False, 'error': 'エントリー検索中にエラーが発生しました'}), 500
+
 @app.route('/api/household-entries/<int:entry_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
 def api_household_entry_detail(entry_id):
@@ -4423,7 +6239,7 @@ def api_household_entry_detail(entry_id):
             data = request.get_json()
             
             entry.entry_type = data.get('entry_type', entry.entry_type)
-            entry.amount = float(data.get('amount', entry.amount))
+            entry.amount = to_yen(data.get('amount', entry.amount))
             entry.description = data.get('description', entry.description)
             entry.entry_date = datetime.strptime(data['entry_date'], '%Y-%m-%d').date() if 'entry_date' in data else entry.entry_date
             entry.expense_category_id = data.get('expense_category_id')
@@ -4452,33 +6268,26 @@ def api_household_entry_detail(entry_id):
             app.logger.error(f'エントリー削除エラー: {str(e)}')
             return jsonify({'success': False, 'error': 'エントリー削除中にエラーが発生しました'}), 500
 
+def category_response(kind):
+    """カテゴリ一覧のレスポンス（ETagとCache-Controlでブラウザ側にもキャッシュさせる）"""
+    categories, etag = get_categories(kind)
+    response = jsonify({
+        'success': True,
+        'categories': list(categories)
+    })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={CATEGORY_CACHE_MAX_AGE}'
+    return response.make_conditional(request)
+
 @app.route('/api/expense-categories', methods=['GET'])
 @login_required
 def api_expense_categories():
-    categories = ExpenseCategory.query.all()
-    return jsonify({
-        'success': True,
-        'categories': [{
-            'id': cat.id,
-            'name': cat.name,
-            'icon': cat.icon,
-            'color': cat.color
-        } for cat in categories]
-    })
+    return category_response('expense')
 
 @app.route('/api/income-categories', methods=['GET'])
 @login_required
 def api_income_categories():
-    categories = IncomeCategory.query.all()
-    return jsonify({
-        'success': True,
-        'categories': [{
-            'id': cat.id,
-            'name': cat.name,
-            'icon': cat.icon,
-            'color': cat.color
-        } for cat in categories]
-    })
+    return category_response('income')
 
 @app.route('/api/household-swipe-dev/entries', methods=['GET'])
 @login_required
@@ -4541,6 +6350,42 @@ def api_export_data_simple():
         print(f"スタックトレース:\n{error_details}")
         return jsonify({'success': False, 'error': f'簡素化エクスポートに失敗しました: {str(e)}'}), 500
 
+# 既定の口座（お財布）
+# 有効な口座が1つもないユーザーには一覧で保存しない仮の口座を返し、その口座への最初の書き込みで作成する
+VIRTUAL_ACCOUNT_ID = 0  # 仮の口座のID（SQLiteのrowidは1から振られるため実在の口座と重ならない）
+DEFAULT_ACCOUNT = {
+    'name': 'お財布',
+    'account_type': 'wallet',
+    'icon': 'account_balance_wallet',
+    'color': '#4CAF50',
+    'sort_order': 0,
+}
+
+def virtual_default_account(user_id):
+    """保存しない仮の既定口座（セッションには追加しない）"""
+    return Account(id=VIRTUAL_ACCOUNT_ID, user_id=user_id, balance=0, currency='JPY', is_active=True, **DEFAULT_ACCOUNT)
+
+def ensure_default_account(user_id):
+    """有効な口座が1つもなければ既定の口座を作成して（flushのみ）そのIDを返す。口座があればNone"""
+    if Account.query.filter_by(user_id=user_id, is_active=True).first():
+        return None
+    account = Account(user_id=user_id, balance=0, **DEFAULT_ACCOUNT)
+    db.session.add(account)
+    db.session.flush()
+    return account.id
+
+def resolve_account_id(user_id, account_id):
+    """
+    リクエストの口座IDが仮の口座なら、既定の口座を作成してそのIDにする
+    既に口座がある（古い画面からの送信）なら元のIDのまま返し、存在しない口座として扱わせる
+    """
+    try:
+        if account_id is None or int(account_id) != VIRTUAL_ACCOUNT_ID:
+            return account_id
+    except (TypeError, ValueError):
+        return account_id
+    return ensure_default_account(user_id) or account_id
+
 # 口座管理API
 @app.route('/api/accounts', methods=['GET', 'POST'])
 @login_required
@@ -4551,20 +6396,9 @@ def api_accounts():
             accounts = Account.query.filter_by(user_id=current_user.id, is_active=True)\
                 .order_by(Account.sort_order.asc(), Account.created_at.asc()).all()
             
-            # デフォルト口座がない場合は作成
+            # 口座がない場合は保存しない仮の既定口座を返す（最初の書き込みで作成される）
             if not accounts:
-                default_account = Account(
-                    user_id=current_user.id,
-                    name='お財布',
-                    account_type='wallet',
-                    balance=0.0,
-                    icon='account_balance_wallet',
-                    color='#4CAF50',
-                    sort_order=0
-                )
-                db.session.add(default_account)
-                db.session.commit()
-                accounts = [default_account]
+                accounts = [virtual_default_account(current_user.id)]
             
             accounts_data = []
             for account in accounts:
@@ -4584,6 +6418,9 @@ def api_accounts():
         elif request.method == 'POST':
             data = request.get_json()
             
+            # 一覧に出ていた仮の既定口座も作成して、新しい口座の追加で消えないようにする
+            ensure_default_account(current_user.id)
+            
             # 最大表示順序を取得
             max_order = db.session.query(db.func.max(Account.sort_order))\
                 .filter_by(user_id=current_user.id).scalar() or 0
@@ -4592,14 +6429,21 @@ def api_accounts():
                 user_id=current_user.id,
                 name=data.get('name', '新しい口座'),
                 account_type=data.get('account_type', 'bank'),
-                balance=float(data.get('balance', 0.0)),
+                balance=0,
                 icon=data.get('icon', 'account_balance'),
                 color=data.get('color', '#2196F3'),
                 sort_order=max_order + 1
             )
             
             db.session.add(account)
+            db.session.flush()
+            
+            # 開始残高は調整取引として元帳に記録する
+            opening_balance = to_yen(data.get('balance', 0))
+            if opening_balance:
+                set_ledger_balance(current_user.id, account.id, 0, opening_balance, description='開始残高')
             db.session.commit()
+            db.session.refresh(account)
             
             return jsonify({
                 'success': True,
@@ -4624,6 +6468,12 @@ def api_accounts():
 def api_account_detail(account_id):
     """口座詳細更新・削除API"""
     try:
+        if account_id == VIRTUAL_ACCOUNT_ID:
+            # 仮の既定口座は保存されていないため、削除は何もせず、更新は作成してから行う
+            if request.method == 'DELETE':
+                return jsonify({'success': True, 'message': '口座を削除しました'})
+            account_id = resolve_account_id(current_user.id, account_id)
+        
         account = Account.query.filter_by(id=account_id, user_id=current_user.id).first()
         if not account:
             return jsonify({'success': False, 'error': '口座が見つかりません'}), 404
@@ -4633,11 +6483,19 @@ def api_account_detail(account_id):
             
             account.name = data.get('name', account.name)
             account.account_type = data.get('account_type', account.account_type)
-            account.balance = float(data.get('balance', account.balance))
             account.icon = data.get('icon', account.icon)
             account.color = data.get('color', account.color)
             
+            # 残高の変更は差額を調整取引として元帳に記録する
+            if 'balance' in data:
+                try:
+                    set_ledger_balance(current_user.id, account.id, account.balance, to_yen(data['balance']))
+                except LedgerError as e:
+                    db.session.rollback()
+                    return jsonify({'success': False, 'error': str(e)}), e.status_code
+            
             db.session.commit()
+            db.session.refresh(account)
             
             return jsonify({
                 'success': True,
@@ -4665,59 +6523,43 @@ def api_account_detail(account_id):
 
 @app.route('/api/account-transfer', methods=['POST'])
 @login_required
+@idempotent
 def api_account_transfer():
     """口座間送金API"""
     try:
         data = request.get_json()
-        from_account_id = data.get('from_account_id')
-        to_account_id = data.get('to_account_id')
-        amount = float(data.get('amount', 0))
+        from_account_id = resolve_account_id(current_user.id, data.get('from_account_id'))
+        to_account_id = resolve_account_id(current_user.id, data.get('to_account_id'))
+        amount = to_yen(data.get('amount', 0))
         description = data.get('description', '')
         
-        if amount <= 0:
-            return jsonify({'success': False, 'error': '金額は0より大きい値を入力してください'}), 400
-        
-        # 送金元口座の確認（収入の場合はNone）
-        from_account = None
-        if from_account_id:
-            from_account = Account.query.filter_by(id=from_account_id, user_id=current_user.id).first()
-            if not from_account:
-                return jsonify({'success': False, 'error': '送金元口座が見つかりません'}), 404
-            
-            if from_account.balance < amount:
-                return jsonify({'success': False, 'error': '残高が不足しています'}), 400
-        
-        # 送金先口座の確認
-        to_account = Account.query.filter_by(id=to_account_id, user_id=current_user.id).first()
-        if not to_account:
+        if not to_account_id:
             return jsonify({'success': False, 'error': '送金先口座が見つかりません'}), 404
         
-        # トランザクション作成
-        transaction_type = 'income' if not from_account_id else 'transfer'
-        transaction = AccountTransaction(
-            user_id=current_user.id,
-            from_account_id=from_account_id,
-            to_account_id=to_account_id,
-            amount=amount,
-            transaction_type=transaction_type,
-            description=description
-        )
-        
-        # 残高更新
-        if from_account:
-            from_account.balance -= amount
-        to_account.balance += amount
-        
-        db.session.add(transaction)
-        db.session.commit()
+        # 残高は元帳で条件付きUPDATEにより更新する（残高不足・口座なしはLedgerError）
+        # 送金元なし（nullまたは空）は外部からの入金
+        is_income = from_account_id in (None, '')
+        transaction_type = 'income' if is_income else 'transfer'
+        try:
+            transaction, _, _ = post_ledger_movement(
+                current_user.id, amount,
+                from_account_id=None if is_income else from_account_id,
+                to_account_id=to_account_id,
+                transaction_type=transaction_type,
+                description=description
+            )
+            db.session.commit()
+        except LedgerError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), e.status_code
         
         return jsonify({
             'success': True,
             'message': '送金が完了しました',
             'transaction': {
                 'id': transaction.id,
-                'from_account_name': from_account.name if from_account else '外部収入',
-                'to_account_name': to_account.name,
+                'from_account_name': transaction.from_account.name if transaction.from_account else '外部収入',
+                'to_account_name': transaction.to_account.name,
                 'amount': amount,
                 'description': description,
                 'transaction_type': transaction_type
@@ -4725,6 +6567,7 @@ def api_account_transfer():
         })
     
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"口座送金API エラー: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -4734,7 +6577,15 @@ def api_account_transactions():
     """口座取引履歴取得API"""
     try:
         account_id = request.args.get('account_id')
-        limit = int(request.args.get('limit', 50))
+        
+        # (created_at, id) の降順でキーセットページング
+        cursor = request.args.get('cursor')
+        try:
+            cursor = decode_cursor(cursor) if cursor else None
+            if cursor:
+                cursor = [datetime.fromisoformat(cursor[0]), int(cursor[1])]
+        except (ValueError, TypeError, IndexError):
+            return jsonify({'success': False, 'error': '不正なカーソルです'}), 400
         
         query = AccountTransaction.query.filter_by(user_id=current_user.id)
         
@@ -4744,14 +6595,17 @@ def api_account_transactions():
                 (AccountTransaction.to_account_id == account_id)
             )
         
-        transactions = query.order_by(AccountTransaction.created_at.desc()).limit(limit).all()
+        transactions, next_cursor = paginate_keyset(
+            query, (AccountTransaction.created_at, AccountTransaction.id), cursor, get_page_size(),
+            lambda transaction: (transaction.created_at.isoformat(), transaction.id)
+        )
         
         transactions_data = []
         for transaction in transactions:
             transactions_data.append({
                 'id': transaction.id,
                 'from_account_name': transaction.from_account.name if transaction.from_account else '外部収入',
-                'to_account_name': transaction.to_account.name,
+                'to_account_name': transaction.to_account.name if transaction.to_account else '支出',
                 'amount': transaction.amount,
                 'transaction_type': transaction.transaction_type,
                 'description': transaction.description,
@@ -4759,41 +6613,153 @@ def api_account_transactions():
                 'created_at': transaction.created_at.isoformat()
             })
         
-        return jsonify({'success': True, 'transactions': transactions_data})
+        return jsonify({'success': True, 'transactions': transactions_data, 'next_cursor': next_cursor})
     
     except Exception as e:
         app.logger.error(f"取引履歴API エラー: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/monthly-summary/<int:year>/<int:month>', methods=['GET'])
+REPORT_MAX_MONTHS = 120
+
+def _parse_year_month(value):
+    """'YYYY-MM' を (年, 月) にする（不正な場合はValueError）"""
+    parsed = datetime.strptime(value, '%Y-%m')
+    return parsed.year, parsed.month
+
+@app.route('/api/household-report', methods=['GET'])
 @login_required
-def api_monthly_summary(year, month):
-    """月別収支サマリー取得API"""
+def api_household_report():
+    """
+    期間レポートAPI（月別・カテゴリ別の合計と前年同期比）
+    year=2025 で1年分、または start=2025-01&end=2025-06 で任意の月範囲
+    家計簿単位ではなくエントリーを (user_id, entry_date) のインデックスで1回のGROUP BYで集計する
+    """
     try:
-        # 指定された年月の家計簿を取得
-        household_book = HouseholdBook.query.filter_by(
-            user_id=current_user.id,
-            year=year,
-            month=month
-        ).first()
+        if request.args.get('year'):
+            year = int(request.args['year'])
+            start, end = (year, 1), (year, 12)
+        else:
+            start = _parse_year_month(request.args.get('start', ''))
+            end = _parse_year_month(request.args.get('end', ''))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'yearまたはstart/end（YYYY-MM）を指定してください'}), 400
+    # 前年同期と翌月初めの日付が作れる範囲に限る
+    if start[0] < 2 or end >= (9999, 12):
+        return jsonify({'success': False, 'error': '期間は0002-01〜9999-11の範囲で指定してください'}), 400
+    
+    month_count = (end[0] - start[0]) * 12 + end[1] - start[1] + 1
+    if month_count < 1 or month_count > REPORT_MAX_MONTHS:
+        return jsonify({'success': False, 'error': f'期間は1〜{REPORT_MAX_MONTHS}ヶ月で指定してください'}), 400
+    
+    try:
+        # 前年同期の分も含めて1回で集計する
+        range_start = date(start[0] - 1, start[1], 1)
+        range_end = date(end[0], end[1], 1) + relativedelta(months=1)
+        year_month = db.func.strftime('%Y-%m', HouseholdEntry.entry_date)
+        category_id = db.case(
+            (HouseholdEntry.entry_type == 'income', db.func.coalesce(HouseholdEntry.income_category_id, 0)),
+            else_=db.func.coalesce(HouseholdEntry.expense_category_id, 0)
+        )
+        rows = db.session.query(
+            year_month, HouseholdEntry.entry_type, category_id,
+            db.func.sum(HouseholdEntry.amount), db.func.count(HouseholdEntry.id)
+        ).filter(
+            HouseholdEntry.user_id == current_user.id,
+            HouseholdEntry.entry_date >= range_start,
+            HouseholdEntry.entry_date < range_end
+        ).group_by(year_month, HouseholdEntry.entry_type, category_id).all()
+        
+        # 対象期間の月キーと、その前年同月のキー（13ヶ月以上の期間では同じ月が両方の役割を持つ）
+        month_keys = []
+        for offset in range(month_count):
+            current = date(start[0], start[1], 1) + relativedelta(months=offset)
+            month_keys.append((current.strftime('%Y-%m'), (current - relativedelta(years=1)).strftime('%Y-%m')))
+        current_months = {key for key, _ in month_keys}
+        previous_months = {previous: key for key, previous in month_keys}
+        
+        months = {key: {'income': 0, 'expense': 0, 'count': 0, 'prev_income': 0, 'prev_expense': 0}
+                  for key, _ in month_keys}
+        categories = {}
+        for key, entry_type, cat_id, total, count in rows:
+            entry_type = 'income' if entry_type == 'income' else 'expense'
+            category = categories.setdefault((entry_type, cat_id), {'total': 0, 'count': 0, 'prev_total': 0})
+            if key in current_months:
+                months[key][entry_type] += total
+                months[key]['count'] += count
+                category['total'] += total
+                category['count'] += count
+            if key in previous_months:
+                months[previous_months[key]]['prev_' + entry_type] += total
+                category['prev_total'] += total
+        
+        def with_delta(current, previous):
+            return {
+                'delta': current - previous,
+                'delta_rate': round((current - previous) / previous * 100, 1) if previous else None
+            }
         
-        if not household_book:
-            return jsonify({
-                'success': True,
-                'income': 0,
-                'expense': 0,
-                'balance': 0
+        month_list = []
+        for key, _ in month_keys:
+            data = months[key]
+            month_list.append({
+                'month': key,
+                'income': data['income'],
+                'expense': data['expense'],
+                'balance': data['income'] - data['expense'],
+                'count': data['count'],
+                'prev_income': data['prev_income'],
+                'prev_expense': data['prev_expense'],
+                'income_change': with_delta(data['income'], data['prev_income']),
+                'expense_change': with_delta(data['expense'], data['prev_expense'])
             })
         
-        # 収入の合計
-        income_total = db.session.query(db.func.sum(HouseholdEntry.amount))\
-            .filter_by(household_book_id=household_book.id, entry_type='income')\
-            .scalar() or 0
+        category_list = []
+        for (entry_type, cat_id), data in sorted(categories.items(), key=lambda item: -item[1]['total']):
+            category = get_category(entry_type, cat_id) if cat_id else None
+            category_list.append({
+                'entry_type': entry_type,
+                'category_id': cat_id or None,
+                'name': category['name'] if category else '未分類',
+                'icon': category['icon'] if category else 'category',
+                'color': category['color'] if category else '#666666',
+                'total': data['total'],
+                'count': data['count'],
+                'prev_total': data['prev_total'],
+                'change': with_delta(data['total'], data['prev_total'])
+            })
         
-        # 支出の合計
-        expense_total = db.session.query(db.func.sum(HouseholdEntry.amount))\
-            .filter_by(household_book_id=household_book.id, entry_type='expense')\
-            .scalar() or 0
+        total_income = sum(month['income'] for month in month_list)
+        total_expense = sum(month['expense'] for month in month_list)
+        prev_income = sum(month['prev_income'] for month in month_list)
+        prev_expense = sum(month['prev_expense'] for month in month_list)
+        
+        return jsonify({
+            'success': True,
+            'start': month_keys[0][0],
+            'end': month_keys[-1][0],
+            'summary': {
+                'income': total_income,
+                'expense': total_expense,
+                'balance': total_income - total_expense,
+                'prev_income': prev_income,
+                'prev_expense': prev_expense,
+                'income_change': with_delta(total_income, prev_income),
+                'expense_change': with_delta(total_expense, prev_expense)
+            },
+            'months': month_list,
+            'categories': category_list
+        })
+    
+    except Exception as e:
+        app.logger.error(f"期間レポートAPI エラー: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/monthly-summary/<int:year>/<int:month>', methods=['GET'])
+@login_required
+def api_monthly_summary(year, month):
+    """月別収支サマリー取得API（月次集計から取得）"""
+    try:
+        income_total, expense_total = get_monthly_totals(current_user.id, year, month)
         
         balance = income_total - expense_total
         
@@ -4810,13 +6776,14 @@ def api_monthly_summary(year, month):
 
 @app.route('/api/household-entries-from-account', methods=['POST'])
 @login_required
+@idempotent
 def api_create_household_entry_from_account():
     """家計簿エントリー作成API（口座管理からの登録用）"""
     try:
         data = request.get_json()
         
-        # 必須パラメータの確認
-        source_account_id = data.get('source_account_id')
+        # 必須パラメータの確認（仮の既定口座からの支出なら口座を作成する）
+        source_account_id = resolve_account_id(current_user.id, data.get('source_account_id'))
         expense_category_id = data.get('expense_category_id')
         amount = data.get('amount')
         entry_date = data.get('entry_date')
@@ -4826,27 +6793,23 @@ def api_create_household_entry_from_account():
         
         if not all([source_account_id, expense_category_id, amount, entry_date, entry_year, entry_month]):
             return jsonify({'success': False, 'error': '必須パラメータが不足しています'}), 400
+        try:
+            amount = to_yen(amount)
+        except ValueError:
+            return jsonify({'success': False, 'error': '金額が不正です'}), 400
         
         # 口座の確認
         account = Account.query.filter_by(id=source_account_id, user_id=current_user.id).first()
         if not account:
             return jsonify({'success': False, 'error': '口座が見つかりません'}), 404
         
-        # 残高チェック
-        if account.balance < amount:
-            return jsonify({'success': False, 'error': '残高が不足しています'}), 400
-        
         # 支出カテゴリの確認
-        expense_category = ExpenseCategory.query.get(expense_category_id)
+        expense_category = get_category('expense', expense_category_id)
         if not expense_category:
             return jsonify({'success': False, 'error': '支出カテゴリが見つかりません'}), 404
         
         # 家計簿の取得または作成
-        household_book = HouseholdBook.query.filter_by(
-            user_id=current_user.id,
-            year=entry_year,
-            month=entry_month
-        ).first()
+        household_book = find_household_book(current_user.id, entry_year, entry_month)
         
         if not household_book:
             household_book = HouseholdBook(
@@ -4869,11 +6832,21 @@ def api_create_household_entry_from_account():
             entry_date=datetime.strptime(entry_date, '%Y-%m-%d').date()
         )
         
-        # 口座残高を減らす
-        account.balance -= amount
-        
         db.session.add(entry)
-        db.session.commit()
+        
+        # 口座残高を元帳で減らし、エントリーと同じトランザクションで支出の取引履歴を書く
+        try:
+            _, new_balance, _ = post_ledger_movement(
+                current_user.id, amount,
+                from_account_id=account.id,
+                transaction_type='expense',
+                description=description or expense_category['name'],
+                transaction_date=entry.entry_date
+            )
+            db.session.commit()
+        except LedgerError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), e.status_code
         
         return jsonify({
             'success': True,
@@ -4883,13 +6856,14 @@ def api_create_household_entry_from_account():
                 'amount': entry.amount,
                 'description': entry.description,
                 'entry_date': entry.entry_date.isoformat(),
-                'category_name': expense_category.name,
+                'category_name': expense_category['name'],
                 'account_name': account.name,
-                'new_balance': account.balance
+                'new_balance': new_balance
             }
         })
     
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"家計簿登録API エラー: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -5175,5 +7149,14 @@ def generate_mock_segmentation_image():
 def test_menu():
     return render_template('test_menu.html')
 
+try:
+    precompress_static_files()
+except OSError as e:  # 書き込めない環境では圧縮せずに配信する
+    app.logger.warning(f"静的ファイルの事前圧縮に失敗しました: {str(e)}")
+
 if __name__ == '__main__':
+    # 開発サーバーは単一プロセスのため、起動時にテーブルとデフォルトカテゴリを用意する
+    # （gunicornなど複数ワーカーで動かす場合は、起動前に flask init-db を実行する）
+    with app.app_context():
+        init_database()
     app.run(host='0.0.0.0', port=8203, debug=True) 
\ No newline at end of file
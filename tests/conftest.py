@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+# アプリの読み込み前に、テスト用の一時データベースを指定する
+_database_dir = tempfile.mkdtemp(prefix='lifeplan-test-')
+os.environ['LIFEPLAN_DATABASE_URI'] = 'sqlite:///' + os.path.join(_database_dir, 'lifeplan.db')
+os.environ.pop('LIFEPLAN_TENANT_DATABASE_DIR', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as lifeplan  # noqa: E402
+
+lifeplan.app.config['TESTING'] = True
+# flask init-db と同じく、テーブル作成とスキーマ移行を行う
+with lifeplan.app.app_context():
+    lifeplan.init_database()
+
+
+@pytest.fixture
+def app_module():
+    return lifeplan
+
+
+@pytest.fixture
+def app_context():
+    with lifeplan.app.app_context():
+        yield
+
+
+@pytest.fixture
+def tenant_mode(tmp_path, monkeypatch):
+    """テナントモード（ユーザー毎のSQLiteファイル）を有効にし、ファイルの置き場所を返す"""
+    directory = tmp_path / 'tenants'
+    monkeypatch.setitem(lifeplan.app.config, 'TENANT_DATABASE_DIR', str(directory))
+    yield directory
+    with lifeplan._tenant_engines_lock:
+        for engine in lifeplan._tenant_engines.values():
+            engine.dispose()
+        lifeplan._tenant_engines.clear()
+
+
+@pytest.fixture
+def login():
+    """新しいユーザーを登録してログイン済みのクライアントを返す（戻り値は (クライアント, ユーザーID)）"""
+    def _login(password='pass'):
+        username = f'user_{uuid.uuid4().hex[:12]}'
+        client = lifeplan.app.test_client()
+        client.post('/register', json={'username': username, 'password': password})
+        response = client.post('/login', json={'username': username, 'password': password})
+        assert response.json['success'], response.json
+        with lifeplan.app.app_context():
+            user_id = lifeplan.User.query.filter_by(username=username).first().id
+        return client, user_id
+    return _login
+
+
+def _seed_user(client, user_id):
+    """ユーザーデータの全テーブルに行を作る"""
+    client.post('/api/living-expenses', json={'name': '生活費', 'start_year': 2024, 'end_year': 2030, 'food_home': 30000})
+    client.post('/api/housing-expenses', json={'name': '住居', 'start_year': 2024, 'end_year': 2030,
+                                               'residence_type': '賃貸', 'rent_monthly': 80000,
+                                               'repayment_method': '元利均等'})
+    client.post('/api/education-expenses', json={'name': '教育', 'child_name': '太郎', 'child_birth_date': '2020-01-01',
+                                                 'kindergarten_type': '公立幼稚園', 'elementary_type': '公立小学校',
+                                                 'junior_type': '公立中学校', 'high_type': '公立高校',
+                                                 'college_type': '国公立大学'})
+    with lifeplan.app.app_context(), lifeplan.tenant_scope(user_id):
+        db = lifeplan.db
+        for model in (lifeplan.SalaryIncomes, lifeplan.SidejobIncomes, lifeplan.BusinessIncomes,
+                      lifeplan.InvestmentIncomes, lifeplan.PensionIncomes, lifeplan.OtherIncomes):
+            db.session.add(model(user_id=user_id, name='収入', monthly_amount=1000, annual_amount=12000,
+                                 start_year=2024, end_year=2030))
+        db.session.add(lifeplan.InsuranceExpenses(user_id=user_id, name='保険', start_year=2024, end_year=2030))
+        db.session.add(lifeplan.EventExpenses(user_id=user_id, name='イベント', start_year=2025, end_year=2025,
+                                              category=lifeplan.EventCategory.CAR, amount=1000000))
+        db.session.commit()
+
+    expenses = client.get('/api/all-expenses').json
+    incomes = client.get('/api/all-incomes').json
+    response = client.post('/api/simulation-plans', json={
+        'name': 'プラン', 'base_age': 30, 'start_year': 2024, 'end_year': 2050,
+        'selected_expenses': {'living': [expenses['living'][0]['id']], 'education': [expenses['education'][0]['id']]},
+        'selected_incomes': {'salary': [incomes['salary'][0]['id']]}
+    })
+    assert response.status_code == 200, response.json
+
+    book = client.post('/api/household-books', json={'year': 2025, 'month': 3}).json
+    for day in range(1, 4):
+        client.post('/api/household-entries', json={'household_book_id': book['id'], 'entry_type': 'expense',
+                                                     'amount': 100 * day, 'entry_date': f'2025-03-0{day}',
+                                                     'expense_category_id': 1})
+    client.get('/api/accounts')
+    client.post('/api/accounts', json={'name': '銀行', 'balance': 1000})
+    accounts = client.get('/api/accounts').json['accounts']
+    response = client.post('/api/account-transfer', headers={'Idempotency-Key': 'seed-transfer'},
+                           json={'from_account_id': accounts[1]['id'], 'to_account_id': accounts[0]['id'], 'amount': 100})
+    assert response.json['success'], response.json
+
+    with lifeplan.app.app_context(), lifeplan.tenant_scope(user_id):
+        lifeplan.snapshot_account_balances([account['id'] for account in accounts])
+        lifeplan.db.session.commit()
+
+
+@pytest.fixture
+def seed_user():
+    """ユーザーデータの全テーブルに行を作る関数（引数は (クライアント, ユーザーID)）"""
+    return _seed_user
@@ -0,0 +1,66 @@
+import pytest
+
+
+def rows_referencing(lifeplan, user_id):
+    """ユーザーIDを参照する行と、親が消えた（外部キーの参照先がない）行の件数をテーブル毎に返す"""
+    db = lifeplan.db
+    found = {}
+    for table in db.metadata.sorted_tables:
+        if table.name == 'users':
+            condition = table.c.id == user_id
+        elif 'user_id' in table.c:
+            condition = table.c.user_id == user_id
+        else:
+            condition = None
+        if condition is not None:
+            count = db.session.scalar(db.select(db.func.count()).select_from(table).where(condition))
+            if count:
+                found[table.name] = count
+        for foreign_key in table.foreign_keys:
+            column, parent = foreign_key.parent, foreign_key.column
+            orphans = db.session.scalar(
+                db.select(db.func.count()).select_from(table).where(
+                    column.isnot(None),
+                    ~db.exists().where(parent == column)
+                )
+            )
+            if orphans:
+                found[f'{table.name}.{column.name}'] = orphans
+    return found
+
+
+@pytest.fixture
+def seeded(app_module, login, seed_user):
+    client, user_id = login()
+    seed_user(client, user_id)
+    other_client, other_id = login()
+    seed_user(other_client, other_id)
+    with app_module.app.app_context():
+        empty = [model.__tablename__ for model, condition in app_module.user_data_deletes(user_id)
+                 if model is not app_module.UserPurge
+                 and not app_module.db.session.scalar(
+                     app_module.db.select(app_module.db.func.count()).select_from(model).where(condition))]
+        assert empty == [], f'データが作られていないテーブル: {empty}'
+        other_rows = app_module.count_user_rows(other_id)
+    return user_id, other_id, other_rows
+
+
+def test_delete_user_data_leaves_no_orphans(app_module, app_context, seeded):
+    user_id, other_id, other_rows = seeded
+    app_module.delete_user_data(user_id)
+    app_module.db.session.commit()
+
+    assert rows_referencing(app_module, user_id) == {}
+    assert app_module.count_user_rows(other_id) == other_rows
+
+
+def test_purge_user_data_leaves_no_orphans(app_module, app_context, seeded):
+    user_id, other_id, other_rows = seeded
+    app_module.schedule_user_purge(user_id)
+    app_module.db.session.commit()
+    assert app_module.UserPurge.query.filter_by(user_id=user_id).count() == 1
+
+    app_module.purge_user_data(user_id, batch_size=2)
+
+    assert rows_referencing(app_module, user_id) == {}
+    assert app_module.count_user_rows(other_id) == other_rows
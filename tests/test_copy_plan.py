@@ -0,0 +1,65 @@
+def plan_links(lifeplan, plan_id):
+    """プランのリンク {(種別, 項目ID)}"""
+    db = lifeplan.db
+    links = set()
+    for link_model, type_column, id_column, _ in lifeplan.PLAN_LINK_TABLES:
+        links.update(db.session.execute(
+            db.select(type_column, id_column).where(link_model.lifeplan_id == plan_id)).all())
+    return links
+
+
+def linked_item(lifeplan, link_type, item_id):
+    models = dict(lifeplan.COPY_EXPENSE_LINK_MODELS, **lifeplan.COPY_INCOME_LINK_MODELS)
+    return lifeplan.db.session.get(models[link_type], item_id)
+
+
+def stage_names(lifeplan, plan_id):
+    EducationExpenses = lifeplan.EducationExpenses
+    return lifeplan.db.session.scalars(lifeplan.db.select(EducationExpenses.name)
+                                       .where(EducationExpenses.education_plan_id == plan_id)
+                                       .order_by(EducationExpenses.id)).all()
+
+
+def test_copy_plan_with_items_links_to_clones(app_module, login, seed_user):
+    client, user_id = login()
+    seed_user(client, user_id)
+    with app_module.app.app_context():
+        plan_id = app_module.LifeplanSimulations.query.filter_by(user_id=user_id).one().id
+
+    response = client.post(f'/api/simulation-plans/{plan_id}/copy', json={'with_items': True})
+    assert response.status_code == 200, response.json
+    new_plan_id = response.json['new_id']
+
+    with app_module.app.app_context():
+        old_links = plan_links(app_module, plan_id)
+        new_links = plan_links(app_module, new_plan_id)
+        assert {link_type for link_type, _ in new_links} == {link_type for link_type, _ in old_links}
+        assert {'living', 'education', 'salary'} <= {link_type for link_type, _ in new_links}
+        assert not new_links & old_links
+        for link_type, item_id in new_links:
+            item = linked_item(app_module, link_type, item_id)
+            assert item.user_id == user_id
+            assert item.name.endswith(app_module.COPY_SUFFIX)
+
+        # 教育プランは全段階ごと複製し、段階の名前には「 (コピー)」を付けない
+        old_plan = next(item_id for link_type, item_id in old_links if link_type == 'education')
+        new_plan = next(item_id for link_type, item_id in new_links if link_type == 'education')
+        assert stage_names(app_module, old_plan)
+        assert stage_names(app_module, new_plan) == stage_names(app_module, old_plan)
+
+
+def test_copy_other_users_items_returns_404(app_module, login, seed_user):
+    owner, owner_id = login()
+    seed_user(owner, owner_id)
+    with app_module.app.app_context():
+        plan_id = app_module.LifeplanSimulations.query.filter_by(user_id=owner_id).one().id
+    education_id = owner.get('/api/all-expenses').json['education'][0]['id']
+    living_id = owner.get('/api/all-expenses').json['living'][0]['id']
+
+    client, user_id = login()
+    assert client.post(f'/api/simulation-plans/{plan_id}/copy', json={'with_items': True}).status_code == 404
+    assert client.post(f'/api/education-expenses/{education_id}/copy').status_code == 404
+    assert client.post(f'/api/living-expenses/{living_id}/copy').status_code == 404
+    with app_module.app.app_context():
+        assert app_module.LifeplanSimulations.query.filter_by(user_id=user_id).count() == 0
+        assert app_module.EducationPlans.query.filter_by(user_id=user_id).count() == 0
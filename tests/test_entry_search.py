@@ -0,0 +1,15 @@
+def test_search_category_filter_requires_entry_type(app_module, login):
+    client, user_id = login()
+    for entry_type, category in (('expense', 'expense_category_id'), ('income', 'income_category_id')):
+        response = client.post('/api/household-entries', json={'entry_type': entry_type, 'amount': 1000,
+                                                               'description': 'コンビニ', 'entry_date': '2025-03-01',
+                                                               category: 1})
+        assert response.status_code in (200, 201), response.json
+
+    response = client.get('/api/household-entries/search?q=コンビニ&category_id=1')
+    assert response.status_code == 400
+
+    for entry_type in ('expense', 'income'):
+        response = client.get(f'/api/household-entries/search?q=コンビニ&category_id=1&entry_type={entry_type}')
+        assert response.status_code == 200
+        assert [entry['entry_type'] for entry in response.json['entries']] == [entry_type]
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+import sqlalchemy
+from sqlalchemy import event
+
+# 外部サービスに接続するもの・セッションを終えるものは巡回しない
+SKIPPED_RULES = {'/api/nikkei', '/logout'}
+
+# IDを受け取るルート（ルートの前方一致）→ IDを探すモデル名
+ROUTE_MODELS = {
+    '/expenses/living/': 'LivingExpenses',
+    '/expenses/education/': 'EducationPlans',
+    '/expenses/housing/': 'HousingExpenses',
+    '/expenses/insurance/': 'InsuranceExpenses',
+    '/expenses/events/': 'EventExpenses',
+    '/incomes/salary/': 'SalaryIncomes',
+    '/incomes/sidejob/': 'SidejobIncomes',
+    '/incomes/investment/': 'InvestmentIncomes',
+    '/incomes/pension/': 'PensionIncomes',
+    '/incomes/other/': 'OtherIncomes',
+    '/incomes/business/': 'BusinessIncomes',
+    '/simulation/': 'LifeplanSimulations',
+    '/api/education-expenses/': 'EducationPlans',
+    '/api/business-incomes/': 'BusinessIncomes',
+    '/api/simulation-plans/': 'LifeplanSimulations',
+    '/api/household-entries/': 'HouseholdEntry',
+}
+DATE_ARGUMENTS = {'year': 2025, 'month': 3, 'day': 1}
+
+# クエリ文字列がないと処理まで進まないルートの追加分
+QUERY_VARIANTS = {
+    '/api/household-entries': ['household_book_id={book_id}'],
+    '/api/household-entries/search': ['q=コンビニ'],
+    '/api/household-report': ['year=2025', 'start=2024-01&end=2025-06'],
+    '/api/account-transactions': ['limit=5'],
+    '/api/export-data': ['format=ndjson', 'format=csv'],
+}
+
+WRITE_KEYWORDS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def first_id(lifeplan, model_name, user_id):
+    model = getattr(lifeplan, model_name)
+    with lifeplan.app.app_context(), lifeplan.tenant_scope(user_id):
+        item_id = lifeplan.db.session.scalar(
+            lifeplan.db.select(model.id).where(model.user_id == user_id).order_by(model.id).limit(1))
+    return item_id or 0
+
+
+def get_paths(lifeplan, user_id):
+    """GETを受け付ける全ルートのURL（引数はユーザー自身の行のIDや日付で埋める）"""
+    paths = []
+    for rule in lifeplan.app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint == 'static' or rule.rule in SKIPPED_RULES:
+            continue
+        values = {}
+        for argument in rule.arguments:
+            if argument in DATE_ARGUMENTS:
+                values[argument] = DATE_ARGUMENTS[argument]
+                continue
+            prefixes = [prefix for prefix in ROUTE_MODELS if rule.rule.startswith(prefix)]
+            if not prefixes:
+                pytest.fail(f'{rule.rule} の引数 {argument} の値が決められません（ROUTE_MODELSに追加してください）')
+            values[argument] = first_id(lifeplan, ROUTE_MODELS[max(prefixes, key=len)], user_id)
+        with lifeplan.app.test_request_context():
+            path = lifeplan.url_for(rule.endpoint, **values)
+        paths.append(path)
+        book_id = first_id(lifeplan, 'HouseholdBook', user_id)
+        paths.extend(f'{path}?{query.format(book_id=book_id)}' for query in QUERY_VARIANTS.get(rule.rule, []))
+    return paths
+
+
+def writes_on_get(lifeplan, client, paths):
+    """GETの間に実行された書き込み文をパス毎に返す"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(None, 1)[0].upper() in WRITE_KEYWORDS:
+            statements.append(statement.strip().splitlines()[0])
+
+    found = {}
+    event.listen(sqlalchemy.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for path in paths:
+            statements.clear()
+            client.get(path).close()
+            if statements:
+                found[path] = list(statements)
+    finally:
+        event.remove(sqlalchemy.engine.Engine, 'before_cursor_execute', before_cursor_execute)
+    return found
+
+
+@pytest.mark.parametrize('tenant', [False, True], ids=['shared', 'tenant'])
+@pytest.mark.parametrize('seeded', [False, True], ids=['new_user', 'seeded_user'])
+def test_get_routes_do_not_write(app_module, login, seed_user, seeded, tenant, request):
+    if tenant:
+        request.getfixturevalue('tenant_mode')
+    client, user_id = login()
+    if seeded:
+        seed_user(client, user_id)
+    elif tenant:
+        # ファイルのないユーザー（split-tenants前など）のGETでもファイルを作らない
+        app_module.remove_tenant_database(user_id)
+    paths = get_paths(app_module, user_id)
+    assert len(paths) > 80, len(paths)
+
+    assert writes_on_get(app_module, client, paths) == {}
+    if tenant:
+        assert os.path.exists(app_module.tenant_database_path(user_id)) == seeded
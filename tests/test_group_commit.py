@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+from sqlalchemy import event, exc
+
+REQUESTS = 12
+
+
+def post_entries_concurrently(lifeplan, username, bodies):
+    """同時にエントリーを登録し、リクエスト毎の (ステータス, JSON) を返す"""
+    clients = []
+    for _ in bodies:
+        client = lifeplan.app.test_client()
+        assert client.post('/login', json={'username': username, 'password': 'pass'}).json['success']
+        clients.append(client)
+    barrier = threading.Barrier(len(bodies))
+    results = [None] * len(bodies)
+
+    def post(index):
+        barrier.wait()
+        response = clients[index].post('/api/household-entries', json=bodies[index])
+        results[index] = (response.status_code, response.json)
+
+    threads = [threading.Thread(target=post, args=(index,)) for index in range(len(bodies))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_entries_are_committed_together(app_module, login, monkeypatch):
+    monkeypatch.setattr(app_module, 'GROUP_COMMIT_WINDOW', 0.2)
+    client, user_id = login()
+    with app_module.app.app_context():
+        username = app_module.db.session.get(app_module.User, user_id).username
+        engine = app_module.db.engine
+    book = client.post('/api/household-books', json={'year': 2025, 'month': 5}).json
+    bodies = [{'household_book_id': book['id'], 'entry_type': 'expense', 'amount': 100 + index,
+               'entry_date': '2025-05-01', 'expense_category_id': 1 + index % 2} for index in range(REQUESTS)]
+    # entry_typeのない不正な登録（NOT NULL制約違反）
+    bodies[REQUESTS // 2] = dict(bodies[REQUESTS // 2], entry_type=None)
+
+    commits = []
+    listener = lambda connection: commits.append(1)  # noqa: E731
+    event.listen(engine, 'commit', listener)
+    try:
+        results = post_entries_concurrently(app_module, username, bodies)
+    finally:
+        event.remove(engine, 'commit', listener)
+
+    statuses = [status for status, _ in results]
+    assert statuses[REQUESTS // 2] == 500
+    assert statuses.count(201) == REQUESTS - 1
+    ids = [body['id'] for status, body in results if status == 201]
+    assert len(set(ids)) == len(ids)
+    assert len(commits) < REQUESTS
+
+    with app_module.app.app_context():
+        db = app_module.db
+        HouseholdEntry = app_module.HouseholdEntry
+        entries = db.session.execute(db.select(HouseholdEntry.id, HouseholdEntry.amount)
+                                     .where(HouseholdEntry.user_id == user_id)).all()
+        assert sorted(entry.id for entry in entries) == sorted(ids)
+        expected = sum(body['amount'] for status, body in zip(statuses, bodies) if status == 201)
+        assert app_module.get_monthly_totals(user_id, 2025, 5) == (0, expected)
+        assert sum(row.entry_count for row in app_module.get_monthly_rollup(user_id, 2025, 5)) == len(ids)
+
+
+def test_database_error_fails_whole_batch_without_retry(app_module, login, monkeypatch):
+    client, user_id = login()
+    with app_module.app.app_context():
+        book = app_module.get_or_create_household_book(user_id, 2025, 6)
+        app_module.db.session.commit()
+        book_id = book.id
+    pendings = [app_module._PendingEntry({'household_book_id': book_id, 'user_id': user_id, 'entry_type': 'expense',
+                                          'amount': 100, 'entry_date': app_module.date(2025, 6, 1)})
+                for _ in range(3)]
+
+    flushes = []
+
+    def locked(session, flush_context, instances):
+        flushes.append(1)
+        raise exc.OperationalError('INSERT INTO household_entries', {}, Exception('database is locked'))
+
+    event.listen(app_module.TenantSession, 'before_flush', locked)
+    try:
+        with app_module.app.app_context():
+            app_module._commit_entry_batch(None, pendings)
+    finally:
+        event.remove(app_module.TenantSession, 'before_flush', locked)
+
+    # ロックのエラーは1件ずつ登録し直さず、全員に同じエラーを返す
+    assert len(flushes) == 1
+    assert all(pending.done.is_set() for pending in pendings)
+    assert all(isinstance(pending.error, exc.OperationalError) for pending in pendings)
+    with app_module.app.app_context():
+        assert app_module.get_monthly_totals(user_id, 2025, 6) == (0, 0)
+
+
+@pytest.mark.parametrize('error', [
+    exc.IntegrityError('INSERT INTO household_entries', {}, Exception('NOT NULL constraint failed')),
+    exc.StatementError('値を変換できません', 'INSERT INTO household_entries', {}, ValueError()),
+])
+def test_entry_errors_are_retried_one_by_one(app_module, error):
+    assert app_module._is_entry_error(error)
+    assert not app_module._is_entry_error(
+        exc.OperationalError('INSERT INTO household_entries', {}, Exception('database is locked')))
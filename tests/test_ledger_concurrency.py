@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+THREADS = 8
+
+
+def create_accounts(lifeplan, user_id, balances):
+    """残高を指定して口座を作り、IDのリストを返す"""
+    with lifeplan.app.app_context():
+        accounts = [lifeplan.Account(user_id=user_id, name=f'口座{i}', account_type='bank', balance=balance)
+                    for i, balance in enumerate(balances)]
+        lifeplan.db.session.add_all(accounts)
+        lifeplan.db.session.flush()
+        account_ids = [account.id for account in accounts]
+        lifeplan.snapshot_account_balances(account_ids)
+        lifeplan.db.session.commit()
+    return account_ids
+
+
+def run_transfers(lifeplan, user_id, moves_per_thread):
+    """
+    スレッド毎に別の接続で送金を実行する（moves_per_threadは1スレッド分の (金額, 送金元, 送金先) のリスト）
+    戻り値は (成功件数, 残高不足で失敗した件数)
+    """
+    results = {'posted': 0, 'rejected': 0}
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker():
+        with lifeplan.app.app_context():
+            start.wait()
+            for amount, from_account_id, to_account_id in moves_per_thread:
+                try:
+                    lifeplan.post_ledger_movement(user_id, amount, from_account_id, to_account_id)
+                    lifeplan.db.session.commit()
+                    outcome = 'posted'
+                except lifeplan.LedgerError:
+                    lifeplan.db.session.rollback()
+                    outcome = 'rejected'
+                except Exception as e:
+                    lifeplan.db.session.rollback()
+                    errors.append(e)
+                    continue
+                with lock:
+                    results[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return results['posted'], results['rejected']
+
+
+def balances(lifeplan, account_ids):
+    with lifeplan.app.app_context():
+        rows = lifeplan.db.session.query(lifeplan.Account.id, lifeplan.Account.balance)\
+            .filter(lifeplan.Account.id.in_(account_ids)).all()
+        return {account_id: balance for account_id, balance in rows}
+
+
+@pytest.fixture
+def user_id(login):
+    return login()[1]
+
+
+def test_concurrent_transfers_conserve_total(app_module, user_id, monkeypatch):
+    monkeypatch.setattr(app_module, 'LEDGER_SNAPSHOT_INTERVAL', 7)
+    first, second = create_accounts(app_module, user_id, [500, 500])
+    # 逆向きの送金も混ぜ、残高不足での失敗と成功が入り混じるようにする
+    moves = [(7, first, second), (5, second, first), (11, first, second)] * 10
+
+    posted, rejected = run_transfers(app_module, user_id, moves)
+
+    assert posted + rejected == THREADS * len(moves)
+    result = balances(app_module, [first, second])
+    assert result[first] + result[second] == 1000
+    assert min(result.values()) >= 0
+    with app_module.app.app_context():
+        assert app_module.reconstruct_balance(first) == result[first]
+        assert app_module.reconstruct_balance(second) == result[second]
+        transactions = app_module.AccountTransaction.query.filter(
+            app_module.AccountTransaction.from_account_id.in_([first, second])).count()
+    assert transactions == posted
+
+
+@pytest.mark.parametrize('balance, amount', [(10, 3), (100, 7), (5, 6)])
+def test_concurrent_overdraw_succeeds_floor_times(app_module, user_id, balance, amount):
+    source, destination = create_accounts(app_module, user_id, [balance, 0])
+    moves = [(amount, source, destination)] * 5
+
+    posted, rejected = run_transfers(app_module, user_id, moves)
+
+    assert posted == balance // amount
+    assert rejected == THREADS * len(moves) - posted
+    result = balances(app_module, [source, destination])
+    assert result[source] == balance - posted * amount
+    assert result[destination] == posted * amount
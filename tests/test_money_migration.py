@@ -0,0 +1,82 @@
+import re
+
+LEGACY_TABLES = {'household_entries': 'amount', 'accounts': 'balance'}
+
+
+def make_legacy_table(engine, table_name, column):
+    """テーブルを金額列がREALだった頃の定義で作り直す（行はそのまま移す）"""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).scalar()
+        legacy_sql = re.sub(rf'\b{column} INTEGER\b', f'{column} FLOAT', sql)
+        assert legacy_sql != sql
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = ON')
+        connection.exec_driver_sql('BEGIN')
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} RENAME TO {table_name}_current')
+        connection.exec_driver_sql(legacy_sql)
+        connection.exec_driver_sql(f'INSERT INTO {table_name} SELECT * FROM {table_name}_current')
+        connection.exec_driver_sql(f'DROP TABLE {table_name}_current')
+        connection.exec_driver_sql('COMMIT')
+        connection.exec_driver_sql('PRAGMA legacy_alter_table = OFF')
+
+
+def column_summary(lifeplan, table_name, column):
+    """(件数, 四捨五入した合計, 整数でない値の件数)"""
+    return tuple(lifeplan.db.session.execute(lifeplan.db.text(
+        f"SELECT COUNT(*), SUM(CAST(ROUND({column}) AS INTEGER)), SUM(typeof({column}) NOT IN ('integer', 'null')) "
+        f"FROM {table_name}"
+    )).one())
+
+
+def test_migrate_database_converts_real_money_columns(app_module, app_context, login):
+    client, user_id = login()
+    for day, amount in enumerate((1200, 345, 6789), start=1):
+        response = client.post('/api/household-entries', json={'entry_type': 'expense', 'amount': amount,
+                                                               'entry_date': f'2025-04-0{day}',
+                                                               'expense_category_id': 1})
+        assert response.status_code in (200, 201), response.json
+    client.post('/api/accounts', json={'name': '銀行', 'balance': 1000})
+
+    db = app_module.db
+    for table_name, column in LEGACY_TABLES.items():
+        make_legacy_table(db.engine, table_name, column)
+        # 端数のある金額（切り上げ・切り捨ての両方）を作る
+        db.session.execute(db.text(
+            f'UPDATE {table_name} SET {column} = {column} + CASE WHEN id % 2 THEN 0.4 ELSE 0.6 END '
+            f'WHERE user_id = :user_id'), {'user_id': user_id})
+        db.session.commit()
+    before = {table_name: column_summary(app_module, table_name, column)
+              for table_name, column in LEGACY_TABLES.items()}
+    assert all(summary[2] for summary in before.values())
+
+    app_module.migrate_database()
+
+    for table_name, column in LEGACY_TABLES.items():
+        count, total, non_integer = column_summary(app_module, table_name, column)
+        assert (count, total) == before[table_name][:2]
+        assert non_integer == 0
+    assert app_module.verify_money_integrity() == []
+    # 作り直したテーブルに全文検索の同期トリガーが付け直されている
+    triggers = db.session.execute(db.text(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'household_entries'")).scalar()
+    assert triggers == len(app_module.HOUSEHOLD_FTS_TRIGGERS)
+
+
+def test_init_database_migrates_tenant_files(app_module, app_context, login, tenant_mode):
+    client, user_id = login()
+    for amount in (1200, 345):
+        response = client.post('/api/household-entries', json={'entry_type': 'expense', 'amount': amount,
+                                                               'entry_date': '2025-04-01', 'expense_category_id': 1})
+        assert response.status_code in (200, 201), response.json
+    engine = app_module.tenant_engine(user_id)
+    make_legacy_table(engine, 'household_entries', 'amount')
+    with engine.begin() as connection:
+        connection.exec_driver_sql('UPDATE household_entries SET amount = amount + 0.6')
+
+    app_module.init_database()
+
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql('SELECT amount, typeof(amount) FROM household_entries ORDER BY id').all()
+    assert rows == [(1201, 'integer'), (346, 'integer')]
+    with app_module.tenant_scope(user_id):
+        assert app_module.verify_money_integrity() == []
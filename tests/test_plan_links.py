@@ -0,0 +1,39 @@
+import pytest
+
+MISSING_ITEM_ID = 999999
+
+
+def expense_links(lifeplan, user_id, plan_id):
+    with lifeplan.app.app_context(), lifeplan.tenant_scope(user_id):
+        LifeplanExpenseLinks = lifeplan.LifeplanExpenseLinks
+        return sorted(lifeplan.db.session.execute(
+            lifeplan.db.select(LifeplanExpenseLinks.expense_type, LifeplanExpenseLinks.expense_id)
+            .where(LifeplanExpenseLinks.lifeplan_id == plan_id)).all())
+
+
+@pytest.mark.parametrize('tenant', [False, True], ids=['shared', 'tenant'])
+def test_prune_plan_links_removes_only_dangling_links(app_module, login, seed_user, tenant, request):
+    if tenant:
+        request.getfixturevalue('tenant_mode')
+    client, user_id = login()
+    seed_user(client, user_id)
+    with app_module.app.app_context(), app_module.tenant_scope(user_id):
+        db = app_module.db
+        plan_id = db.session.scalar(db.select(app_module.LifeplanSimulations.id)
+                                    .where(app_module.LifeplanSimulations.user_id == user_id))
+        # 項目の削除でリンクを消すようになる前に残ったリンク
+        db.session.add(app_module.LifeplanExpenseLinks(lifeplan_id=plan_id, expense_type='living',
+                                                       expense_id=MISSING_ITEM_ID))
+        db.session.commit()
+    links = expense_links(app_module, user_id, plan_id)
+    assert ('living', MISSING_ITEM_ID) in links
+
+    runner = app_module.app.test_cli_runner()
+    # init-db はリンクを掃除しない
+    result = runner.invoke(args=['init-db'])
+    assert result.exit_code == 0, result.output
+    assert expense_links(app_module, user_id, plan_id) == links
+
+    result = runner.invoke(args=['prune-plan-links'])
+    assert result.exit_code == 0, result.output
+    assert expense_links(app_module, user_id, plan_id) == [link for link in links if link[1] != MISSING_ITEM_ID]
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+ENDPOINTS = ['/api/simulation-plans', '/api/all-expenses', '/api/education-expenses']
+MAX_QUERIES = 3
+
+
+@contextmanager
+def count_queries(lifeplan):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with lifeplan.app.app_context():
+        engine = lifeplan.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed(lifeplan, client, user_id, size):
+    """指定件数ずつ支出・収入・教育プラン・シミュレーションプラン（リンク付き）を作る"""
+    with lifeplan.app.app_context():
+        db = lifeplan.db
+        for i in range(size):
+            db.session.add(lifeplan.LivingExpenses(user_id=user_id, name=f'生活費{i}', start_year=2024, end_year=2030))
+            db.session.add(lifeplan.InsuranceExpenses(user_id=user_id, name=f'保険{i}', start_year=2024, end_year=2030))
+            db.session.add(lifeplan.SalaryIncomes(user_id=user_id, name=f'給与{i}', monthly_amount=1000,
+                                                  annual_amount=12000, start_year=2024, end_year=2030))
+        db.session.commit()
+    for i in range(size):
+        client.post('/api/education-expenses', json={'name': f'教育{i}', 'child_name': '太郎',
+                                                     'child_birth_date': '2020-01-01',
+                                                     'kindergarten_type': '公立幼稚園', 'elementary_type': '公立小学校',
+                                                     'junior_type': '公立中学校', 'high_type': '公立高校',
+                                                     'college_type': '国公立大学'})
+    expenses = client.get('/api/all-expenses').json
+    incomes = client.get('/api/all-incomes').json
+    for i in range(size):
+        response = client.post('/api/simulation-plans', json={
+            'name': f'プラン{i}', 'base_age': 30, 'start_year': 2024, 'end_year': 2050,
+            'selected_expenses': {'living': [item['id'] for item in expenses['living']],
+                                  'education': [item['id'] for item in expenses['education']]},
+            'selected_incomes': {'salary': [item['id'] for item in incomes['salary']]}
+        })
+        assert response.status_code == 200, response.json
+
+
+def query_counts(lifeplan, client):
+    counts = {}
+    for endpoint in ENDPOINTS:
+        # 初回だけの読み込みを除くため、一度リクエストしてから数える
+        assert client.get(endpoint).status_code == 200
+        with count_queries(lifeplan) as statements:
+            response = client.get(endpoint)
+        assert response.status_code == 200
+        counts[endpoint] = len(statements)
+    return counts
+
+
+@pytest.mark.parametrize('small, large', [(1, 12)])
+def test_list_endpoints_issue_constant_queries(app_module, login, small, large):
+    small_client, small_user = login()
+    seed(app_module, small_client, small_user, small)
+    large_client, large_user = login()
+    seed(app_module, large_client, large_user, large)
+
+    small_counts = query_counts(app_module, small_client)
+    large_counts = query_counts(app_module, large_client)
+
+    assert large_counts == small_counts
+    for endpoint, count in large_counts.items():
+        assert count <= MAX_QUERIES, f'{endpoint}: {count}件'
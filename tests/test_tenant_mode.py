@@ -0,0 +1,106 @@
+import os
+import sqlite3
+
+
+def user_row_counts(connection, lifeplan, user_id):
+    """ユーザーデータのテーブル毎の、user_idがユーザーの行の件数（0件のテーブルは含めない）"""
+    counts = {}
+    for table in lifeplan.tenant_tables():
+        if 'user_id' not in table.c:
+            continue
+        count = connection.execute(f'SELECT COUNT(*) FROM {table.name} WHERE user_id = ?', (user_id,)).fetchone()[0]
+        if count:
+            counts[table.name] = count
+    return counts
+
+
+def shared_row_counts(lifeplan, user_id):
+    with lifeplan.app.app_context():
+        connection = lifeplan.db.engine.raw_connection()
+    try:
+        return user_row_counts(connection, lifeplan, user_id)
+    finally:
+        connection.close()
+
+
+def tenant_row_counts(lifeplan, user_id, path=None):
+    connection = sqlite3.connect(path or lifeplan.tenant_database_path(user_id))
+    try:
+        return user_row_counts(connection, lifeplan, user_id)
+    finally:
+        connection.close()
+
+
+def test_registration_creates_file_and_data_is_routed_to_it(app_module, login, seed_user, tenant_mode):
+    client, user_id = login()
+    assert os.path.exists(app_module.tenant_database_path(user_id))
+
+    seed_user(client, user_id)
+
+    counts = tenant_row_counts(app_module, user_id)
+    assert counts['household_entries'] == 3
+    assert counts['accounts'] == 2
+    assert shared_row_counts(app_module, user_id) == {}
+    assert [item['name'] for item in client.get('/api/all-expenses').json['living']] == ['生活費']
+
+
+def test_missing_file_reads_as_empty_until_first_write(app_module, login, tenant_mode):
+    client, user_id = login()
+    path = app_module.tenant_database_path(user_id)
+    app_module.remove_tenant_database(user_id)
+
+    assert client.get('/api/calendar-daily-totals/2025/3').status_code == 200
+    assert client.get('/api/all-expenses').json['living'] == []
+    assert not os.path.exists(path)
+
+    response = client.post('/api/household-entries', json={'entry_type': 'expense', 'amount': 500,
+                                                           'entry_date': '2025-03-01', 'expense_category_id': 1})
+    assert response.status_code in (200, 201), response.json
+    assert tenant_row_counts(app_module, user_id)['household_entries'] == 1
+    assert shared_row_counts(app_module, user_id) == {}
+
+
+def test_export_sqlite_returns_copy_of_tenant_file(app_module, login, seed_user, tenant_mode, tmp_path):
+    client, user_id = login()
+    seed_user(client, user_id)
+
+    response = client.get('/api/export-data?format=sqlite')
+    assert response.status_code == 200
+    exported = tmp_path / 'export.db'
+    exported.write_bytes(response.data)
+    assert tenant_row_counts(app_module, user_id, exported) == tenant_row_counts(app_module, user_id)
+
+    # ファイルのないユーザーには空のテーブルだけを返し、ファイルは作らない
+    app_module.remove_tenant_database(user_id)
+    response = client.get('/api/export-data?format=sqlite')
+    exported.write_bytes(response.data)
+    assert tenant_row_counts(app_module, user_id, exported) == {}
+    assert not os.path.exists(app_module.tenant_database_path(user_id))
+
+
+def test_delete_account_removes_tenant_file(app_module, login, seed_user, tenant_mode):
+    client, user_id = login()
+    seed_user(client, user_id)
+
+    response = client.post('/api/delete-account', json={'password': 'pass'})
+    assert response.json['success'], response.json
+
+    assert not os.path.exists(app_module.tenant_database_path(user_id))
+    with app_module.app.app_context():
+        assert app_module.db.session.get(app_module.User, user_id) is None
+
+
+def test_split_tenants_moves_shared_rows_into_files(app_module, login, seed_user, tenant_mode, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'TENANT_DATABASE_DIR', None)
+    client, user_id = login()
+    seed_user(client, user_id)
+    expenses = client.get('/api/all-expenses').json
+    before = shared_row_counts(app_module, user_id)
+    monkeypatch.setitem(app_module.app.config, 'TENANT_DATABASE_DIR', str(tenant_mode))
+
+    result = app_module.app.test_cli_runner().invoke(args=['split-tenants'])
+    assert result.exit_code == 0, result.output
+
+    assert shared_row_counts(app_module, user_id) == {}
+    assert tenant_row_counts(app_module, user_id) == before
+    assert client.get('/api/all-expenses').json == expenses
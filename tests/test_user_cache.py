@@ -0,0 +1,66 @@
+import pytest
+
+# ログインが必要なGET（ユーザーの読み込みだけを確かめる）
+AUTHENTICATED_PATH = '/api/accounts'
+
+
+def cached(lifeplan, user_id):
+    return user_id in lifeplan._user_cache
+
+
+def authenticated(client):
+    response = client.get(AUTHENTICATED_PATH)
+    response.close()
+    return response.status_code == 200
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('put', '/api/update-profile', {'username': 'renamed_user', 'email': 'renamed@example.com'}),
+    ('put', '/api/change-password', {'current_password': 'pass', 'new_password': 'new-pass'}),
+    ('post', '/api/delete-account', {'password': 'pass'}),
+], ids=['update_profile', 'change_password', 'delete_account'])
+def test_user_changes_invalidate_cache(app_module, login, method, path, body):
+    client, user_id = login()
+    if path == '/api/update-profile':
+        body = dict(body, username=f'renamed_{user_id}')
+    assert authenticated(client)
+    assert cached(app_module, user_id)
+
+    response = getattr(client, method)(path, json=body)
+    assert response.status_code == 200, response.json
+
+    assert not cached(app_module, user_id)
+    if path == '/api/update-profile':
+        assert authenticated(client)
+        assert app_module._user_cache[user_id][1].username == body['username']
+    elif path == '/api/delete-account':
+        assert not authenticated(client)
+
+
+def test_purged_user_is_refused_after_invalidation(app_module, login):
+    client, user_id = login()
+    assert authenticated(client)
+
+    with app_module.app.app_context():
+        app_module.schedule_user_purge(user_id)
+        app_module.db.session.commit()
+    # 無効化までは（TTLの間）キャッシュのユーザーで認証される
+    assert authenticated(client)
+
+    app_module.invalidate_user_cache(user_id)
+    assert not authenticated(client)
+    assert not cached(app_module, user_id)
+
+
+def test_missing_user_is_rejected_without_error(app_module, login, monkeypatch):
+    client, user_id = login()
+    assert authenticated(client)
+    # キャッシュのユーザーの行が消えていても500にしない
+    monkeypatch.setattr(app_module, 'find_user', lambda user_id: None)
+
+    response = client.put('/api/change-password', json={'current_password': 'pass', 'new_password': 'new-pass'})
+    assert response.status_code == 400
+    response = client.put('/api/update-profile', json={'username': f'renamed_{user_id}'})
+    assert response.status_code == 404
+    response = client.post('/api/delete-account', json={'password': 'pass'})
+    assert response.status_code == 401